@@ -0,0 +1,278 @@
+"""
+Admin command line for the user store (user_data.db, see user_store.py).
+
+Usage:
+    python admin_cli.py export [--output users.ndjson] [--active-since 2026-01-01] [--answers]
+    python admin_cli.py migrate user_data.json [--workers 4] [--chunk-size 500]
+    python admin_cli.py prune --inactive-days 365 [--dry-run]
+    python admin_cli.py compact [--vacuum | --vacuum-into backup.db]
+
+Every command can run while the bot is up. The store is in WAL mode, so reads
+never block the bot, and writes are short transactions of at most
+--batch-size users. The bot's write-behind flush waits for one batch at
+most. Answer reference counts are changed by adding deltas, as the bot does
+(answer_store.py), so concurrent changes are not lost.
+
+The running bot keeps every profile in memory, so it only sees migrated users
+and forgets pruned ones after a restart. Run migrate before starting the bot.
+prune leaves a tombstone with the answer hashes of each deleted user and does
+not release those answers itself. A pruned user who writes to the bot before
+the restart is saved again with their whole history, and the bot drops the
+tombstone. The answers of the others are released when the bot next loads
+the store.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from age_tracking import migrate_profile as migrate_age
+from answer_store import AnswerStore, answer_hashes, apply_deltas, histories
+from children import migrate_profile as migrate_children
+from config import USER_DB_PATH
+from user_store import connect
+
+FIRST_USER_ID = -2 ** 63
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def log(message):
+    # stdout may carry the export
+    print(message, file=sys.stderr)
+
+
+def open_store(db_path):
+    """A connection with explicit transactions, so each batch is committed on its own."""
+    connection = connect(db_path)
+    connection.isolation_level = None
+    return connection
+
+
+@contextmanager
+def transaction(connection, mode='IMMEDIATE'):
+    """IMMEDIATE takes the write lock up front, so the transaction cannot fail halfway on a busy store."""
+    connection.execute(f"BEGIN {mode}")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+def iter_profiles(connection, batch_size=500, active_since=None):
+    """(user_id, profile) in user id order; each batch is a separate short read."""
+    last = FIRST_USER_ID
+    while True:
+        query = "SELECT user_id, profile FROM users WHERE user_id > ?"
+        params = [last]
+        if active_since:
+            query += " AND last_activity >= ?"
+            params.append(active_since)
+        rows = connection.execute(query + " ORDER BY user_id LIMIT ?", (*params, batch_size)).fetchall()
+        for user_id, profile in rows:
+            yield user_id, json.loads(profile)
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][0]
+
+
+def export(connection, output, batch_size=500, active_since=None, with_answers=False):
+    """Write one JSON line per user; only one batch of profiles is in memory. Returns the number of users."""
+    answers = AnswerStore(lambda: connection, threading.Lock())
+    exported = 0
+    for user_id, profile in iter_profiles(connection, batch_size, active_since):
+        if with_answers:
+            for history in histories(profile):
+                for item in history:
+                    if 'answer_hash' in item:
+                        item['answer'] = answers.get(item.pop('answer_hash'))
+        output.write(json.dumps({'user_id': user_id, 'profile': profile}, ensure_ascii=False) + "\n")
+        exported += 1
+    return exported
+
+
+def prepare_chunk(chunk):
+    """
+    Runs in a worker: migrate one chunk of legacy profiles as the bot does on load and serialize them.
+    Returns ([(user_id, profile JSON, last_activity, answer hashes)], {hash: compressed text}).
+    """
+    answers = AnswerStore(None, None)
+    rows = []
+    for user_id, profile in chunk:
+        migrate_age(profile)
+        migrate_children(profile)
+        answers.intern_history(profile)
+        rows.append((int(user_id), json.dumps(profile, ensure_ascii=False), profile.get('last_activity'),
+                     answer_hashes(profile)))
+    return rows, {key: body for key, _, body in answers.take_snapshot()}
+
+
+def write_chunk(connection, rows, bodies):
+    """Insert a prepared chunk in one transaction. Users already in the store are kept as they are."""
+    now = time.time()
+    with transaction(connection):
+        ids = [row[0] for row in rows]
+        existing = {user_id for user_id, in connection.execute(
+            f"SELECT user_id FROM users WHERE user_id IN ({placeholders(ids)})", ids)}
+        rows = [row for row in rows if row[0] not in existing]
+        connection.executemany(
+            "INSERT INTO users (user_id, profile, last_activity, updated_at) VALUES (?, ?, ?, ?)",
+            [(user_id, profile, last_activity, now) for user_id, profile, last_activity, _ in rows]
+        )
+        counts = Counter(key for row in rows for key in row[3])
+        apply_deltas(connection, [(key, count, bodies.get(key)) for key, count in counts.items()])
+    return len(rows), len(existing)
+
+
+def migrate(connection, legacy_path, workers=DEFAULT_WORKERS, chunk_size=500):
+    """Import user_data.json in chunks prepared by worker processes. Returns (imported, skipped)."""
+    # The legacy file is a single JSON object, so it is parsed in one go
+    with open(legacy_path, 'r', encoding='utf-8') as f:
+        items = list(json.load(f).items())
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    imported = skipped = 0
+
+    executor = None
+    # A single worker would only add pickling on top of the same work
+    if workers > 1 and len(chunks) > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        prepared = executor.map(prepare_chunk, chunks) if executor else map(prepare_chunk, chunks)
+        # Chunks are written in order while the workers prepare the next ones
+        for rows, bodies in prepared:
+            added, existing = write_chunk(connection, rows, bodies)
+            imported += added
+            skipped += existing
+    finally:
+        if executor:
+            executor.shutdown()
+    return imported, skipped
+
+
+def prune(connection, cutoff, batch_size=500, dry_run=False):
+    """Delete users whose last_activity is before cutoff, leaving tombstones for the bot. Returns the number deleted."""
+    if dry_run:
+        return connection.execute("SELECT COUNT(*) FROM users WHERE last_activity < ?", (cutoff,)).fetchone()[0]
+    deleted = 0
+    while True:
+        # Read and delete in one transaction, so a user who wrote to the bot in between is kept
+        with transaction(connection):
+            rows = connection.execute(
+                "SELECT user_id, profile FROM users WHERE last_activity < ? LIMIT ?", (cutoff, batch_size)
+            ).fetchall()
+            ids = [user_id for user_id, _ in rows]
+            connection.execute(f"DELETE FROM users WHERE user_id IN ({placeholders(ids)})", ids)
+            # The answers stay referenced: the bot may still hold these users in memory and save them again
+            connection.executemany(
+                "INSERT OR REPLACE INTO pruned_users (user_id, hashes) VALUES (?, ?)",
+                [(user_id, json.dumps(answer_hashes(json.loads(profile)))) for user_id, profile in rows]
+            )
+        deleted += len(rows)
+        if len(rows) < batch_size:
+            return deleted
+
+
+def recount_answers(connection, batch_size=500):
+    """
+    Recount answer references from the stored profiles and tombstones and delete unreferenced answers.
+    Counting runs in one read transaction, so it sees profiles and counts of the same moment
+    without blocking the bot. The difference is then added like any other change.
+    Returns (counts corrected, answers deleted).
+    """
+    with transaction(connection, 'DEFERRED'):
+        stored = dict(connection.execute("SELECT hash, refcount FROM answers").fetchall())
+        actual = Counter()
+        for _, profile in iter_profiles(connection, batch_size):
+            actual.update(answer_hashes(profile))
+        for hashes, in connection.execute("SELECT hashes FROM pruned_users"):
+            actual.update(json.loads(hashes))
+    changes = [(key, actual[key] - count, None) for key, count in stored.items() if actual[key] != count]
+    for start in range(0, len(changes), batch_size):
+        with transaction(connection):
+            apply_deltas(connection, changes[start:start + batch_size])
+    return len(changes), sum(1 for key in stored if not actual[key])
+
+
+def compact(connection, vacuum=False, vacuum_into=None):
+    corrected, deleted = recount_answers(connection)
+    log(f"🧹 Answers: {corrected} counts corrected, {deleted} unreferenced deleted")
+    if vacuum_into:
+        # A compacted copy; a read transaction, so the bot keeps writing
+        connection.execute("VACUUM INTO ?", (vacuum_into,))
+        log(f"💾 Compacted copy written to {vacuum_into}")
+    elif vacuum:
+        # Rebuilds the file in place; the bot's flushes wait and retry until it finishes
+        started = time.monotonic()
+        connection.execute("VACUUM")
+        log(f"💾 Vacuumed in {time.monotonic() - started:.1f}s")
+    _, wal_pages, checkpointed = connection.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    log(f"📄 WAL: {checkpointed}/{wal_pages} pages checkpointed")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, migrate, prune and compact the user store")
+    parser.add_argument('--db', default=USER_DB_PATH, help="User store (USER_DB_PATH)")
+    parser.add_argument('--batch-size', type=int, default=500, help="Users per read or write transaction")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="Stream users as NDJSON")
+    export_parser.add_argument('--output', default='-', help="File to write, - for stdout")
+    export_parser.add_argument('--active-since', help="Only users active since this date (YYYY-MM-DD)")
+    export_parser.add_argument('--answers', action='store_true', help="Include answer texts instead of hashes")
+
+    migrate_parser = commands.add_parser('migrate', help="Import a legacy user_data.json")
+    migrate_parser.add_argument('legacy_json')
+    migrate_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Processes preparing chunks, 1 - none")
+    migrate_parser.add_argument('--chunk-size', type=int, default=500)
+
+    prune_parser = commands.add_parser('prune', help="Delete users inactive for a number of days")
+    prune_parser.add_argument('--inactive-days', type=int, required=True)
+    prune_parser.add_argument('--dry-run', action='store_true', help="Only count the users")
+
+    compact_parser = commands.add_parser('compact', help="Recount answers, delete unreferenced ones, checkpoint the WAL")
+    vacuum = compact_parser.add_mutually_exclusive_group()
+    vacuum.add_argument('--vacuum', action='store_true', help="Also rebuild the file in place (pauses bot writes)")
+    vacuum.add_argument('--vacuum-into', help="Also write a compacted copy to this path")
+
+    args = parser.parse_args(argv)
+    connection = open_store(args.db)
+    started = time.monotonic()
+    try:
+        if args.command == 'export':
+            output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+            try:
+                exported = export(connection, output, args.batch_size, args.active_since, args.answers)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+            log(f"✅ Exported {exported} users")
+        elif args.command == 'migrate':
+            imported, skipped = migrate(connection, args.legacy_json, args.workers, args.chunk_size)
+            log(f"✅ Imported {imported} users, {skipped} already in the store were kept")
+        elif args.command == 'prune':
+            cutoff = (datetime.now() - timedelta(days=args.inactive_days)).isoformat()
+            pruned = prune(connection, cutoff, args.batch_size, args.dry_run)
+            log(f"✅ {'Would delete' if args.dry_run else 'Deleted'} {pruned} users inactive since {cutoff[:10]}")
+        else:
+            compact(connection, args.vacuum, args.vacuum_into)
+    finally:
+        connection.close()
+    log(f"⏱️ {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Child age derived from a stored birth month.
+
+Profiles keep ``birth_month`` ("YYYY-MM") instead of a fixed age, so the age
+and age group move forward on their own. Ages are counted from the first day
+of the birth month. The days on which each child enters the next age group are
+precomputed once per profile. AgeIndex keeps them in one sorted list, so
+"children who entered 1-3_years this week" is a bisect range query instead of
+a scan of every profile.
+"""
+
+import bisect
+import re
+from datetime import date, datetime
+
+BIRTH_MONTH_RE = re.compile(r'^\s*(?:(\d{1,2})[./-](\d{4})|(\d{4})-(\d{1,2}))\s*$')
+MAX_AGE_MONTHS = 72
+
+
+def add_months(day, months):
+    """First day of the month `months` after day's month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def parse_birth_month(text, today=None):
+    """'03.2025', '3/2025' or '2025-03' -> '2025-03'; None when invalid or in the future."""
+    match = BIRTH_MONTH_RE.match(text or '')
+    if not match:
+        return None
+    month, year = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+    month, year = int(month), int(year)
+    if not 1 <= month <= 12:
+        return None
+    today = today or date.today()
+    if (year, month) > (today.year, today.month) or age_in_months(f"{year:04d}-{month:02d}", today) > MAX_AGE_MONTHS:
+        return None
+    return f"{year:04d}-{month:02d}"
+
+
+def birth_month_from_age(age_months, today=None):
+    """Birth month of a child who is age_months old today."""
+    birth = add_months(today or date.today(), -age_months)
+    return f"{birth.year:04d}-{birth.month:02d}"
+
+
+def age_in_months(birth_month, today=None):
+    today = today or date.today()
+    year, month = map(int, birth_month.split('-'))
+    return (today.year - year) * 12 + today.month - month
+
+
+def child_age_months(profile, today=None):
+    """Current age in months; profiles without a birth month keep their stored age."""
+    birth_month = profile.get('birth_month')
+    if birth_month:
+        return age_in_months(birth_month, today)
+    return profile.get('child_age_months')
+
+
+def format_age(age_months):
+    """Age for display: "8 мес.", "1 г. 3 мес."."""
+    if age_months is None:
+        return "Не указан"
+    years, months = divmod(age_months, 12)
+    if not years:
+        return f"{months} мес."
+    return f"{years} г. {months} мес." if months else f"{years} г."
+
+
+def migrate_profile(profile):
+    """Derive birth_month from a stored child_age_months and the date it was set. Returns True if changed."""
+    if profile.get('birth_month') or profile.get('child_age_months') is None:
+        return False
+    set_at = profile.get('age_set_date') or profile.get('registration_date')
+    set_day = datetime.fromisoformat(set_at).date() if set_at else date.today()
+    profile['birth_month'] = birth_month_from_age(profile['child_age_months'], set_day)
+    return True
+
+
+def day_of(entry):
+    return entry[0]
+
+
+def bucket_transitions(age_group, max_months=MAX_AGE_MONTHS):
+    """[(age_months, group)] at which age_group() changes, e.g. [(4, '3-12_months'), (13, '1-3_years')]."""
+    transitions = []
+    previous = age_group(0)
+    for months in range(1, max_months + 1):
+        group = age_group(months)
+        if group != previous:
+            transitions.append((months, group))
+            previous = group
+    return transitions
+
+
+class AgeIndex:
+    def __init__(self, age_group, max_months=MAX_AGE_MONTHS):
+        self.age_group = age_group
+        self.transitions = bucket_transitions(age_group, max_months)
+        # Sorted (day, key, group): the day the child under key enters group
+        self.entries = []
+        self.user_entries = {}
+
+    def build(self, records):
+        """Index {key: record with 'birth_month'}; keys are user ids or (user_id, child_id)."""
+        self.entries = []
+        self.user_entries = {}
+        for key, record in records.items():
+            if record.get('birth_month'):
+                entries = self._entries_for(key, record['birth_month'])
+                self.user_entries[key] = entries
+                self.entries.extend(entries)
+        self.entries.sort(key=day_of)
+        return self
+
+    def _entries_for(self, key, birth_month):
+        year, month = map(int, birth_month.split('-'))
+        birth = date(year, month, 1)
+        return [(add_months(birth, months).isoformat(), key, group) for months, group in self.transitions]
+
+    def remove(self, key):
+        for entry in self.user_entries.pop(key, ()):
+            position = bisect.bisect_left(self.entries, entry[0], key=day_of)
+            while position < len(self.entries) and self.entries[position][0] == entry[0]:
+                if self.entries[position] == entry:
+                    del self.entries[position]
+                    break
+                position += 1
+
+    def update(self, key, birth_month):
+        """Re-index a child after their birth month was set or changed."""
+        self.remove(key)
+        entries = self._entries_for(key, birth_month)
+        self.user_entries[key] = entries
+        for entry in entries:
+            bisect.insort(self.entries, entry, key=day_of)
+
+    def crossed(self, start, end, group=None):
+        """[(day, key, group)] for children who entered a group on a day in (start, end]."""
+        low = bisect.bisect_right(self.entries, start.isoformat(), key=day_of)
+        high = bisect.bisect_right(self.entries, end.isoformat(), key=day_of)
+        return [entry for entry in self.entries[low:high] if group is None or entry[2] == group]
+
+    def current_group(self, profile, today=None):
+        return self.age_group(child_age_months(profile, today))
@@ -2,13 +2,38 @@
 AI service for generating professional parenting advice based on knowledge base.
 """
 
-from config import OPENAI_API_KEY
+from config import KB_RESPONSE_CACHE_SIZE
+from generation_profiles import PROFILES, apply_length_policy, keyword_confidence, profile_stats, select_profile
+from openai_client import get_openai_client
 from petranovskaya_knowledge_base import get_petranovskaya_advice, format_petranovskaya_response, get_all_petranovskaya_topics
+from functools import lru_cache
 import json
+import time
+
+# Map keywords to Петрановская's topics
+TOPIC_KEYWORDS = {
+    "crying_and_comfort": ["плач", "плачет", "кричит", "cry", "crying", "fuss", "fussy", "upset", "scream", "screaming"],
+    "sleep_issues": ["сон", "спит", "sleep", "спать", "засыпать", "просыпается"],
+    "discipline_and_boundaries": ["воспитание", "наказание", "границы", "discipline", "punishment", "boundaries", "истерика", "tantrum"],
+    "development_milestones": ["развитие", "развивается", "development", "milestone", "навыки", "skills"],
+    "reading_interest": ["чтение", "читать", "книги", "reading", "books", "литература", "интерес к чтению"],
+    "kindergarten_adaptation": ["садик", "сад", "детский сад", "kindergarten", "адаптация", "не хочет в садик"],
+    "parenting_philosophy": ["воспитание", "родительство", "parenting", "привязанность", "attachment"],
+    "attachment_theory": ["привязанность", "attachment", "любовь", "love", "близость", "closeness"]
+}
+
+# Answers here follow the prompt's own structure, so profiles only pick the model and budget
+MAX_TOKENS_CAP = 500
 
 class ParentAIService:
     def __init__(self):
         self.knowledge_base_topics = get_all_petranovskaya_topics()
+        # Knowledge-base answers depend only on (topic, age_group), so they are cached
+        self._format_response = lru_cache(maxsize=KB_RESPONSE_CACHE_SIZE)(format_petranovskaya_response)
+    
+    def warm_up(self):
+        """Create the shared OpenAI client before the first question arrives."""
+        get_openai_client()
     
     def determine_age_group(self, child_age_months):
         """Determine age group based on child's age in months."""
@@ -23,25 +48,16 @@ class ParentAIService:
     
     def extract_topic_from_question(self, question):
         """Extract the main topic from user's question."""
+        return self.classify_question(question)[0]
+    
+    def classify_question(self, question):
+        """Return (topic, confidence): the first matching topic and its share of all keyword hits."""
         question_lower = question.lower()
-        
-        # Map keywords to Петрановская's topics
-        topic_keywords = {
-            "crying_and_comfort": ["плач", "плачет", "кричит", "cry", "crying", "fuss", "fussy", "upset", "scream", "screaming"],
-            "sleep_issues": ["сон", "спит", "sleep", "спать", "засыпать", "просыпается"],
-            "discipline_and_boundaries": ["воспитание", "наказание", "границы", "discipline", "punishment", "boundaries", "истерика", "tantrum"],
-            "development_milestones": ["развитие", "развивается", "development", "milestone", "навыки", "skills"],
-            "reading_interest": ["чтение", "читать", "книги", "reading", "books", "литература", "интерес к чтению"],
-            "kindergarten_adaptation": ["садик", "сад", "детский сад", "kindergarten", "адаптация", "не хочет в садик"],
-            "parenting_philosophy": ["воспитание", "родительство", "parenting", "привязанность", "attachment"],
-            "attachment_theory": ["привязанность", "attachment", "любовь", "love", "близость", "closeness"]
-        }
-        
-        for topic, keywords in topic_keywords.items():
+        for topic, keywords in TOPIC_KEYWORDS.items():
             if any(keyword in question_lower for keyword in keywords):
-                return topic
+                return topic, keyword_confidence(question_lower, TOPIC_KEYWORDS, topic)
         
-        return "parenting_philosophy"  # Default to general parenting philosophy
+        return "parenting_philosophy", 0.0  # Default to general parenting philosophy
     
     def generate_response(self, question, child_age_months=None, user_context=""):
         """Generate AI response based on Петрановская's book only."""
@@ -50,7 +66,7 @@ class ParentAIService:
             age_group = self.determine_age_group(child_age_months) if child_age_months else "1-3_years"
             
             # Extract topic
-            topic = self.extract_topic_from_question(question)
+            topic, confidence = self.classify_question(question)
             
             # Get Петрановская's advice
             petranovskaya_advice = get_petranovskaya_advice(topic, age_group)
@@ -61,13 +77,14 @@ class ParentAIService:
             
             if petranovskaya_advice:
                 # Use Петрановская's knowledge directly
-                return format_petranovskaya_response(topic, age_group)
+                return self._format_response(topic, age_group)
             else:
                 # Create context for AI based on Петрановская's principles
                 context = self._create_petranovskaya_context(question, age_group, topic, user_context)
                 
                 # Generate response using OpenAI with Петрановская's context
-                response = self._call_openai(context, question)
+                profile = select_profile(question, topic, confidence)
+                response = self._call_openai(context, question, profile)
                 
                 return response
             
@@ -201,23 +218,25 @@ USER QUESTION: {question}
 """
         return context
     
-    def _call_openai(self, context, question):
+    def _call_openai(self, context, question, profile=None):
         """Call OpenAI API to generate response."""
+        profile = profile or PROFILES["standard"]
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
+            started = time.perf_counter()
+            response = get_openai_client().chat.completions.create(
+                model=profile.model,
                 messages=[
                     {"role": "system", "content": context},
                     {"role": "user", "content": question}
                 ],
-                max_tokens=500,
-                temperature=0.7
+                max_tokens=min(profile.max_tokens, MAX_TOKENS_CAP),
+                temperature=profile.temperature
             )
             
-            return response.choices[0].message.content.strip()
+            choice = response.choices[0]
+            profile_stats.record(profile, (time.perf_counter() - started) * 1000,
+                                 getattr(response, 'usage', None), choice.finish_reason)
+            return apply_length_policy(choice.message.content, choice.finish_reason)
             
         except Exception as e:
             return f"I apologize, but I'm having trouble accessing my AI capabilities right now. Please try again later. Error: {str(e)}"
@@ -0,0 +1,217 @@
+"""
+Usage analytics aggregated as messages arrive.
+
+Each question increments a per-user topic counter and a few daily rollup
+counters (questions, topics, age buckets, active users). Counters live in
+memory, so /stats and the admin report read them directly instead of scanning
+conversation histories. Increments are written to SQLite in batches by the
+same write-behind loop as user profiles.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from lifecycle import write_behind
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_topics (
+    user_id INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, topic)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    day TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (day, metric, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_users (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+"""
+
+# Upper bound in months (exclusive) and label
+AGE_BUCKETS = ((3, '0-3m'), (6, '3-6m'), (12, '6-12m'), (24, '1-2y'), (36, '2-3y'))
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def age_bucket(child_age_months):
+    if child_age_months is None:
+        return 'unknown'
+    for upper, label in AGE_BUCKETS:
+        if child_age_months < upper:
+            return label
+    return '3y+'
+
+
+class AnalyticsStore:
+    def __init__(self, db_path='analytics.db', history_days=30):
+        self.db_path = db_path
+        self.history_days = history_days
+        self.user_topics = {}
+        self.rollup = Counter()
+        self.active_users = {}
+        self.pending_topics = Counter()
+        self.pending_rollup = Counter()
+        self.pending_users = set()
+        self._connection = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = connect(self.db_path)
+        return self._connection
+
+    def load(self, today=None):
+        """Load topic counters, the last history_days of rollups and today's active users."""
+        today = today or date.today()
+        self.user_topics.clear()
+        for user_id, topic, count in self.connection.execute("SELECT user_id, topic, count FROM user_topics"):
+            self.user_topics.setdefault(user_id, Counter())[topic] = count
+
+        since = (today - timedelta(days=self.history_days)).isoformat()
+        self.rollup = Counter({
+            (day, metric, key): value
+            for day, metric, key, value in self.connection.execute(
+                "SELECT day, metric, key, value FROM daily_rollup WHERE day >= ?", (since,)
+            )
+        })
+        self.active_users = {today.isoformat(): {
+            user_id for (user_id,) in self.connection.execute(
+                "SELECT user_id FROM daily_users WHERE day = ?", (today.isoformat(),)
+            )
+        }}
+        logger.info(f"Loaded analytics for {len(self.user_topics)} users")
+
+    def _bump(self, day, metric, key):
+        self.rollup[(day, metric, key)] += 1
+        self.pending_rollup[(day, metric, key)] += 1
+
+    def record_question(self, user_id, topic, child_age_months=None, when=None):
+        """Count one answered question; called on the event loop for every message."""
+        day = (when or datetime.now()).date().isoformat()
+        self.user_topics.setdefault(user_id, Counter())[topic] += 1
+        self.pending_topics[(user_id, topic)] += 1
+        self._bump(day, 'questions', 'all')
+        self._bump(day, 'topic', topic)
+        self._bump(day, 'age_bucket', age_bucket(child_age_months))
+
+        active = self.active_users.get(day)
+        if active is None:
+            # A new day started: earlier days are already counted in the rollup
+            active = set()
+            self.active_users = {day: active}
+        if user_id not in active:
+            active.add(user_id)
+            self.pending_users.add((day, user_id))
+            self._bump(day, 'active_users', 'all')
+
+    def top_topics(self, user_id, n=3):
+        """[(topic, count)] most asked about by the user."""
+        counts = self.user_topics.get(user_id)
+        return counts.most_common(n) if counts else []
+
+    def report(self, days=7, today=None):
+        """Fleet-wide usage for the last `days` days, from the in-memory rollup."""
+        today = today or date.today()
+        day_keys = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+        per_day = [
+            {'day': day, 'questions': self.rollup[(day, 'questions', 'all')],
+             'active_users': self.rollup[(day, 'active_users', 'all')]}
+            for day in day_keys
+        ]
+        wanted = set(day_keys)
+        topics, ages = Counter(), Counter()
+        for (day, metric, key), value in self.rollup.items():
+            if day not in wanted:
+                continue
+            if metric == 'topic':
+                topics[key] += value
+            elif metric == 'age_bucket':
+                ages[key] += value
+        return {
+            'days': per_day,
+            'questions': sum(item['questions'] for item in per_day),
+            'topics': topics.most_common(),
+            'age_buckets': ages.most_common(),
+            'users_with_questions': len(self.user_topics)
+        }
+
+    def _take_snapshot(self):
+        snapshot = (self.pending_topics, self.pending_rollup, self.pending_users)
+        self.pending_topics, self.pending_rollup, self.pending_users = Counter(), Counter(), set()
+        return snapshot
+
+    def _restore(self, snapshot):
+        topics, rollup, users = snapshot
+        self.pending_topics.update(topics)
+        self.pending_rollup.update(rollup)
+        self.pending_users |= users
+
+    def _write(self, snapshot):
+        topics, rollup, users = snapshot
+        with self._write_lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO user_topics (user_id, topic, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, topic) DO UPDATE SET count = count + excluded.count",
+                [(user_id, topic, count) for (user_id, topic), count in topics.items()]
+            )
+            self.connection.executemany(
+                "INSERT INTO daily_rollup (day, metric, key, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(day, metric, key) DO UPDATE SET value = value + excluded.value",
+                [(day, metric, key, value) for (day, metric, key), value in rollup.items()]
+            )
+            self.connection.executemany("INSERT OR IGNORE INTO daily_users (day, user_id) VALUES (?, ?)", users)
+
+    def flush(self):
+        """Write pending increments in one transaction. Returns the number of counters written."""
+        if not self.pending_rollup:
+            return 0
+        snapshot = self._take_snapshot()
+        try:
+            self._write(snapshot)
+        except Exception as e:
+            self._restore(snapshot)
+            logger.error(f"Error saving analytics: {e}")
+            return 0
+        return len(snapshot[1])
+
+    async def flush_async(self):
+        """Like flush(), but does the disk write in a worker thread."""
+        if not self.pending_rollup:
+            return 0
+        snapshot = self._take_snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+        except Exception as e:
+            self._restore(snapshot)
+            logger.error(f"Error saving analytics: {e}")
+            return 0
+        return len(snapshot[1])
+
+    async def run_write_behind(self, interval):
+        """Flush pending counters every `interval` seconds until cancelled."""
+        await write_behind(self.flush_async, interval, "analytics counters")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,168 @@
+"""
+Content-addressed store for answers kept in conversation histories.
+
+Many users get identical answers (knowledge-base replies, reused LLM
+answers), and every history item used to carry its own copy. History items
+now keep only ``answer_hash``. Each distinct text is stored once, zlib
+compressed, in the ``answers`` table next to the profiles, with a count of
+the history items that reference it. Texts are resolved lazily, for /history
+and the conversation memory, through a small LRU cache.
+
+Reference counts are kept in memory. UserStore writes the changes to them,
+together with the texts, in the same transaction as the profiles that
+reference them, so a saved profile never points at a missing answer.
+Changes are added to the stored counts rather than overwriting them, so
+admin_cli.py can migrate and prune users while the bot runs. A text is
+deleted once its count drops to zero.
+"""
+
+import hashlib
+import zlib
+
+from retrieval_cache import LRUCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    hash TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    refcount INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def answer_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def histories(profile):
+    """All conversation histories of a profile: one per child, plus the top-level one of older profiles."""
+    return [child.get('conversation_history', []) for child in profile.get('children', [])] + \
+        [profile.get('conversation_history', [])]
+
+
+def answer_hashes(profile):
+    return [item['answer_hash'] for history in histories(profile) for item in history if 'answer_hash' in item]
+
+
+def apply_deltas(connection, changes):
+    """
+    Add reference count changes [(hash, delta, compressed text or None)] inside the caller's transaction.
+    Texts with a positive delta are inserted if missing; answers whose count drops to zero are deleted.
+    """
+    connection.executemany(
+        "INSERT INTO answers (hash, body, refcount, size) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(hash) DO UPDATE SET refcount = refcount + excluded.refcount",
+        [(key, body, delta, len(body)) for key, delta, body in changes if delta > 0 and body is not None]
+    )
+    connection.executemany(
+        "UPDATE answers SET refcount = refcount + ? WHERE hash = ?",
+        [(delta, key) for key, delta, body in changes if delta < 0 or (delta > 0 and body is None)]
+    )
+    connection.executemany(
+        "DELETE FROM answers WHERE hash = ? AND refcount <= 0",
+        [(key,) for key, delta, _ in changes if delta < 0]
+    )
+
+
+class AnswerStore:
+    def __init__(self, connection, lock, cache_size=512):
+        """connection: callable returning the shared SQLite connection; lock: its write lock."""
+        self._connection = connection
+        self._lock = lock
+        self.refcounts = {}
+        self.deltas = {}  # hash -> change of the count not written yet
+        self._new = {}  # hash -> compressed text referenced since the last write
+        self.cache = LRUCache(cache_size)
+
+    def load(self):
+        """Load the reference counts of all stored answers."""
+        with self._lock:
+            self.refcounts = dict(self._connection().execute("SELECT hash, refcount FROM answers").fetchall())
+        return self
+
+    def put(self, text):
+        """Reference an answer from a history item; returns its hash."""
+        key = answer_hash(text)
+        if key not in self._new:
+            # Written with the count, so the text is stored again if it was deleted in the meantime
+            self._new[key] = zlib.compress(text.encode('utf-8'))
+            self.cache.put(key, text)
+        self._change(key, 1)
+        return key
+
+    def release(self, key):
+        """Drop one reference, e.g. when a history item is removed."""
+        if self.refcounts.get(key, 0) > 0:
+            self._change(key, -1)
+
+    def _change(self, key, delta):
+        self.refcounts[key] = self.refcounts.get(key, 0) + delta
+        self.deltas[key] = self.deltas.get(key, 0) + delta
+
+    def release_history(self, history):
+        for item in history:
+            if 'answer_hash' in item:
+                self.release(item['answer_hash'])
+
+    def get(self, key):
+        """The answer text, or '' if it is not stored."""
+        text = self.cache.get(key)
+        if text is not None:
+            return text
+        body = self._new.get(key)
+        if body is None:
+            with self._lock:
+                row = self._connection().execute("SELECT body FROM answers WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                return ''
+            body = row[0]
+        text = zlib.decompress(body).decode('utf-8')
+        self.cache.put(key, text)
+        return text
+
+    def text(self, item):
+        """Answer of a history item; older items still carry the text itself."""
+        if 'answer' in item:
+            return item['answer']
+        return self.get(item['answer_hash']) if 'answer_hash' in item else ''
+
+    def intern_history(self, profile):
+        """Replace answer texts in the profile's histories with hashes. Returns True if changed."""
+        changed = False
+        for history in histories(profile):
+            for item in history:
+                if 'answer' in item:
+                    item['answer_hash'] = self.put(item.pop('answer') or '')
+                    changed = True
+        return changed
+
+    def take_snapshot(self):
+        """Changes to write, for apply_deltas; must run on the thread that mutates histories."""
+        deltas, self.deltas = self.deltas, {}
+        return [(key, delta, self._new.get(key)) for key, delta in deltas.items()]
+
+    def committed(self, snapshot):
+        """After a successful write: drop written texts from memory and forget deleted answers."""
+        for key, _, body in snapshot:
+            if key in self.deltas:
+                continue  # referenced or released again since the snapshot
+            if body is not None and self._new.get(key) is body:
+                del self._new[key]
+            if not self.refcounts.get(key):
+                self.refcounts.pop(key, None)
+
+    def restore(self, snapshot):
+        """Add back the changes of a snapshot whose write failed, so the next flush retries them."""
+        for key, delta, _ in snapshot:
+            self.deltas[key] = self.deltas.get(key, 0) + delta
+
+    @staticmethod
+    def write(connection, snapshot):
+        """Apply a snapshot inside the caller's transaction."""
+        apply_deltas(connection, snapshot)
+
+    def stats(self):
+        with self._lock:
+            count, stored = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM answers").fetchone()
+        return {'answers': count, 'references': sum(self.refcounts.values()), 'stored_bytes': stored}
@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for ParentAI Bot (no real Telegram or OpenAI access required)
+"""
@@ -0,0 +1,123 @@
+"""
+Recall and latency of the ANN index against exact search.
+
+Builds a synthetic clustered library (topics with noisy paragraphs, like
+several books split into chunks), then compares IVF (and HNSW when hnswlib
+is installed) with brute-force NumPy search: recall@k, per-question latency
+and build time for each n_probe setting.
+
+Usage:
+    python -m benchmarks.ann_recall                              # 100k chunks, 256 dims
+    python -m benchmarks.ann_recall --chunks 20000 --dims 1536 --n-probe 8 16 0 --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+
+def synthetic_library(chunks, dims, topics, queries, seed, spread=1.0):
+    """Chunks scattered around topic centers; questions are noisy copies of random chunks."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dims)).astype(np.float32)
+    labels = rng.integers(0, topics, size=chunks)
+    matrix = centers[labels] + spread * rng.standard_normal((chunks, dims)).astype(np.float32)
+    picked = rng.choice(chunks, size=queries, replace=False)
+    questions = matrix[picked] + 0.5 * rng.standard_normal((queries, dims)).astype(np.float32)
+    return matrix, questions
+
+
+def timed_search(search, queries, k):
+    """Search one question at a time, as the bot does, and return hits plus per-query ms."""
+    hits, timings = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits.append(search(query[None, :], k)[0])
+        timings.append((time.perf_counter() - started) * 1000)
+    return hits, timings
+
+
+def summarize(name, hits, timings, exact_hits, build_seconds=None, **params):
+    recall = statistics.fmean(
+        len({i for _, i in found} & {i for _, i in truth}) / len(truth) for found, truth in zip(hits, exact_hits)
+    )
+    timings = sorted(timings)
+    return {
+        'index': name,
+        **params,
+        'recall_at_k': round(recall, 4),
+        'latency_p50_ms': round(timings[len(timings) // 2], 3),
+        'latency_p95_ms': round(timings[int(len(timings) * 0.95)], 3),
+        'build_seconds': round(build_seconds, 2) if build_seconds is not None else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall/latency of ANN retrieval versus exact search")
+    parser.add_argument('--chunks', type=int, default=100000)
+    parser.add_argument('--dims', type=int, default=256, help="1536 matches text-embedding-ada-002")
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--spread', type=float, default=1.5, help="Chunk noise around topic centers; higher is harder")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--n-lists', type=int, default=0)
+    parser.add_argument('--n-probe', type=int, nargs='+', default=[8, 32, 0], help="0 is the bot's default (ANN_N_PROBE)")
+    parser.add_argument('--m', type=int, default=16, help="HNSW links per node (ANN_HNSW_M)")
+    parser.add_argument('--ef-search', type=int, default=64, help="HNSW candidate list (ANN_HNSW_EF_SEARCH)")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    from ann_index import HNSWIndex, IVFIndex
+    from book_rag_system import BookRAGSystem
+
+    print(f"📚 Building synthetic library: {args.chunks} chunks x {args.dims} dims...")
+    matrix, questions = synthetic_library(args.chunks, args.dims, args.topics, args.queries, args.seed, args.spread)
+    rag_system = BookRAGSystem([''] * args.chunks, matrix, min_score=-1.0)
+    questions = questions / np.linalg.norm(questions, axis=1, keepdims=True)
+
+    exact_hits, exact_timings = timed_search(rag_system.top_k, questions, args.k)
+    report = [summarize('exact', exact_hits, exact_timings, exact_hits)]
+
+    started = time.perf_counter()
+    ivf = IVFIndex(n_lists=args.n_lists).build(rag_system.matrix)
+    build_seconds = time.perf_counter() - started
+    for n_probe in args.n_probe:
+        ivf.n_probe = n_probe
+        hits, timings = timed_search(ivf.search, questions, args.k)
+        report.append(summarize('ivf', hits, timings, exact_hits, build_seconds,
+                                n_lists=len(ivf.centroids), n_probe=ivf.probes()))
+
+    try:
+        started = time.perf_counter()
+        hnsw = HNSWIndex(m=args.m, ef_search=args.ef_search).build(rag_system.matrix)
+        hits, timings = timed_search(hnsw.search, questions, args.k)
+        report.append(summarize('hnsw', hits, timings, exact_hits, time.perf_counter() - started,
+                                m=hnsw.m, ef_search=hnsw.ef_search))
+    except RuntimeError as e:
+        print(f"⚠️  Skipping HNSW: {e}")
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    for row in report:
+        params = ", ".join(f"{key}={row[key]}" for key in ('n_lists', 'n_probe', 'm', 'ef_search') if key in row)
+        build = f", build {row['build_seconds']} s" if row['build_seconds'] is not None else ""
+        print(f"  {row['index']:<6} recall@{args.k} {row['recall_at_k']:.3f}  "
+              f"p50 {row['latency_p50_ms']:.3f} ms  p95 {row['latency_p95_ms']:.3f} ms{build}  {params}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
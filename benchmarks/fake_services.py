@@ -0,0 +1,283 @@
+"""
+Local fake Telegram Bot API and OpenAI servers for offline benchmarks.
+
+Both fakes run on a private event loop in a background thread, because the
+bot calls OpenAI synchronously from inside its own event loop.
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import math
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from aiohttp import web
+
+EMBEDDING_DIM = 256
+
+
+def approx_tokens(text):
+    """Rough token estimate (about 4 characters per token)."""
+    return max(1, len(text) // 4)
+
+
+class FakeService(abc.ABC):
+    """Base class with configurable latency and error injection."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=42):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.url = None
+
+    async def _delay(self):
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _should_fail(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    @abc.abstractmethod
+    def build_app(self):
+        """The aiohttp application serving this fake."""
+
+
+class FakeTelegramAPI(FakeService):
+    """Answers Bot API methods the way api.telegram.org does, without sending anything."""
+
+    BOT_USER = {
+        'id': 100000001,
+        'is_bot': True,
+        'first_name': 'ParentAI',
+        'username': 'parentai_fake_bot',
+        'can_join_groups': False,
+        'can_read_all_group_messages': False,
+        'supports_inline_queries': True
+    }
+
+    # Never fail these, so error injection only affects the replayed traffic
+    SETUP_METHODS = ('getMe', 'deleteWebhook', 'setMyCommands')
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent_messages = []
+        self._message_id = 0
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        app.router.add_get('/bot{token}/{method}', self.handle)
+        return app
+
+    async def _read_params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str):
+                try:
+                    params[key] = json.loads(value)
+                except ValueError:
+                    params[key] = value
+        return params
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self._read_params(request)
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            # Emulate an idle long-poll so a polling updater does not spin
+            await asyncio.sleep(min(float(params.get('timeout', 0) or 0), 1.0))
+            return web.json_response({'ok': True, 'result': []})
+
+        await self._delay()
+
+        if method not in self.SETUP_METHODS and self._should_fail():
+            self.errors[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': 'Too Many Requests: retry after 1',
+                'parameters': {'retry_after': 1}
+            }, status=429)
+
+        return web.json_response({'ok': True, 'result': self._result_for(method, params)})
+
+    def _result_for(self, method, params):
+        if method == 'getMe':
+            return self.BOT_USER
+        if method in ('sendMessage', 'editMessageText', 'sendVoice'):
+            if 'inline_message_id' in params:
+                return True
+            self._message_id += 1
+            message = {
+                'message_id': params.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+                'from': self.BOT_USER,
+                'text': str(params.get('text', ''))
+            }
+            self.sent_messages.append(message)
+            return message
+        if method == 'getFile':
+            return {
+                'file_id': params.get('file_id', ''),
+                'file_unique_id': params.get('file_id', ''),
+                'file_size': 0,
+                'file_path': f"voice/{params.get('file_id', 'file')}.ogg"
+            }
+        return True
+
+
+class FakeOpenAI(FakeService):
+    """Minimal OpenAI-compatible server for chat completions and embeddings."""
+
+    def __init__(self, completion_words=350, **kwargs):
+        super().__init__(**kwargs)
+        self.completion_words = completion_words
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/embeddings', self.embeddings)
+        return app
+
+    async def _fail(self, endpoint):
+        self.errors[endpoint] += 1
+        status = self.random.choice([429, 500, 503])
+        return web.json_response({
+            'error': {'message': 'Injected failure', 'type': 'server_error', 'code': status}
+        }, status=status)
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        self.calls['chat.completions'] += 1
+        await self._delay()
+        if self._should_fail():
+            return await self._fail('chat.completions')
+
+        messages = body.get('messages', [])
+        content, finish_reason = self.compose_answer(messages, body.get('max_tokens') or 1000)
+        prompt_tokens = sum(approx_tokens(m.get('content', '')) for m in messages)
+        completion_tokens = approx_tokens(content)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+        return web.json_response({
+            'id': f"chatcmpl-fake-{self.calls['chat.completions']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-3.5-turbo'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': finish_reason
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+
+    def compose_answer(self, messages, max_tokens):
+        """Builds a deterministic answer that quotes the retrieved book fragments; cut at max_tokens like the real API."""
+        system = next((m['content'] for m in messages if m.get('role') == 'system'), '')
+        question = next((m['content'] for m in reversed(messages) if m.get('role') == 'user'), '')
+
+        quoted = []
+        for block in system.split('[Фрагмент ')[1:]:
+            lines = block.split('\n', 1)
+            if len(lines) > 1:
+                quoted.append(lines[1].strip().split('\n')[0])
+
+        words = [f"Понимаю ваш вопрос: {question}."]
+        words.extend(quoted)
+        filler = "Будьте рядом с ребенком, сохраняйте спокойствие и поддерживайте привязанность."
+        text = " ".join(words)
+        while len(text.split()) < self.completion_words:
+            text += " " + filler
+        text = " ".join(text.split()[:self.completion_words])
+        if approx_tokens(text) > max_tokens:
+            return text[:max_tokens * 4], 'length'
+        return text, 'stop'
+
+    async def embeddings(self, request):
+        body = await request.json()
+        self.calls['embeddings'] += 1
+        await self._delay()
+        if self._should_fail():
+            return await self._fail('embeddings')
+
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        tokens = sum(approx_tokens(text) for text in inputs)
+        return web.json_response({
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': hashed_embedding(text)}
+                for i, text in enumerate(inputs)
+            ],
+            'model': body.get('model', 'text-embedding-ada-002'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+
+def hashed_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic bag-of-trigrams embedding so similar texts get similar vectors."""
+    vector = [0.0] * dim
+    normalized = " ".join(text.lower().split())
+    for i in range(len(normalized) - 2):
+        digest = hashlib.md5(normalized[i:i + 3].encode('utf-8')).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class BackgroundServer:
+    """Runs fake services on their own event loop in a daemon thread."""
+
+    def __init__(self, *services, host='127.0.0.1'):
+        self.services = services
+        self.host = host
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._runners = []
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    async def _start(self):
+        for service in self.services:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.host, 0))
+            runner = web.AppRunner(service.build_app(), access_log=None)
+            await runner.setup()
+            await web.SockSite(runner, sock).start()
+            self._runners.append(runner)
+            service.url = f"http://{self.host}:{sock.getsockname()[1]}"
+
+    def stop(self):
+        async def _stop():
+            for runner in self._runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(_stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
@@ -0,0 +1,392 @@
+"""
+Offline load test for the enhanced bot handlers.
+
+Replays synthetic (benchmarks/conversations.json) or recorded (user_data.json)
+parent conversations through EnhancedParentAIBot against local fake Telegram
+and OpenAI servers, then compares the results with a stored baseline.
+Timings are only compared with a baseline recorded on the same host (CPU,
+core count and Python version); elsewhere only the host-independent metrics
+are checked.
+
+Usage:
+    python -m benchmarks.load_test --users 50 --concurrency 10
+    python -m benchmarks.load_test --update-baseline
+    python -m benchmarks.load_test --from-user-data user_data.json --llm-error-rate 0.05
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_services import BackgroundServer, FakeOpenAI, FakeTelegramAPI
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_CONVERSATIONS = os.path.join(BENCHMARKS_DIR, 'conversations.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline_load.json')
+
+# metric name -> (direction, absolute slack); "higher" means higher values are worse
+REGRESSION_RULES = {
+    'latency_p50_ms': ('higher', 5.0),
+    'latency_p95_ms': ('higher', 10.0),
+    'latency_p99_ms': ('higher', 20.0),
+    'messages_per_sec': ('lower', 0.0),
+    'cpu_ms_per_message': ('higher', 1.0),
+    'memory_growth_mb': ('higher', 5.0),
+    'handler_errors': ('higher', 0.0)
+}
+# Depend on the machine, so only compared with a baseline from the same host
+HOST_BOUND_METRICS = {'latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms', 'messages_per_sec', 'cpu_ms_per_message'}
+
+
+def load_conversations(path):
+    """Load synthetic conversations from the benchmark corpus."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def conversations_from_user_data(path, max_messages=20):
+    """Turn recorded user_data.json histories into replayable conversations."""
+    with open(path, 'r', encoding='utf-8') as f:
+        users = json.load(f)
+
+    conversations = []
+    for user_id, info in users.items():
+        history = info.get('conversation_history') or [
+            item for child in info.get('children', []) for item in child.get('conversation_history', [])
+        ]
+        questions = [item['question'] for item in history][-max_messages:]
+        if not questions:
+            continue
+        messages = ["/start"]
+        if info.get('child_age_months') in (1, 4, 8, 15, 30):
+            messages.append({'callback': f"age_{info['child_age_months']}"})
+        messages.extend(questions)
+        conversations.append({'name': f"recorded_{user_id}", 'first_name': info.get('name', 'User'), 'messages': messages})
+    return conversations
+
+
+def build_book_text():
+    """Synthetic book text assembled from the Петрановская knowledge base."""
+    from petranovskaya_knowledge_base import PETRANOVSKAYA_KNOWLEDGE
+
+    paragraphs = []
+    for topic in PETRANOVSKAYA_KNOWLEDGE.values():
+        for value in topic.values():
+            items = value if isinstance(value, list) else [value]
+            paragraphs.append(" ".join(items))
+    return "\n\n".join(paragraphs)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ConversationReplayer:
+    """Builds Telegram updates for scripted conversations and feeds them to the application."""
+
+    def __init__(self, application):
+        self.application = application
+        self.update_id = 0
+        self.latencies = []
+        self.latencies_by_kind = {}
+
+    def _next_update_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def _message_payload(self, user, text):
+        payload = {
+            'message_id': self._next_update_id(),
+            'date': int(time.time()),
+            'chat': {'id': user['id'], 'type': 'private', 'first_name': user['first_name']},
+            'from': user,
+            'text': text
+        }
+        if text.startswith('/'):
+            payload['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return payload
+
+    def build_update(self, user, message):
+        from telegram import Update
+
+        if isinstance(message, dict) and 'callback' in message:
+            data = {
+                'update_id': self._next_update_id(),
+                'callback_query': {
+                    'id': str(self.update_id),
+                    'from': user,
+                    'chat_instance': str(user['id']),
+                    'data': message['callback'],
+                    'message': self._message_payload(user, 'menu')
+                }
+            }
+            kind = 'callback'
+        else:
+            data = {'update_id': self._next_update_id(), 'message': self._message_payload(user, message)}
+            kind = 'command' if message.startswith('/') else 'text'
+
+        return kind, Update.de_json(data, self.application.bot)
+
+    async def replay(self, user, messages):
+        for message in messages:
+            kind, update = self.build_update(user, message)
+            started = time.perf_counter()
+            await self.application.process_update(update)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.latencies.append(elapsed_ms)
+            self.latencies_by_kind.setdefault(kind, []).append(elapsed_ms)
+
+
+async def run_scenario(args, conversations, telegram_fake, openai_fake):
+    """Replay all sessions at the requested concurrency and collect metrics."""
+    from enhanced_telegram_bot import EnhancedParentAIBot
+
+    bot = EnhancedParentAIBot()
+    application = bot.application
+    handler_errors = []
+
+    async def count_errors(update, context):
+        handler_errors.append(repr(context.error))
+
+    application.add_error_handler(count_errors)
+    await application.initialize()
+
+    replayer = ConversationReplayer(application)
+    sessions = []
+    for i in range(args.users):
+        conversation = conversations[i % len(conversations)]
+        user = {'id': 500000 + i, 'is_bot': False, 'first_name': conversation.get('first_name', 'User')}
+        sessions.append((user, conversation['messages']))
+
+    # Warm up code paths and lazy imports outside of the measured window
+    warmup_user = {'id': 499999, 'is_bot': False, 'first_name': 'Warmup'}
+    await replayer.replay(warmup_user, conversations[0]['messages'])
+    replayer.latencies.clear()
+    replayer.latencies_by_kind.clear()
+    handler_errors.clear()
+    telegram_fake.calls.clear()
+    openai_fake.calls.clear()
+    openai_fake.errors.clear()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_session(user, messages):
+        async with semaphore:
+            await replayer.replay(user, messages)
+
+    rss_before = current_rss_mb()
+    cpu_before = time.thread_time()
+    process_cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    await asyncio.gather(*(run_session(user, messages) for user, messages in sessions))
+
+    wall = time.perf_counter() - started
+    cpu = time.thread_time() - cpu_before
+    process_cpu = time.process_time() - process_cpu_before
+    rss_after = current_rss_mb()
+
+    await application.shutdown()
+
+    latencies = sorted(replayer.latencies)
+    count = len(latencies)
+    completions = openai_fake.calls.get('chat.completions', 0)
+    return {
+        'messages': count,
+        'wall_seconds': round(wall, 3),
+        'messages_per_sec': round(count / wall, 2) if wall else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 50), 2),
+        'latency_p95_ms': round(percentile(latencies, 95), 2),
+        'latency_p99_ms': round(percentile(latencies, 99), 2),
+        'latency_p95_by_kind_ms': {
+            kind: round(percentile(sorted(values), 95), 2) for kind, values in replayer.latencies_by_kind.items()
+        },
+        'cpu_ms_per_message': round(cpu * 1000 / count, 3) if count else 0.0,
+        'process_cpu_ms_per_message': round(process_cpu * 1000 / count, 3) if count else 0.0,
+        'memory_growth_mb': round(rss_after - rss_before, 2),
+        'rss_mb': round(rss_after, 2),
+        'handler_errors': len(handler_errors),
+        'telegram_calls_per_message': round(sum(telegram_fake.calls.values()) / count, 2) if count else 0.0,
+        'openai_calls': dict(openai_fake.calls),
+        'openai_errors': dict(openai_fake.errors),
+        'prompt_tokens_per_completion': round(openai_fake.prompt_tokens / completions, 1) if completions else 0.0
+    }
+
+
+def host_fingerprint():
+    """CPU model, core count and Python version: what the timings of a run depend on."""
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open('/proc/cpuinfo') as f:
+            cpu = next((line.split(':', 1)[1].strip() for line in f if line.startswith('model name')), cpu)
+    except OSError:
+        pass
+    return {'cpu': cpu, 'cpus': os.cpu_count(), 'python': platform.python_version()}
+
+
+def compare_with_baseline(metrics, baseline, tolerance, same_host=True):
+    """Return a list of human-readable regressions against the baseline metrics."""
+    regressions = []
+    for name, (direction, slack) in REGRESSION_RULES.items():
+        if name not in baseline or name not in metrics or (name in HOST_BOUND_METRICS and not same_host):
+            continue
+        old, new = baseline[name], metrics[name]
+        if direction == 'higher':
+            limit = old * (1 + tolerance) + slack
+            if new > limit:
+                regressions.append(f"{name}: {new} > {limit:.2f} (baseline {old})")
+        else:
+            limit = old * (1 - tolerance) - slack
+            if new < limit:
+                regressions.append(f"{name}: {new} < {limit:.2f} (baseline {old})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for ParentAI Bot")
+    parser.add_argument('--conversations', default=DEFAULT_CONVERSATIONS, help="JSON file with synthetic conversations")
+    parser.add_argument('--from-user-data', help="Replay recorded histories from a user_data.json file instead")
+    parser.add_argument('--users', type=int, default=40, help="Number of simulated users")
+    parser.add_argument('--concurrency', type=int, default=8, help="Conversations replayed at the same time")
+    parser.add_argument('--llm-latency-ms', type=float, default=40.0)
+    parser.add_argument('--llm-jitter-ms', type=float, default=10.0)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency-ms', type=float, default=2.0)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="Apply Telegram's real rate limits (users replay without pauses, so latency then includes throttling)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative regression (0.25 = 25%%)")
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--output', help="Write the full report as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def scenario_of(args, source):
+    return {
+        'source': source,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'llm_latency_ms': args.llm_latency_ms,
+        'llm_error_rate': args.llm_error_rate,
+        'telegram_latency_ms': args.telegram_latency_ms,
+        'telegram_error_rate': args.telegram_error_rate,
+        'telegram_limits': args.telegram_limits
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.baseline = os.path.abspath(args.baseline)
+    args.output = os.path.abspath(args.output) if args.output else None
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+    if args.from_user_data:
+        conversations = conversations_from_user_data(args.from_user_data)
+        source = os.path.basename(args.from_user_data)
+    else:
+        conversations = load_conversations(args.conversations)
+        source = os.path.basename(args.conversations)
+    if not conversations:
+        print("❌ No conversations to replay")
+        return 1
+
+    telegram_fake = FakeTelegramAPI(latency_ms=args.telegram_latency_ms, error_rate=args.telegram_error_rate, seed=args.seed)
+    openai_fake = FakeOpenAI(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                             error_rate=args.llm_error_rate, seed=args.seed)
+    server = BackgroundServer(telegram_fake, openai_fake).start()
+
+    workdir = tempfile.mkdtemp(prefix='parentai-bench-')
+    book_path = os.path.join(workdir, 'book.txt')
+    with open(book_path, 'w', encoding='utf-8') as f:
+        f.write(build_book_text())
+
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:FAKE-TOKEN',
+        'OPENAI_API_KEY': 'sk-fake',
+        'TELEGRAM_API_BASE_URL': f"{telegram_fake.url}/bot",
+        'OPENAI_BASE_URL': f"{openai_fake.url}/v1",
+        'BOOK_PATH': book_path,
+        'BOOK_EMBEDDINGS_PATH': os.path.join(workdir, 'book_embeddings.json')
+    })
+    if not args.telegram_limits:
+        # The limiter still runs, but scripted users send faster than any person types
+        os.environ.update({'TELEGRAM_GLOBAL_RATE': '100000', 'TELEGRAM_CHAT_RATE': '100000'})
+    os.chdir(workdir)
+    if 'config' in sys.modules:
+        # Started through bot_runtime --mode benchmark: re-read settings pointing at the fakes
+        importlib.reload(sys.modules['config'])
+    logging.disable(logging.WARNING)
+
+    print(f"🧪 Replaying {args.users} users ({len(conversations)} scripts) at concurrency {args.concurrency}...")
+    try:
+        metrics = asyncio.run(run_scenario(args, conversations, telegram_fake, openai_fake))
+    finally:
+        server.stop()
+        logging.disable(logging.NOTSET)
+
+    report = {'scenario': scenario_of(args, source), 'host': host_fingerprint(), 'metrics': metrics}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("⚠️  No baseline found, run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('scenario') != report['scenario']:
+        print("⚠️  Baseline was recorded with a different scenario, comparison may be misleading")
+    same_host = baseline.get('host') == report['host']
+    if not same_host:
+        print(f"⚠️  Baseline was recorded on another host ({baseline.get('host', 'unknown')}), timings are not compared; "
+              f"run --update-baseline on this machine to compare them")
+
+    regressions = compare_with_baseline(metrics, baseline['metrics'], args.tolerance, same_host)
+    if regressions:
+        print("❌ Performance regressions detected:")
+        for line in regressions:
+            print(f"   • {line}")
+        return 1
+
+    print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Per-worker memory of the retrieval process pool.
+
+Starts the WorkerPool used for book search (WORKER_PROCESSES) twice on a
+synthetic book: once with the embedding matrix and chunk texts memory-mapped
+from files, as in production, and once with a private in-memory copy in every
+worker, as each process held before. After every worker has searched the whole
+matrix, it reports RSS, PSS and private memory per worker from /proc and the
+saving per worker. PSS splits shared pages between the workers that map them,
+so the PSS sum is what the pool really costs.
+
+It also checks that the workers do not import the knowledge-base modules.
+Those tables are only used in the bot process, where they are loaded once.
+
+Usage:
+    python -m benchmarks.memory_report
+    python -m benchmarks.memory_report --workers 4 --chunks 20000 --dim 1536 --json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+import numpy as np
+
+KNOWLEDGE_MODULES = ('petranovskaya_knowledge_base', 'knowledge_base', 'enhanced_ai_service', 'ai_service')
+
+
+def init_private_copy(embeddings_path, index_kind):
+    """Worker initializer: the production worker, then private copies of the matrix and texts."""
+    import book_rag_system
+    book_rag_system.init_rank_worker(embeddings_path, index_kind)
+    rag_system = book_rag_system._worker_rag
+    rag_system.matrix = np.array(rag_system.matrix)
+    rag_system.chunks = list(rag_system.chunks)
+
+
+def loaded_knowledge_modules():
+    return sorted(name for name in KNOWLEDGE_MODULES if name in sys.modules)
+
+
+def knowledge_size_kb():
+    """Serialized size of the knowledge tables held by the bot process."""
+    from enhanced_ai_service import FALLBACK_RESPONSES
+    from knowledge_base import PARENTING_KNOWLEDGE
+    from petranovskaya_knowledge_base import PETRANOVSKAYA_KNOWLEDGE
+    tables = [PETRANOVSKAYA_KNOWLEDGE, PARENTING_KNOWLEDGE, FALLBACK_RESPONSES]
+    return round(sum(len(json.dumps(table, ensure_ascii=False).encode('utf-8')) for table in tables) / 1024, 1)
+
+
+def synthetic_book(directory, chunks, dim, seed=0):
+    """Embeddings and chunk files laid out like the production cache, written through finalize_rag_system."""
+    from book_rag_system import finalize_rag_system
+
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((chunks, dim), dtype=np.float32)
+    texts = [f"Фрагмент {i}: ребенок плачет ночью, режим сна и адаптация к саду. " * 8 for i in range(chunks)]
+    path = os.path.join(directory, 'book_embeddings.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'chunks': []}, f)
+    rag_system = finalize_rag_system(texts, embeddings, path, index_kind='exact', workers=0)
+    return path, rag_system
+
+
+def measure(mode, embeddings_path, workers, dim, rounds):
+    """Start a pool, let every worker scan the whole matrix, then read each worker's memory."""
+    from book_rag_system import RETRIEVAL_STAGE, init_rank_worker, rank_in_worker
+    from worker_pool import WorkerPool, WorkerStats, process_memory
+
+    initializer = init_rank_worker if mode == 'mmap' else init_private_copy
+    pool = WorkerPool(workers, initializer=initializer, initargs=(embeddings_path, 'exact'), stats=WorkerStats())
+    try:
+        pool.warm()
+        rng = np.random.default_rng(1)
+        # Concurrent calls spread over all workers; exact search touches every page of the matrix
+        futures = [
+            pool.executor.submit(rank_in_worker, ["Почему ребенок плачет ночью?"], rng.standard_normal((1, dim)), 3)
+            for _ in range(workers * rounds)
+        ]
+        for future in futures:
+            future.result()
+        pool.call(RETRIEVAL_STAGE, rank_in_worker, ["Режим сна"], rng.standard_normal((1, dim)), 3)
+        memory = {pid: process_memory(pid) for pid in pool.pids()}
+        knowledge = pool.executor.submit(loaded_knowledge_modules).result()
+    finally:
+        pool.shutdown()
+    return {'mode': mode, 'workers': memory, 'knowledge_modules_in_workers': knowledge}
+
+
+def summarize(result):
+    workers = [memory for memory in result['workers'].values() if memory]
+    if not workers:
+        return {}
+    return {
+        'rss_mb': round(statistics.mean(memory['rss_mb'] for memory in workers), 1),
+        'pss_mb': round(statistics.mean(memory['pss_mb'] for memory in workers), 1),
+        'private_mb': round(statistics.mean(memory['private_mb'] for memory in workers), 1),
+        'pss_total_mb': round(sum(memory['pss_mb'] for memory in workers), 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-worker memory of the retrieval process pool")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=1536, help="Embedding size (text-embedding-ada-002: 1536)")
+    parser.add_argument('--rounds', type=int, default=4, help="Searches per worker before measuring")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    from worker_pool import process_memory
+    if not process_memory():
+        print("❌ /proc/<pid>/smaps_rollup is not available on this system")
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        embeddings_path, rag_system = synthetic_book(directory, args.chunks, args.dim)
+        report = {
+            'chunks': args.chunks,
+            'matrix_mb': round(rag_system.matrix.nbytes / 2 ** 20, 1),
+            'knowledge_tables_kb': knowledge_size_kb(),
+            'results': [measure(mode, embeddings_path, args.workers, args.dim, args.rounds) for mode in ('copy', 'mmap')]
+        }
+        rag_system.chunks.close()
+        del rag_system
+
+    for result in report['results']:
+        result['summary'] = summarize(result)
+    copy, shared = (result['summary'] for result in report['results'])
+    if copy and shared:
+        report['saving_per_worker_mb'] = round(copy['pss_mb'] - shared['pss_mb'], 1)
+        report['saving_total_mb'] = round(copy['pss_total_mb'] - shared['pss_total_mb'], 1)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    print(f"📚 {report['chunks']} chunks, matrix {report['matrix_mb']} MB, "
+          f"knowledge tables {report['knowledge_tables_kb']} KB (bot process only)")
+    for result in report['results']:
+        summary = result['summary']
+        print(f"\n🧠 {result['mode']}: per worker RSS {summary.get('rss_mb')} MB, PSS {summary.get('pss_mb')} MB, "
+              f"private {summary.get('private_mb')} MB; pool PSS {summary.get('pss_total_mb')} MB")
+        for pid, memory in result['workers'].items():
+            print(f"   pid {pid}: " + ", ".join(f"{key} {value}" for key, value in memory.items()))
+        print(f"   knowledge modules in workers: {', '.join(result['knowledge_modules_in_workers']) or 'none'}")
+    if 'saving_per_worker_mb' in report:
+        print(f"\n💾 mmap saves {report['saving_per_worker_mb']} MB PSS per worker, "
+              f"{report['saving_total_mb']} MB for {args.workers} workers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
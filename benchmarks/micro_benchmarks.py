@@ -0,0 +1,413 @@
+"""
+Micro-benchmarks for the per-message hot paths.
+
+Covers topic extraction, age-group detection, knowledge-base lookup and
+formatting, RAG prompt assembly and user-data persistence, using the
+Russian and English questions from benchmarks/question_corpus.json.
+
+Usage:
+    python -m benchmarks.micro_benchmarks                      # run all, save results/<commit>.json
+    python -m benchmarks.micro_benchmarks --filter topic       # run a subset
+    python -m benchmarks.micro_benchmarks --compare results/a.json results/b.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+CORPUS_PATH = os.path.join(BENCHMARKS_DIR, 'question_corpus.json')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+# Representative ages in months, matching the /age buttons
+CHILD_AGES = [None, 1, 4, 8, 15, 30]
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark factory returning (callable, calls_per_run)."""
+    def decorator(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    return corpus['ru'] + corpus['en']
+
+
+def sample_book_context():
+    """Three book fragments similar in size to what the RAG system returns."""
+    from petranovskaya_knowledge_base import PETRANOVSKAYA_KNOWLEDGE
+
+    fragments = []
+    for topic in list(PETRANOVSKAYA_KNOWLEDGE.values())[:3]:
+        text = " ".join(item for value in topic.values() for item in (value if isinstance(value, list) else [value]))
+        fragments.append(text[:800])
+    return "\n\n".join(f"[Фрагмент {i}]\n{text}" for i, text in enumerate(fragments, 1))
+
+
+def sample_user_data(users=200, history_items=20):
+    """Synthetic user_data store shaped like the one saved by the enhanced bot."""
+    from petranovskaya_knowledge_base import format_petranovskaya_response
+
+    answer = format_petranovskaya_response("crying_and_comfort")
+    questions = load_corpus()
+    now = datetime(2026, 1, 1).isoformat()
+    data = {}
+    for user_id in range(users):
+        data[str(100000 + user_id)] = {
+            'name': f"Пользователь {user_id}",
+            'child_age_months': CHILD_AGES[1 + user_id % 5],
+            'context': '',
+            'conversation_history': [
+                {
+                    'question': questions[(user_id + i) % len(questions)],
+                    'answer': answer,
+                    'timestamp': now,
+                    'child_age': CHILD_AGES[1 + user_id % 5]
+                }
+                for i in range(history_items)
+            ],
+            'total_questions': history_items,
+            'favorite_topics': ['crying_and_comfort', 'sleep_issues'],
+            'registration_date': now,
+            'last_activity': now
+        }
+    return data
+
+
+@benchmark('ai_service.extract_topic_from_question')
+def bench_basic_extract_topic(corpus):
+    from ai_service import ParentAIService
+    service = ParentAIService()
+
+    def run():
+        for question in corpus:
+            service.extract_topic_from_question(question)
+    return run, len(corpus)
+
+
+@benchmark('enhanced.extract_topic_from_question')
+def bench_enhanced_extract_topic(corpus):
+    from enhanced_ai_service import EnhancedParentAIService
+    service = EnhancedParentAIService()
+
+    def run():
+        for question in corpus:
+            service.extract_topic_from_question(question)
+    return run, len(corpus)
+
+
+@benchmark('ai_service.determine_age_group')
+def bench_basic_age_group(corpus):
+    from ai_service import ParentAIService
+    service = ParentAIService()
+    ages = list(range(0, 37))
+
+    def run():
+        for age in ages:
+            service.determine_age_group(age)
+    return run, len(ages)
+
+
+@benchmark('enhanced.determine_age_group')
+def bench_enhanced_age_group(corpus):
+    from enhanced_ai_service import EnhancedParentAIService
+    service = EnhancedParentAIService()
+    ages = [None] + list(range(0, 37))
+
+    def run():
+        for age in ages:
+            service.determine_age_group(age)
+    return run, len(ages)
+
+
+def _topic_age_pairs(corpus):
+    from ai_service import ParentAIService
+    service = ParentAIService()
+    pairs = []
+    for i, question in enumerate(corpus):
+        age = CHILD_AGES[i % len(CHILD_AGES)]
+        age_group = service.determine_age_group(age) if age else "1-3_years"
+        pairs.append((service.extract_topic_from_question(question), age_group))
+    return pairs
+
+
+@benchmark('kb.get_petranovskaya_advice')
+def bench_get_advice(corpus):
+    from petranovskaya_knowledge_base import get_petranovskaya_advice
+    pairs = _topic_age_pairs(corpus)
+
+    def run():
+        for topic, age_group in pairs:
+            get_petranovskaya_advice(topic, age_group)
+    return run, len(pairs)
+
+
+@benchmark('kb.format_petranovskaya_response')
+def bench_format_response(corpus):
+    from petranovskaya_knowledge_base import format_petranovskaya_response
+    pairs = _topic_age_pairs(corpus)
+
+    def run():
+        for topic, age_group in pairs:
+            format_petranovskaya_response(topic, age_group)
+    return run, len(pairs)
+
+
+@benchmark('fallback.respond')
+def bench_fallback_respond(corpus):
+    from enhanced_ai_service import EnhancedParentAIService
+    service = EnhancedParentAIService()
+    inputs = [(question, topic, age_group) for question, (topic, age_group) in zip(corpus, _topic_age_pairs(corpus))]
+
+    def run():
+        for question, topic, age_group in inputs:
+            service.fallback.respond(question, topic, age_group)
+    return run, len(inputs)
+
+
+@benchmark('enhanced._create_enhanced_rag_context')
+def bench_rag_context(corpus):
+    from enhanced_ai_service import EnhancedParentAIService
+    service = EnhancedParentAIService()
+    book_context = sample_book_context()
+    inputs = []
+    for i, question in enumerate(corpus):
+        age_group = service.determine_age_group(CHILD_AGES[i % len(CHILD_AGES)])
+        inputs.append((question, age_group, service.extract_topic_from_question(question)))
+
+    def run():
+        for question, age_group, topic in inputs:
+            service._create_enhanced_rag_context(question, age_group, book_context, "", topic)
+    return run, len(inputs)
+
+
+@benchmark('user_data.json_dump')
+def bench_user_data_dump(corpus):
+    data = sample_user_data()
+
+    def run():
+        json.dumps(data, ensure_ascii=False, indent=2)
+    return run, 1
+
+
+@benchmark('user_data.json_load')
+def bench_user_data_load(corpus):
+    payload = json.dumps(sample_user_data(), ensure_ascii=False, indent=2)
+
+    def run():
+        json.loads(payload)
+    return run, 1
+
+
+@benchmark('user_store.flush_one_profile')
+def bench_user_store_flush(corpus):
+    import tempfile
+    from user_store import UserStore
+
+    store = UserStore(os.path.join(tempfile.mkdtemp(), 'user_data.db'), legacy_json_path=None)
+    store.users.update({int(user_id): profile for user_id, profile in sample_user_data().items()})
+    store.dirty.update(store.users)
+    store.flush()
+    user_ids = list(store.users)
+    position = [0]
+
+    def run():
+        # What one answered message costs now instead of a full json_dump
+        store.mark_dirty(user_ids[position[0] % len(user_ids)])
+        position[0] += 1
+        store.flush()
+    return run, 1
+
+
+@benchmark('analytics.record_and_top_topics')
+def bench_analytics(corpus):
+    import tempfile
+    from analytics_store import AnalyticsStore
+    from enhanced_ai_service import EnhancedParentAIService
+
+    service = EnhancedParentAIService()
+    topics = [service.extract_topic_from_question(question) for question in corpus]
+    store = AnalyticsStore(os.path.join(tempfile.mkdtemp(), 'analytics.db'))
+
+    def run():
+        # Per-message bookkeeping plus the /stats read, without a disk write
+        for user_id, topic in enumerate(topics):
+            store.record_question(user_id % 200, topic, user_id % 36)
+            store.top_topics(user_id % 200)
+        store.pending_topics.clear()
+        store.pending_rollup.clear()
+        store.pending_users.clear()
+    return run, len(topics)
+
+
+@benchmark('inline.search')
+def bench_inline_search(corpus):
+    from inline_search import InlineIndex
+    # No query cache: measure the search itself
+    index = InlineIndex(cache_size=0)
+    # What the user has typed so far: half of each question, last word unfinished
+    prefixes = [question[:max(len(question) // 2, 1)] for question in corpus]
+
+    def run():
+        for prefix in prefixes:
+            index.inline_results(prefix, 'parentai_bot')
+    return run, len(prefixes)
+
+
+def sample_rag_system(chunks=2000, dims=1536, seed=7):
+    """Book index with random embeddings of the ada-002 size."""
+    import numpy as np
+    from book_rag_system import BookRAGSystem
+
+    rng = np.random.default_rng(seed)
+    return BookRAGSystem([f"Фрагмент {i}" for i in range(chunks)], rng.standard_normal((chunks, dims)), min_score=-1.0), rng
+
+
+@benchmark('rag.top_k_one_by_one')
+def bench_top_k_single(corpus):
+    rag_system, rng = sample_rag_system()
+    queries = rng.standard_normal((16, rag_system.matrix.shape[1]))
+
+    def run():
+        for query in queries:
+            rag_system.top_k([query], 3)
+    return run, len(queries)
+
+
+@benchmark('rag.top_k_batch_16')
+def bench_top_k_batch(corpus):
+    rag_system, rng = sample_rag_system()
+    queries = rng.standard_normal((16, rag_system.matrix.shape[1]))
+
+    def run():
+        rag_system.top_k(queries, 3)
+    return run, len(queries)
+
+
+def measure(run, calls, samples, min_time):
+    """Calibrate loop count, then collect per-call timings in microseconds."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        if time.perf_counter() - started >= min_time or loops >= 1 << 20:
+            break
+        loops *= 2
+
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        for _ in range(loops):
+            run()
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed / (loops * calls) * 1e6)
+
+    return {
+        'unit': 'us_per_call',
+        'loops': loops,
+        'calls_per_loop': calls,
+        'median': round(statistics.median(timings), 4),
+        'mean': round(statistics.fmean(timings), 4),
+        'stdev': round(statistics.stdev(timings), 4) if len(timings) > 1 else 0.0,
+        'min': round(min(timings), 4),
+        'samples': [round(t, 4) for t in timings]
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+
+
+def run_benchmarks(name_filter=None, samples=10, min_time=0.05):
+    corpus = load_corpus()
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        run, calls = factory(corpus)
+        results[name] = measure(run, calls, samples, min_time)
+        print(f"  {name:<45} {results[name]['median']:>12.3f} µs/call (±{results[name]['stdev']:.3f})")
+    return results
+
+
+def compare(old_path, new_path, threshold):
+    """Print per-benchmark ratios; return the names that got slower than the threshold."""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+    slower = []
+    for name, result in new['benchmarks'].items():
+        if name not in old['benchmarks']:
+            print(f"  {name:<45} (new)")
+            continue
+        before, after = old['benchmarks'][name]['median'], result['median']
+        ratio = after / before if before else float('inf')
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  ❌ slower"
+            slower.append(name)
+        elif ratio < 1 - threshold:
+            marker = "  ✅ faster"
+        print(f"  {name:<45} {before:>10.3f} -> {after:>10.3f} µs  x{ratio:.2f}{marker}")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for ParentAI hot paths")
+    parser.add_argument('--filter', help="Only run benchmarks whose name contains this text")
+    parser.add_argument('--samples', type=int, default=10)
+    parser.add_argument('--min-time', type=float, default=0.05, help="Minimum seconds per sample")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change reported as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1], args.threshold) else 0
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+
+    commit = git_revision()
+    print(f"🧪 Running micro-benchmarks at {commit}...")
+    results = run_benchmarks(args.filter, args.samples, args.min_time)
+
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
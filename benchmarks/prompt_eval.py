@@ -0,0 +1,376 @@
+"""
+Answer-quality and cost evaluation for prompt changes.
+
+Runs a fixed question set (benchmarks/eval_questions.json) through
+EnhancedParentAIService against a local OpenAI-compatible server and
+records, per question: prompt and completion tokens, max_tokens, latency,
+whether the answer came from the LLM or a fallback, and how well the answer
+is grounded in the retrieved book fragments.
+
+LLM modes:
+    fake    - deterministic FakeOpenAI answers (default, fully offline)
+    replay  - answers from a cassette recorded earlier; unknown prompts fall back to fake
+    record  - forward unknown prompts to the real API (EVAL_OPENAI_API_KEY) and save them
+
+Embeddings always come from the fake server, so retrieval is deterministic
+and recorded prompts stay reproducible.
+
+Usage:
+    python -m benchmarks.prompt_eval                                   # run, save results/prompt_eval-<commit>.json
+    python -m benchmarks.prompt_eval --llm record --cassette benchmarks/results/cassette.json
+    python -m benchmarks.prompt_eval --compare results/prompt_eval-OLD.json results/prompt_eval-NEW.json
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiohttp import ClientSession, web
+
+from benchmarks.fake_services import BackgroundServer, FakeOpenAI, approx_tokens
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+QUESTIONS_PATH = os.path.join(BENCHMARKS_DIR, 'eval_questions.json')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+SENTENCE_RE = re.compile(r'[^.!?\n]+')
+QUOTE_RE = re.compile(r'«([^»]{12,})»|"([^"]{12,})"')
+
+# metric -> (direction, relative threshold); "higher" means higher values are worse
+COMPARE_RULES = {
+    'prompt_tokens_mean': ('higher', 0.05),
+    'completion_tokens_mean': ('higher', 0.05),
+    'latency_p50_ms': ('higher', 0.20),
+    'grounding_mean': ('lower', 0.05),
+    'quote_precision_mean': ('lower', 0.05),
+    'llm_answer_rate': ('lower', 0.0)
+}
+
+
+class EvalOpenAI(FakeOpenAI):
+    """FakeOpenAI that logs every completion request and can replay or record real answers."""
+
+    def __init__(self, mode='fake', cassette_path=None, upstream='https://api.openai.com', **kwargs):
+        super().__init__(**kwargs)
+        self.mode = mode
+        self.cassette_path = cassette_path
+        self.upstream = upstream.rstrip('/')
+        self.cassette = {}
+        self.requests = []
+        self.missing = 0
+        if cassette_path and os.path.exists(cassette_path):
+            with open(cassette_path, 'r', encoding='utf-8') as f:
+                self.cassette = json.load(f)
+
+    @staticmethod
+    def cassette_key(body):
+        payload = json.dumps(
+            {key: body.get(key) for key in ('model', 'messages', 'max_tokens', 'temperature', 'stop')},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    async def chat_completions(self, request):
+        body = await request.json()
+        key = self.cassette_key(body)
+        started = time.perf_counter()
+
+        recorded = self.cassette.get(key)
+        if recorded is None and self.mode == 'record':
+            recorded = await self.forward(body)
+            self.cassette[key] = recorded
+
+        if recorded is None:
+            if self.mode == 'replay':
+                self.missing += 1
+            response = await super().chat_completions(_Replayed(body))
+            payload = json.loads(response.body)
+        else:
+            self.calls['chat.completions'] += 1
+            payload = recorded
+            self.prompt_tokens += payload['usage']['prompt_tokens']
+            self.completion_tokens += payload['usage']['completion_tokens']
+
+        usage = payload.get('usage', {})
+        self.requests.append({
+            'model': body.get('model'),
+            'max_tokens': body.get('max_tokens'),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'finish_reason': payload['choices'][0].get('finish_reason') if payload.get('choices') else None,
+            'server_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+        return web.json_response(payload)
+
+    async def forward(self, body):
+        """Send the request to the real API and keep the response for later replays."""
+        headers = {'Authorization': f"Bearer {os.environ.get('EVAL_OPENAI_API_KEY', '')}"}
+        async with ClientSession() as session:
+            async with session.post(f"{self.upstream}/v1/chat/completions", json=body, headers=headers) as response:
+                payload = await response.json()
+                if response.status != 200:
+                    raise web.HTTPBadGateway(text=json.dumps(payload))
+                return payload
+
+    def save_cassette(self):
+        if self.cassette_path and self.mode == 'record':
+            with open(self.cassette_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cassette, f, ensure_ascii=False, indent=1)
+
+
+class _Replayed:
+    """Request stand-in so FakeOpenAI.chat_completions can be reused with an already parsed body."""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def json(self):
+        return self.body
+
+
+def grounding(answer, context):
+    """Share of answer sentences whose content words appear in the retrieved fragments,
+    and share of quoted passages that are found verbatim in them."""
+    from reranker import stems
+
+    if not context:
+        return None, None
+    context_stems = stems(context)
+    sentences = [s for s in SENTENCE_RE.findall(answer) if len(stems(s)) >= 4]
+    grounded = [len(stems(s) & context_stems) / len(stems(s)) >= 0.5 for s in sentences]
+
+    normalized_context = " ".join(context.lower().split())
+    quotes = [a or b for a, b in QUOTE_RE.findall(answer)]
+    found = [" ".join(q.lower().split()) in normalized_context for q in quotes]
+
+    return (
+        round(sum(grounded) / len(grounded), 3) if grounded else 0.0,
+        round(sum(found) / len(found), 3) if found else None
+    )
+
+
+def run_questions(service, questions, openai_fake):
+    """Answer each question in turn and attribute LLM requests and retrieval to it."""
+    from generation_profiles import select_profile
+
+    rag = service.rag_system
+    retrieved = []
+    if rag is not None:
+        original = rag.get_context_for_question
+
+        def capture(question, max_chunks=3):
+            context = original(question, max_chunks)
+            retrieved.append(context)
+            return context
+        rag.get_context_for_question = capture
+
+    results = []
+    for item in questions:
+        retrieved.clear()
+        request_count = len(openai_fake.requests)
+        started = time.perf_counter()
+        answer = service.generate_response(item['question'], item.get('age'), item.get('user_context', ''))
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        requests = openai_fake.requests[request_count:]
+        context = retrieved[-1] if retrieved else ''
+        grounded, quote_precision = grounding(answer, context) if requests else (None, None)
+        topic, confidence = service.classify_question(item['question'])
+        results.append({
+            'id': item['id'],
+            'path': 'llm' if requests else 'fallback',
+            'topic': topic,
+            'profile': select_profile(item['question'], topic, confidence).name,
+            'expected_topic': item.get('topic'),
+            'model': requests[-1]['model'] if requests else None,
+            'max_tokens': requests[-1]['max_tokens'] if requests else None,
+            'prompt_tokens': sum(r['prompt_tokens'] for r in requests),
+            'completion_tokens': sum(r['completion_tokens'] for r in requests),
+            'answer_tokens': approx_tokens(answer),
+            'finish_reason': requests[-1]['finish_reason'] if requests else None,
+            'latency_ms': round(latency_ms, 1),
+            'retrieved_fragments': context.count('[Фрагмент '),
+            'grounding': grounded,
+            'quote_precision': quote_precision
+        })
+    return results
+
+
+def summarize(results, price_in, price_out):
+    def mean(key):
+        values = [r[key] for r in results if r[key] is not None]
+        return round(statistics.fmean(values), 3) if values else None
+
+    latencies = sorted(r['latency_ms'] for r in results)
+    llm = [r for r in results if r['path'] == 'llm']
+    prompt_total = sum(r['prompt_tokens'] for r in results)
+    completion_total = sum(r['completion_tokens'] for r in results)
+    return {
+        'questions': len(results),
+        'llm_answer_rate': round(len(llm) / len(results), 3) if results else 0.0,
+        'topic_accuracy': round(sum(r['topic'] == r['expected_topic'] for r in results) / len(results), 3),
+        'prompt_tokens_mean': round(prompt_total / len(llm), 1) if llm else 0.0,
+        'completion_tokens_mean': round(completion_total / len(llm), 1) if llm else 0.0,
+        'answer_tokens_mean': mean('answer_tokens'),
+        'latency_p50_ms': latencies[len(latencies) // 2],
+        'latency_p95_ms': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+        'grounding_mean': mean('grounding'),
+        'quote_precision_mean': mean('quote_precision'),
+        'cost_usd_per_1k_questions': round(
+            (prompt_total * price_in + completion_total * price_out) / 1000 / len(results) * 1000, 4
+        ) if results else 0.0
+    }
+
+
+def summarize_profiles(results, price_in, price_out):
+    """Token, latency and cost breakdown for each generation profile that reached the LLM."""
+    profiles = {}
+    for result in results:
+        if result['path'] == 'llm':
+            profiles.setdefault(result['profile'], []).append(result)
+    breakdown = {}
+    for name, items in sorted(profiles.items()):
+        latencies = sorted(r['latency_ms'] for r in items)
+        prompt_total = sum(r['prompt_tokens'] for r in items)
+        completion_total = sum(r['completion_tokens'] for r in items)
+        breakdown[name] = {
+            'questions': len(items),
+            'max_tokens': items[0]['max_tokens'],
+            'prompt_tokens_mean': round(prompt_total / len(items), 1),
+            'completion_tokens_mean': round(completion_total / len(items), 1),
+            'latency_p50_ms': latencies[len(latencies) // 2],
+            'cost_usd_per_1k_questions': round((prompt_total * price_in + completion_total * price_out) / len(items), 4)
+        }
+    return breakdown
+
+
+def compare(old_path, new_path):
+    """Print summary and per-question deltas; return the metrics that got worse."""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"Comparing {old.get('commit')} -> {new.get('commit')}")
+    worse = []
+    for name, value in new['summary'].items():
+        before = old['summary'].get(name)
+        marker = ""
+        if name in COMPARE_RULES and isinstance(value, (int, float)) and isinstance(before, (int, float)):
+            direction, threshold = COMPARE_RULES[name]
+            limit = abs(before) * threshold
+            if (direction == 'higher' and value > before + limit) or (direction == 'lower' and value < before - limit):
+                marker = "  ❌ worse"
+                worse.append(name)
+            elif (direction == 'higher' and value < before - limit) or (direction == 'lower' and value > before + limit):
+                marker = "  ✅ better"
+        print(f"  {name:<28} {str(before):>10} -> {str(value):>10}{marker}")
+
+    old_by_id = {r['id']: r for r in old['results']}
+    print("\n  Per question (prompt / completion tokens, latency ms):")
+    for result in new['results']:
+        before = old_by_id.get(result['id'])
+        if before is None:
+            print(f"  {result['id']:<20} (new)")
+            continue
+        print(f"  {result['id']:<20} {before['prompt_tokens']:>6} -> {result['prompt_tokens']:<6} "
+              f"{before['completion_tokens']:>6} -> {result['completion_tokens']:<6} "
+              f"{before['latency_ms']:>8} -> {result['latency_ms']:<8} {before['path']} -> {result['path']}")
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Token, latency and grounding evaluation for prompt changes")
+    parser.add_argument('--questions', default=QUESTIONS_PATH)
+    parser.add_argument('--llm', choices=('fake', 'replay', 'record'), default='fake')
+    parser.add_argument('--cassette', help="Recorded completions for --llm replay/record")
+    parser.add_argument('--upstream', default='https://api.openai.com', help="Real API used by --llm record")
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help="Latency of fake answers")
+    parser.add_argument('--price-in', type=float, default=0.0015, help="USD per 1K prompt tokens")
+    parser.add_argument('--price-out', type=float, default=0.002, help="USD per 1K completion tokens")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/prompt_eval-<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="Compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(args.compare[0], args.compare[1]) else 0
+    if args.llm != 'fake' and not args.cassette:
+        parser.error("--cassette is required with --llm replay/record")
+    if args.llm == 'record' and not os.environ.get('EVAL_OPENAI_API_KEY'):
+        parser.error("EVAL_OPENAI_API_KEY must be set to record real answers")
+
+    from benchmarks.load_test import build_book_text
+    from benchmarks.micro_benchmarks import git_revision
+
+    with open(args.questions, 'r', encoding='utf-8') as f:
+        questions = json.load(f)['questions']
+    cassette = os.path.abspath(args.cassette) if args.cassette else None
+    output = os.path.abspath(args.output) if args.output else None
+
+    openai_fake = EvalOpenAI(args.llm, cassette, args.upstream, latency_ms=args.llm_latency_ms)
+    server = BackgroundServer(openai_fake).start()
+
+    workdir = tempfile.mkdtemp(prefix='parentai-eval-')
+    book_path = os.path.join(workdir, 'book.txt')
+    with open(book_path, 'w', encoding='utf-8') as f:
+        f.write(build_book_text())
+    os.environ.update({
+        'OPENAI_API_KEY': 'sk-fake',
+        'OPENAI_BASE_URL': f"{openai_fake.url}/v1",
+        'BOOK_EMBEDDINGS_PATH': os.path.join(workdir, 'book_embeddings.json')
+    })
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if 'config' in sys.modules:
+        importlib.reload(sys.modules['config'])
+    os.chdir(workdir)
+    logging.disable(logging.WARNING)
+
+    print(f"🧪 Evaluating {len(questions)} questions ({args.llm} LLM)...")
+    try:
+        from enhanced_ai_service import EnhancedParentAIService
+        service = EnhancedParentAIService(book_path=book_path)
+        service.warm_up()
+        results = run_questions(service, questions, openai_fake)
+        openai_fake.save_cassette()
+    finally:
+        server.stop()
+        logging.disable(logging.NOTSET)
+
+    commit = git_revision()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'llm': args.llm,
+        'missing_from_cassette': openai_fake.missing,
+        'summary': summarize(results, args.price_in, args.price_out),
+        'profiles': summarize_profiles(results, args.price_in, args.price_out),
+        'results': results
+    }
+    for name, value in report['summary'].items():
+        print(f"  {name:<28} {value}")
+    for name, stats in report['profiles'].items():
+        print(f"  profile {name:<20} " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    if openai_fake.missing:
+        print(f"⚠️  {openai_fake.missing} prompts were not in the cassette and got fake answers")
+
+    output = output or os.path.join(RESULTS_DIR, f"prompt_eval-{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Cold-start profile based on `python -X importtime`.
+
+Imports each entry-point module in a fresh interpreter, parses the
+importtime trace and reports total import time, the heaviest packages and
+how long the AI service takes to warm up afterwards.
+
+Usage:
+    python -m benchmarks.startup_profile
+    python -m benchmarks.startup_profile --modules main enhanced_telegram_bot --top 15 --json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+DEFAULT_MODULES = ['main', 'final_main', 'simple_polling_main', 'telegram_bot', 'enhanced_telegram_bot']
+
+WARM_UP_SNIPPET = """
+import time
+started = time.perf_counter()
+from enhanced_telegram_bot import get_ai_service
+get_ai_service().warm_up()
+print(round((time.perf_counter() - started) * 1000, 1))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse importtime lines into dicts with self/cumulative microseconds and nesting depth."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append({
+            'module': name.strip(),
+            'self_us': int(self_us),
+            'cumulative_us': int(cumulative_us),
+            'depth': depth
+        })
+    return entries
+
+
+def profile_module(module, top):
+    """Import one module under -X importtime and summarize the trace."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+
+    entries = parse_importtime(result.stderr)
+    target = next((e for e in reversed(entries) if e['module'] == module and e['depth'] == 0), None)
+    # Direct imports of the target module are what lazy loading can defer
+    direct = sorted((e for e in entries if e['depth'] == 1), key=lambda e: e['cumulative_us'], reverse=True)
+
+    return {
+        'module': module,
+        'ok': result.returncode == 0,
+        'error': result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        'interpreter_wall_ms': round(wall_ms, 1),
+        'import_ms': round(target['cumulative_us'] / 1000, 1) if target else None,
+        'top_packages': [
+            {'module': e['module'], 'cumulative_ms': round(e['cumulative_us'] / 1000, 1)} for e in direct[:top]
+        ],
+        'top_self': [
+            {'module': e['module'], 'self_ms': round(e['self_us'] / 1000, 1)}
+            for e in sorted(entries, key=lambda e: e['self_us'], reverse=True)[:top]
+        ]
+    }
+
+
+def profile_warm_up():
+    """Time the background warm-up (OpenAI client and RAG index) in a fresh interpreter."""
+    # The OpenAI client refuses to start without a key, even though warm-up makes no requests
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'sk-startup-profile')
+    result = subprocess.run([sys.executable, '-c', WARM_UP_SNIPPET], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start import profile for ParentAI entry points")
+    parser.add_argument('--modules', nargs='+', default=DEFAULT_MODULES)
+    parser.add_argument('--top', type=int, default=10, help="Number of heaviest imports to show")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = {'modules': [profile_module(module, args.top) for module in args.modules]}
+    report['ai_service_warm_up_ms'] = profile_warm_up()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    for item in report['modules']:
+        if not item['ok']:
+            print(f"❌ {item['module']}: {item['error']}")
+            continue
+        print(f"\n📦 {item['module']}: import {item['import_ms']} ms, interpreter total {item['interpreter_wall_ms']} ms")
+        for package in item['top_packages']:
+            print(f"   {package['cumulative_ms']:>8.1f} ms  {package['module']}")
+    print(f"\n🔥 AI service warm-up (background): {report['ai_service_warm_up_ms']} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+RAG система для поиска релевантных фрагментов книги "Тайная опора"
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import Future
+
+import numpy as np
+
+from ann_index import load_or_build_index
+from config import (ANN_HNSW_EF_CONSTRUCTION, ANN_HNSW_EF_SEARCH, ANN_HNSW_M, ANN_INDEX, ANN_MIN_CHUNKS, ANN_N_LISTS,
+                    ANN_N_PROBE, EMBEDDING_TIMEOUT, RETRIEVAL_CACHE_SIZE, CONTEXT_CACHE_SIZE, RERANKER, RERANK_MODEL,
+                    RERANK_OVERFETCH, RERANK_BUDGET_MS, WORKER_PROCESSES, WORKER_RETRIEVAL_LIMIT)
+from openai_client import get_openai_client
+from reranker import create_reranker
+from retrieval_cache import RetrievalCache, ChunkTextStore, chunk_store_path, normalize_query
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+NOT_FOUND_MESSAGE = "В книге не найдена релевантная информация по этому вопросу."
+RETRIEVAL_STAGE = 'retrieval'
+
+# RAG система внутри процесса пула (worker_pool), открывается один раз при его старте
+_worker_rag = None
+
+
+def load_book_text(book_path):
+    """Загружает текст книги из .txt или .pdf файла"""
+    if book_path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("Для чтения PDF установите пакет pypdf или используйте .txt версию книги")
+        reader = PdfReader(book_path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+    with open(book_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def split_into_chunks(text, chunk_size=800, overlap=100):
+    """Разбивает текст на пересекающиеся фрагменты по границам абзацев"""
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    chunks = []
+    current = ""
+
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) + 2 > chunk_size:
+            chunks.append(current)
+            current = current[-overlap:] + "\n\n" + paragraph if overlap else paragraph
+        else:
+            current = current + "\n\n" + paragraph if current else paragraph
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+
+class BookRAGSystem:
+    def __init__(self, chunks, embeddings, client=None, min_score=0.2, cache=None):
+        """Хранит фрагменты книги (список или ChunkTextStore) и нормированную матрицу их эмбеддингов"""
+        self.chunks = chunks
+        self.matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        self.min_score = min_score
+        self.index = None  # ANN индекс для больших библиотек, None - точный поиск
+        self.cache = cache  # RetrievalCache, None - без кэша
+        self.reranker = None  # Reranker, None - берем top-k поиска как есть
+        self.overfetch = RERANK_OVERFETCH
+        self.workers = None  # WorkerPool, None - поиск и реранкинг в процессе бота
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_openai_client()
+        return self._client
+
+    def embed_texts(self, texts):
+        """Получает эмбеддинги для списка текстов одним запросом"""
+        # Без таймаута зависший запрос держал бы вопросы батча до 10 минут
+        response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=texts, timeout=EMBEDDING_TIMEOUT)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def top_k(self, queries, k):
+        """Косинусный top-k для матрицы запросов одним умножением матриц"""
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+        if self.index is not None:
+            return [[hit for hit in hits if hit[0] >= self.min_score] for hits in self.index.search(queries, k)]
+
+        scores = queries @ self.matrix.T
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return [[] for _ in range(len(scores))]
+        if k < scores.shape[1]:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        results = []
+        for row, indices in zip(scores, candidates):
+            ordered = indices[np.argsort(-row[indices])]
+            results.append([(float(row[i]), int(i)) for i in ordered if row[i] >= self.min_score])
+        return results
+
+    def rank(self, questions, vectors, k):
+        """Top-k с реранкингом; при пуле процессов считается в нем, чтобы не занимать GIL процесса бота"""
+        return self.submit_rank(questions, vectors, k).result()
+
+    def submit_rank(self, questions, vectors, k):
+        """rank() без ожидания: Future с top-k; при пуле процессов вызывающий поток сразу освобождается"""
+        if self.workers is not None:
+            def rank_here(error):
+                logger.error(f"Ошибка поиска в пуле процессов, ищем в процессе бота: {error}")
+                return self.rank_local(questions, vectors, k)
+            try:
+                pooled = self.workers.submit(RETRIEVAL_STAGE, rank_in_worker, questions, np.asarray(vectors, dtype=np.float32), k)
+            except Exception as e:
+                return completed(lambda: rank_here(e))
+            return then(pooled, lambda results: results, rank_here)
+        return completed(lambda: self.rank_local(questions, vectors, k))
+
+    def rank_local(self, questions, vectors, k):
+        """Top-k по эмбеддингам; с реранкером берем кандидатов с запасом и оставляем лучшие"""
+        if self.reranker is None:
+            return self.top_k(vectors, k)
+        candidates = self.top_k(vectors, k * self.overfetch)
+        return [self.reranker.rerank(question, hits, self.chunks, k) for question, hits in zip(questions, candidates)]
+
+    def search_many(self, questions, max_chunks=3):
+        """Ищет фрагменты для нескольких вопросов: один запрос эмбеддингов и одно умножение матриц"""
+        return self.submit_many(questions, max_chunks).result()
+
+    def submit_many(self, questions, max_chunks=3):
+        """search_many(), который ждет эмбеддинги, но не ранжирование: Future со списком результатов"""
+        questions = list(questions)
+        if self.cache is None:
+            return self.submit_rank(questions, self.embed_texts(questions), max_chunks)
+
+        keys = [(normalize_query(question), max_chunks) for question in questions]
+        found = {key: self.cache.queries.get(key) for key in dict.fromkeys(keys)}
+        missing = [key for key, results in found.items() if results is None]
+
+        if missing:
+            # Одинаковые вопросы из одного батча эмбеддим один раз
+            first_question = {}
+            for key, question in zip(keys, questions):
+                first_question.setdefault(key, question)
+            vectors = self.embed_texts([first_question[key] for key in missing])
+
+            to_score = []
+            for key, vector in zip(missing, vectors):
+                bucket = self.cache.bucket_key(vector, max_chunks)
+                found[key] = self.cache.buckets.get(bucket)
+                if found[key] is None:
+                    to_score.append((key, bucket, vector))
+                else:
+                    self.cache.queries.put(key, found[key])
+
+            if to_score:
+                def store(scored):
+                    for (key, bucket, _), results in zip(to_score, scored):
+                        found[key] = tuple(results)
+                        self.cache.queries.put(key, found[key])
+                        self.cache.buckets.put(bucket, found[key])
+                    return [found[key] for key in keys]
+
+                scored = self.submit_rank(
+                    [first_question[key] for key, _, _ in to_score], [vector for _, _, vector in to_score], max_chunks
+                )
+                return then(scored, store)
+
+        return completed(lambda: [found[key] for key in keys])
+
+    def search(self, question, max_chunks=3):
+        """Возвращает список (score, chunk_index) наиболее похожих фрагментов"""
+        return self.search_many([question], max_chunks)[0]
+
+    def get_context_for_question(self, question, max_chunks=3):
+        """Собирает текстовый контекст из наиболее релевантных фрагментов книги"""
+        return self.format_context(self.search(question, max_chunks=max_chunks))
+
+    def format_context(self, results):
+        """Форматирует найденные фрагменты для промпта"""
+        if not results:
+            return NOT_FOUND_MESSAGE
+
+        # Для одного и того же набора фрагментов отдаем одну и ту же готовую строку
+        key = tuple(index for _, index in results)
+        if self.cache is not None:
+            context = self.cache.contexts.get(key)
+            if context is not None:
+                return context
+
+        parts = []
+        for position, index in enumerate(key, 1):
+            parts.append(f"[Фрагмент {position}]\n{self.chunks[index]}")
+        context = "\n\n".join(parts)
+
+        if self.cache is not None:
+            self.cache.contexts.put(key, context)
+        return context
+
+    def close(self, wait=True):
+        """Останавливает процессы пула поиска"""
+        if self.workers is not None:
+            self.workers.shutdown(wait=wait)
+            self.workers = None
+
+
+def completed(fn):
+    """Завершенный Future с результатом или исключением fn()"""
+    future = Future()
+    try:
+        future.set_result(fn())
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def then(future, on_result, on_error=None):
+    """
+    Future с on_result(результат future) или on_error(исключение); без on_error исключение передается дальше.
+    Колбэки выполняются в потоке, который завершил future
+    """
+    chained = Future()
+
+    def done(future):
+        try:
+            try:
+                value = future.result()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                chained.set_result(on_error(e))
+            else:
+                chained.set_result(on_result(value))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
+
+
+def normalize_rows(matrix):
+    """Нормирует строки матрицы, чтобы скалярное произведение давало косинус"""
+    if not matrix.size:
+        return np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def matrix_path(embeddings_path):
+    """book_embeddings.json -> book_embeddings.matrix.npy"""
+    return os.path.splitext(embeddings_path)[0] + '.matrix.npy'
+
+
+def open_matrix(matrix, embeddings_path):
+    """Сохраняет нормированную матрицу в .npy и открывает ее через mmap: процессы пула делят одни страницы"""
+    path = matrix_path(embeddings_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(embeddings_path):
+        mapped = np.load(path, mmap_mode='r')
+        if mapped.shape == matrix.shape:
+            return mapped
+        del mapped
+    # Пишем во временный файл, чтобы процессы пула не открыли недописанную матрицу
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, matrix)
+    os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+
+def finalize_rag_system(chunks, embeddings, embeddings_path, index_kind=ANN_INDEX, workers=WORKER_PROCESSES):
+    """Переносит тексты фрагментов и матрицу в mmap-файлы, подключает кэш поиска, ANN индекс и пул процессов"""
+    try:
+        chunks = ChunkTextStore.open_or_build(chunks, chunk_store_path(embeddings_path), embeddings_path)
+    except Exception as e:
+        logger.error(f"Не удалось создать хранилище фрагментов, тексты остаются в памяти: {e}")
+    cache = RetrievalCache(RETRIEVAL_CACHE_SIZE, CONTEXT_CACHE_SIZE) if RETRIEVAL_CACHE_SIZE > 0 else None
+    rag_system = BookRAGSystem(chunks, embeddings, cache=cache)
+    try:
+        rag_system.matrix = open_matrix(rag_system.matrix, embeddings_path)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить матрицу эмбеддингов, она остается в памяти: {e}")
+    try:
+        rag_system.reranker = create_reranker(RERANKER, RERANK_MODEL, RERANK_BUDGET_MS)
+    except Exception as e:
+        logger.error(f"Реранкер недоступен, используется порядок поиска: {e}")
+    attach_ann_index(rag_system, embeddings_path, index_kind)
+    if workers > 0 and isinstance(chunks, ChunkTextStore) and isinstance(rag_system.matrix, np.memmap):
+        attach_worker_pool(rag_system, embeddings_path, index_kind, workers)
+    return rag_system
+
+
+def attach_worker_pool(rag_system, embeddings_path, index_kind=ANN_INDEX, workers=WORKER_PROCESSES):
+    """Запускает процессы поиска; каждый открывает mmap-файлы книги и реранкер один раз при старте"""
+    from worker_pool import WorkerPool
+    pool = WorkerPool(workers, {RETRIEVAL_STAGE: WORKER_RETRIEVAL_LIMIT},
+                      initializer=init_rank_worker, initargs=(embeddings_path, index_kind))
+    try:
+        pool.warm()
+    except Exception as e:
+        logger.error(f"Пул процессов поиска не запустился, поиск остается в процессе бота: {e}")
+        pool.shutdown(wait=False)
+        return rag_system
+    rag_system.workers = pool
+    return rag_system
+
+
+def init_rank_worker(embeddings_path, index_kind):
+    """Выполняется при старте процесса пула: тексты и матрица отображаются в память, а не копируются"""
+    global _worker_rag
+    rag_system = BookRAGSystem(ChunkTextStore(chunk_store_path(embeddings_path)), [])
+    rag_system.matrix = np.load(matrix_path(embeddings_path), mmap_mode='r')
+    try:
+        rag_system.reranker = create_reranker(RERANKER, RERANK_MODEL, RERANK_BUDGET_MS)
+    except Exception as e:
+        logger.error(f"Реранкер недоступен в процессе пула: {e}")
+    _worker_rag = attach_ann_index(rag_system, embeddings_path, index_kind)
+
+
+def rank_in_worker(questions, vectors, k):
+    """Выполняется в процессе пула"""
+    return _worker_rag.rank_local(questions, vectors, k)
+
+
+def attach_ann_index(rag_system, embeddings_path, index_kind=ANN_INDEX):
+    """Подключает ANN индекс, сохраненный рядом с кэшем эмбеддингов; при ошибке остается точный поиск"""
+    try:
+        rag_system.index = load_or_build_index(
+            rag_system.matrix, embeddings_path, index_kind, ANN_MIN_CHUNKS, ANN_N_LISTS, ANN_N_PROBE,
+            ANN_HNSW_M, ANN_HNSW_EF_CONSTRUCTION, ANN_HNSW_EF_SEARCH
+        )
+    except Exception as e:
+        logger.error(f"Ошибка построения ANN индекса, используется точный поиск: {e}")
+    return rag_system
+
+
+def initialize_book_rag(book_path, embeddings_path="book_embeddings.json", index_kind=ANN_INDEX):
+    """Инициализирует RAG систему, используя кэш эмбеддингов если он есть"""
+    if os.path.exists(embeddings_path):
+        with open(embeddings_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        logger.info(f"Loaded {len(cached['chunks'])} book chunks from {embeddings_path}")
+        return finalize_rag_system(
+            [item['text'] for item in cached['chunks']],
+            [item['embedding'] for item in cached['chunks']],
+            embeddings_path, index_kind
+        )
+
+    chunks = split_into_chunks(load_book_text(book_path))
+    if not chunks:
+        raise RuntimeError(f"Книга {book_path} не содержит текста")
+
+    rag_system = BookRAGSystem(chunks, [])
+    embeddings = []
+    for start in range(0, len(chunks), 100):
+        embeddings.extend(rag_system.embed_texts(chunks[start:start + 100]))
+
+    with open(embeddings_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'book_path': book_path,
+            'model': EMBEDDING_MODEL,
+            'chunks': [{'text': text, 'embedding': vector} for text, vector in zip(chunks, embeddings)]
+        }, f, ensure_ascii=False)
+    logger.info(f"Built embeddings for {len(chunks)} book chunks")
+
+    return finalize_rag_system(chunks, embeddings, embeddings_path, index_kind)
@@ -0,0 +1,238 @@
+"""
+Unified runtime for ParentAI Telegram Bot.
+
+One entry point for every deployment. The mode comes from BOT_MODE or --mode:
+    polling    - long polling plus /health and /ready on $PORT (Railway, Docker)
+    webhook    - Telegram pushes updates to WEBHOOK_URL, served on $PORT with the health checks
+    worker     - long polling only, no HTTP server (Procfile worker dynos)
+    benchmark  - offline load test against fake Telegram/OpenAI servers
+
+Worker counts, pool sizes and cache sizes are configured in config.py / environment.
+On SIGTERM/SIGINT the runtime stops taking updates, drains in-flight generations
+(up to SHUTDOWN_TIMEOUT) and flushes modified user profiles before exiting.
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+
+from config import (TELEGRAM_BOT_TOKEN, OPENAI_API_KEY, BOT_MODE, BOT_VARIANT, PORT,
+                    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, SHUTDOWN_TIMEOUT, USER_FLUSH_INTERVAL,
+                    DIGEST_INTERVAL)
+from generation_profiles import profile_stats
+from lifecycle import lifecycle
+from readiness import readiness, READY, FAILED
+from speech_to_text import stt_stats
+from worker_pool import worker_stats
+
+logger = logging.getLogger(__name__)
+
+MODES = ('polling', 'webhook', 'worker', 'benchmark')
+VARIANTS = ('enhanced', 'basic')
+
+
+def check_environment(mode=BOT_MODE):
+    """Check if required environment variables are set."""
+    if not TELEGRAM_BOT_TOKEN:
+        print("❌ Error: TELEGRAM_BOT_TOKEN not found in environment variables")
+        print("Please set your Telegram bot token in the .env file")
+        return False
+
+    if not OPENAI_API_KEY:
+        print("❌ Error: OPENAI_API_KEY not found in environment variables")
+        print("Please set your OpenAI API key in the .env file")
+        return False
+
+    if mode == 'webhook' and not WEBHOOK_URL:
+        print("❌ Error: WEBHOOK_URL is required in webhook mode")
+        return False
+
+    return True
+
+
+def create_bot(variant):
+    """Create the requested bot, falling back to the basic bot if the enhanced one fails."""
+    if variant == 'enhanced':
+        try:
+            from enhanced_telegram_bot import EnhancedParentAIBot
+            return EnhancedParentAIBot()
+        except Exception as e:
+            print(f"❌ Error starting enhanced bot: {e}")
+            print("Falling back to basic bot...")
+
+    from telegram_bot import ParentAIBot
+    return ParentAIBot()
+
+
+class BotRuntime:
+    def __init__(self, mode=BOT_MODE, variant=BOT_VARIANT, port=PORT):
+        self.mode = mode
+        self.variant = variant
+        self.port = port
+        self.bot = None
+        self.web_runner = None
+        self.background_tasks = []
+
+    # HTTP endpoints
+
+    async def health_check(self, request):
+        """Health check endpoint, answers immediately while the bot warms up."""
+        from aiohttp import web
+        return web.json_response({'service': 'ParentAI Bot', 'mode': self.mode, **readiness.snapshot(),
+                                  'generation_profiles': profile_stats.snapshot(),
+                                  'speech_to_text': stt_stats.snapshot(),
+                                  'worker_pool': worker_stats.snapshot()})
+
+    async def ready_check(self, request):
+        """Readiness endpoint, returns 503 until the bot and AI services are warmed up."""
+        from aiohttp import web
+        return web.json_response(readiness.snapshot(), status=200 if readiness.is_ready else 503)
+
+    async def telegram_webhook(self, request):
+        """Receive an update pushed by Telegram and queue it for the application."""
+        from aiohttp import web
+        from telegram import Update
+
+        if WEBHOOK_SECRET and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        if self.bot is None or not lifecycle.accepting:
+            # Telegram redelivers the update, to the next instance after a restart
+            return web.Response(status=503)
+
+        application = self.bot.application
+        update = Update.de_json(await request.json(), application.bot)
+        await application.update_queue.put(update)
+        return web.Response(status=200)
+
+    async def start_web_server(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/', self.health_check)
+        app.router.add_get('/health', self.health_check)
+        app.router.add_get('/ready', self.ready_check)
+        if self.mode == 'webhook':
+            app.router.add_post(WEBHOOK_PATH, self.telegram_webhook)
+
+        self.web_runner = web.AppRunner(app, access_log=None)
+        await self.web_runner.setup()
+        await web.TCPSite(self.web_runner, '0.0.0.0', self.port).start()
+        print(f"✅ Health check server running on port {self.port}")
+
+    # Lifecycle
+
+    async def start_bot(self):
+        from telegram import Update
+
+        self.bot = create_bot(self.variant)
+        self.bot.warm_up()
+
+        application = self.bot.application
+        await application.initialize()
+        await application.start()
+
+        if self.mode == 'webhook':
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+            print(f"🚀 Webhook set to {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            print("🚀 Starting bot polling...")
+
+        for name in ('user_store', 'analytics'):
+            store = getattr(self.bot, name, None)
+            if store is not None:
+                self.background_tasks.append(asyncio.create_task(store.run_write_behind(USER_FLUSH_INTERVAL)))
+        digest_scheduler = getattr(self.bot, 'digest_scheduler', None)
+        if digest_scheduler is not None and DIGEST_INTERVAL > 0:
+            self.background_tasks.append(asyncio.create_task(digest_scheduler.run(DIGEST_INTERVAL)))
+
+        readiness.mark('telegram_bot', READY)
+
+    async def stop_bot(self):
+        """Stop receiving updates, finish in-flight work and flush state."""
+        if self.bot is None:
+            return
+        application = self.bot.application
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SHUTDOWN_TIMEOUT
+
+        lifecycle.stop_accepting()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+
+        abandoned = await lifecycle.drain(SHUTDOWN_TIMEOUT)
+        if application.running:
+            try:
+                await asyncio.wait_for(application.stop(), timeout=max(deadline - loop.time(), 0.1))
+            except asyncio.TimeoutError:
+                logger.warning(f"In-flight updates did not finish within {SHUTDOWN_TIMEOUT}s")
+
+        for task in self.background_tasks:
+            task.cancel()
+        # A write-behind flush under way finishes before its task ends
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks.clear()
+        flush_state = getattr(self.bot, 'flush_state_async', None)
+        if flush_state:
+            await flush_state(wait_for_generations=not abandoned)
+        await application.shutdown()
+        print("✅ Bot stopped, state flushed")
+
+    async def run(self):
+        lifecycle.reset()
+        lifecycle.install_signal_handlers()
+        readiness.register('telegram_bot')
+
+        if self.mode != 'worker':
+            await self.start_web_server()
+
+        try:
+            await self.start_bot()
+            print("🎉 ParentAI Bot is live and ready!")
+            await lifecycle.stop_event.wait()
+        except Exception as e:
+            readiness.mark('telegram_bot', FAILED, error=str(e))
+            logger.error(f"Bot runtime failed: {e}")
+            raise
+        finally:
+            await self.stop_bot()
+            if self.web_runner:
+                await self.web_runner.cleanup()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run ParentAI Telegram Bot")
+    parser.add_argument('--mode', choices=MODES, default=BOT_MODE)
+    parser.add_argument('--variant', choices=VARIANTS, default=BOT_VARIANT)
+    parser.add_argument('--port', type=int, default=PORT)
+    return parser.parse_known_args(argv)
+
+
+def main(argv=None, mode=None, variant=None):
+    """Main function: pick the runtime mode and run until SIGTERM/SIGINT."""
+    args, extra = parse_args(argv)
+    mode = mode or args.mode
+    variant = variant or args.variant
+
+    if mode == 'benchmark':
+        from benchmarks.load_test import main as run_load_test
+        sys.exit(run_load_test(extra))
+
+    print(f"🤖 Starting ParentAI Telegram Bot ({variant}, {mode} mode)...")
+    if not check_environment(mode):
+        sys.exit(1)
+
+    try:
+        asyncio.run(BotRuntime(mode, variant, args.port).run())
+    except Exception as e:
+        print(f"❌ Error running bot: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Several children per profile.
+
+Each child in ``profile['children']`` has its own birth month, conversation
+history, rolling summary and topic counts; ``profile['active_child']`` is the
+id of the child questions are about. Profiles with a single child_age_months
+are migrated into one child on load.
+
+ChildContextCache keeps the active child's age group and prompt prefix per
+(user, child). The entry is rebuilt only when the child's name, birth month,
+summary or most frequent topics change or a new month starts, not on every
+message.
+"""
+
+from collections import Counter, namedtuple
+from datetime import date
+
+from age_tracking import child_age_months, format_age
+from inline_search import TOPIC_TITLES
+
+MAX_CHILDREN = 5
+DEFAULT_CHILD_NAME = "Ребенок"
+# Moved from the profile into its first child
+CHILD_FIELDS = ('birth_month', 'child_age_months', 'age_set_date', 'digest_age_group',
+                'conversation_history', 'context', 'summary_upto')
+
+# named: the prefix names the child, so answers built on it are not shared with other users
+ChildContext = namedtuple('ChildContext', 'age_months age_group prefix named')
+
+
+def new_child(child_id, name=DEFAULT_CHILD_NAME, birth_month=None):
+    return {
+        'id': child_id,
+        'name': name,
+        'birth_month': birth_month,
+        'conversation_history': [],
+        'context': '',
+        'summary_upto': 0,
+        'topics': {}
+    }
+
+
+def migrate_profile(profile):
+    """Move a single-child profile's age, history and summary into profile['children']. Returns True if changed."""
+    if 'children' in profile:
+        return False
+    child = new_child(1)
+    for field in CHILD_FIELDS:
+        if field in profile:
+            child[field] = profile.pop(field)
+    profile['children'] = [child]
+    profile['active_child'] = 1
+    return True
+
+
+def find_child(profile, child_id):
+    for child in profile.get('children', ()):
+        if child['id'] == child_id:
+            return child
+    return None
+
+
+def active_child(profile):
+    """The child questions are currently about; profiles always have at least one."""
+    if 'children' not in profile:
+        migrate_profile(profile)
+    if not profile['children']:
+        profile['children'].append(new_child(1))
+        profile['active_child'] = 1
+    return find_child(profile, profile.get('active_child')) or profile['children'][0]
+
+
+def add_child(profile, name, birth_month=None):
+    """Add a child and make it active; None when the profile already has MAX_CHILDREN."""
+    children = profile.setdefault('children', [])
+    if len(children) >= MAX_CHILDREN:
+        return None
+    child = new_child(max((item['id'] for item in children), default=0) + 1, name, birth_month)
+    children.append(child)
+    profile['active_child'] = child['id']
+    return child
+
+
+def switch_child(profile, selector):
+    """Activate a child by id, position (1-based) or name; returns the child or None."""
+    children = profile.get('children', [])
+    selector = str(selector).strip()
+    for position, child in enumerate(children, 1):
+        if selector in (str(child['id']), str(position)) or selector.lower() == child['name'].lower():
+            profile['active_child'] = child['id']
+            return child
+    return None
+
+
+def record_topic(child, topic):
+    child.setdefault('topics', {})
+    child['topics'][topic] = child['topics'].get(topic, 0) + 1
+
+
+def top_child_topics(child, n=3):
+    return Counter(child.get('topics', {})).most_common(n)
+
+
+class ChildContextCache:
+    def __init__(self, age_group):
+        self.age_group = age_group
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, profile, child, today=None):
+        """Age, age group and prompt prefix of the child, rebuilt only when their inputs change."""
+        today = today or date.today()
+        key = (user_id, child['id'])
+        version = (child.get('name'), child.get('birth_month'), child.get('child_age_months'), child.get('context'),
+                   today.year, today.month, len(profile.get('children', ())),
+                   tuple(topic for topic, _ in top_child_topics(child)))
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        context = self._build(profile, child, today)
+        self._entries[key] = (version, context)
+        return context
+
+    def _build(self, profile, child, today):
+        age_months = child_age_months(child, today)
+        parts = []
+        named = len(profile.get('children', ())) > 1
+        if named:
+            parts.append(f"Вопрос о ребенке {child['name']} ({format_age(age_months)}), детей в семье: {len(profile['children'])}.")
+        elif age_months is not None:
+            parts.append(f"Возраст ребенка: {format_age(age_months)}")
+        topics = top_child_topics(child)
+        if topics:
+            parts.append("Чаще всего спрашивают о темах: " + ", ".join(TOPIC_TITLES.get(topic, topic) for topic, _ in topics) + ".")
+        return ChildContext(age_months, self.age_group(age_months), " ".join(parts), named)
+
+    def invalidate(self, user_id, child_id=None):
+        for key in [key for key in self._entries if key[0] == user_id and child_id in (None, key[1])]:
+            del self._entries[key]
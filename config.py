@@ -3,13 +3,83 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
 # Telegram Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
+# API endpoints (overridden by the benchmark harness to point at local fake servers)
+TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org/bot')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
 # Bot Configuration
 BOT_NAME = "ParentAI"
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()}  # may use /report
 BOT_DESCRIPTION = "Ваш помощник по воспитанию детей, основанный на книге Людмилы Петрановской 'Тайная опора'"
 
 # Knowledge base configuration
 KNOWLEDGE_BASE_PATH = "knowledge_base/"
+BOOK_PATH = os.getenv('BOOK_PATH', "Петрановская_Тайная опора.pdf")
+BOOK_EMBEDDINGS_PATH = os.getenv('BOOK_EMBEDDINGS_PATH', "book_embeddings.json")
+
+# User state (see user_store.py); user_data.json is only read once to migrate old installs
+USER_DB_PATH = os.getenv('USER_DB_PATH', "user_data.db")
+USER_DATA_PATH = os.getenv('USER_DATA_PATH', "user_data.json")
+ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DB_PATH', "analytics.db")  # usage counters, see analytics_store.py
+
+# Runtime configuration (see bot_runtime.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling | webhook | worker | benchmark
+BOT_VARIANT = os.getenv('BOT_VARIANT', 'enhanced')  # enhanced | basic
+PORT = env_int('PORT', 8000)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Performance tuning
+GENERATION_WORKERS = env_int('GENERATION_WORKERS', 8)  # threads running blocking AI calls
+CONCURRENT_UPDATES = env_int('CONCURRENT_UPDATES', 16)  # updates processed in parallel
+TELEGRAM_POOL_SIZE = env_int('TELEGRAM_POOL_SIZE', 32)  # HTTP connections to the Bot API
+TELEGRAM_GLOBAL_RATE = env_int('TELEGRAM_GLOBAL_RATE', 30)  # messages per second across all chats
+TELEGRAM_CHAT_RATE = env_int('TELEGRAM_CHAT_RATE', 1)  # messages per second to one private chat after the burst
+TELEGRAM_CHAT_BURST = env_int('TELEGRAM_CHAT_BURST', 3)  # messages sent to one chat without waiting
+TELEGRAM_GROUP_RATE = env_int('TELEGRAM_GROUP_RATE', 20)  # messages per minute to one group chat
+TELEGRAM_MAX_RETRIES = env_int('TELEGRAM_MAX_RETRIES', 3)  # resends after a 429 with retry_after
+KB_RESPONSE_CACHE_SIZE = env_int('KB_RESPONSE_CACHE_SIZE', 256)  # formatted knowledge-base answers
+FALLBACK_ANSWERS_PER_TOPIC = env_int('FALLBACK_ANSWERS_PER_TOPIC', 32)  # LLM answers kept per topic and age group for outages, 0 disables
+INLINE_CACHE_TIME = env_int('INLINE_CACHE_TIME', 300)  # seconds Telegram may cache inline results
+SHUTDOWN_TIMEOUT = env_int('SHUTDOWN_TIMEOUT', 20)  # seconds to finish in-flight work on shutdown
+USER_FLUSH_INTERVAL = env_int('USER_FLUSH_INTERVAL', 5)  # seconds between write-behind flushes of user profiles
+DIGEST_INTERVAL = env_int('DIGEST_INTERVAL', 6 * 3600)  # seconds between age-group digest runs, 0 disables them
+MEMORY_RECENT_TURNS = env_int('MEMORY_RECENT_TURNS', 3)  # last questions passed to the model verbatim
+MEMORY_TOKEN_BUDGET = env_int('MEMORY_TOKEN_BUDGET', 500)  # prompt tokens for summary plus recent turns
+MEMORY_SUMMARY_TOKENS = env_int('MEMORY_SUMMARY_TOKENS', 200)  # size of the rolling conversation summary
+RETRIEVAL_BATCH_WINDOW_MS = env_int('RETRIEVAL_BATCH_WINDOW_MS', 5)  # wait to batch book searches, 0 disables batching
+RETRIEVAL_MAX_BATCH = env_int('RETRIEVAL_MAX_BATCH', 32)  # questions embedded per batch
+RETRIEVAL_BATCH_THREADS = env_int('RETRIEVAL_BATCH_THREADS', 4)  # batches embedded and searched at once
+EMBEDDING_TIMEOUT = env_int('EMBEDDING_TIMEOUT', 10)  # seconds per embeddings request before it is retried
+ANN_INDEX = os.getenv('ANN_INDEX', 'auto')  # auto | exact | ivf | hnsw (needs hnswlib)
+ANN_MIN_CHUNKS = env_int('ANN_MIN_CHUNKS', 100000)  # 'auto' switches from exact search to IVF at this size
+ANN_N_LISTS = env_int('ANN_N_LISTS', 0)  # IVF clusters, 0 picks ~4*sqrt(chunks)
+ANN_N_PROBE = env_int('ANN_N_PROBE', 0)  # IVF clusters scanned per question, 0 scans ~10% of them
+ANN_HNSW_M = env_int('ANN_HNSW_M', 16)  # HNSW links per node
+ANN_HNSW_EF_CONSTRUCTION = env_int('ANN_HNSW_EF_CONSTRUCTION', 200)  # HNSW candidate list while building
+ANN_HNSW_EF_SEARCH = env_int('ANN_HNSW_EF_SEARCH', 64)  # HNSW candidate list per question
+RETRIEVAL_CACHE_SIZE = env_int('RETRIEVAL_CACHE_SIZE', 1024)  # cached book searches, 0 disables the cache
+CONTEXT_CACHE_SIZE = env_int('CONTEXT_CACHE_SIZE', 256)  # cached assembled book contexts
+RERANKER = os.getenv('RERANKER', 'lexical')  # none | lexical | cross-encoder (needs sentence-transformers)
+RERANK_MODEL = os.getenv('RERANK_MODEL', 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1')
+RERANK_OVERFETCH = env_int('RERANK_OVERFETCH', 4)  # candidates fetched per chunk passed to the prompt
+RERANK_BUDGET_MS = env_int('RERANK_BUDGET_MS', 15)  # reranking is skipped when slower than this
+STT_BACKEND = os.getenv('STT_BACKEND', 'auto')  # auto | faster-whisper | none, auto uses faster-whisper if installed
+STT_MODEL = os.getenv('STT_MODEL', 'small')  # faster-whisper model name or path
+STT_WORKERS = env_int('STT_WORKERS', 2)  # speech-to-text processes, also the number of parallel transcriptions
+STT_CPU_THREADS = env_int('STT_CPU_THREADS', 2)  # threads per speech-to-text process
+STT_MAX_SECONDS = env_int('STT_MAX_SECONDS', 120)  # longer voice messages are not transcribed
+WORKER_PROCESSES = env_int('WORKER_PROCESSES', 0)  # processes for book search and reranking, 0 runs them in the bot process
+WORKER_RETRIEVAL_LIMIT = env_int('WORKER_RETRIEVAL_LIMIT', 0)  # book searches running in workers at once, 0 uses every worker
+GENERATION_MODEL = os.getenv('GENERATION_MODEL', 'gpt-3.5-turbo')  # standard and detailed answers
+GENERATION_MODEL_FAST = os.getenv('GENERATION_MODEL_FAST', 'gpt-3.5-turbo')  # brief answers to short factual questions
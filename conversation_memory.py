@@ -0,0 +1,124 @@
+"""
+Память диалога: сжатое резюме прошлых бесед и последние реплики пользователя
+"""
+
+import logging
+import re
+
+from openai_client import get_openai_client
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = "gpt-3.5-turbo"
+CYRILLIC_RE = re.compile(r'[а-яё]', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+SUMMARY_PROMPT = """Вы ведете краткие заметки о родителе для консультанта по воспитанию.
+Обновите заметки с учетом новых вопросов. Сохраните факты о ребенке (возраст, имя, особенности),
+повторяющиеся проблемы и то, что уже советовали. Не более {max_words} слов, без вступлений."""
+
+
+def estimate_tokens(text):
+    """Оценка числа токенов: кириллица ~2.5 символа на токен, латиница ~4"""
+    if not text:
+        return 0
+    cyrillic = len(CYRILLIC_RE.findall(text))
+    return int(cyrillic / 2.5 + (len(text) - cyrillic) / 4) + 1
+
+
+def clip_to_tokens(text, max_tokens):
+    """Обрезает текст до бюджета токенов по границе слова"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    clipped = text[:int(len(text) * max_tokens / estimate_tokens(text))]
+    while clipped and estimate_tokens(clipped) + 1 > max_tokens:
+        clipped = clipped[:int(len(clipped) * 0.9)]
+    return clipped.rsplit(' ', 1)[0].rstrip(' ,.;:') + "…"
+
+
+def compact(text):
+    return WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+class ConversationMemory:
+    def __init__(self, recent_turns=3, token_budget=500, summary_tokens=200, answer_tokens=60, refresh_every=2,
+                 answers=None):
+        """
+        recent_turns - сколько последних вопросов передавать дословно
+        token_budget - общий бюджет памяти в промпте
+        summary_tokens - максимальный размер резюме
+        answer_tokens - сколько оставлять от каждого прошлого ответа
+        refresh_every - сколько вышедших из окна реплик копить до обновления резюме
+        answers - AnswerStore, из которого берутся ответы по answer_hash; None - ответы хранятся в самих репликах
+        """
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.answer_tokens = answer_tokens
+        self.refresh_every = refresh_every
+        self.answers = answers
+
+    def answer_of(self, item):
+        return self.answers.text(item) if self.answers is not None else item.get('answer')
+
+    def build_user_context(self, profile):
+        """Собирает контекст пользователя для промпта в пределах бюджета токенов"""
+        history = profile.get('conversation_history', [])
+        summary = profile.get('context', '')
+
+        turns = []
+        for item in history[-self.recent_turns:] if self.recent_turns else []:
+            answer = clip_to_tokens(compact(self.answer_of(item)), self.answer_tokens)
+            turns.append(f"- Вопрос: {compact(item.get('question'))}\n  Ответ (кратко): {answer}")
+
+        # Сначала жертвуем самыми старыми репликами, затем сокращаем резюме
+        while turns:
+            used = estimate_tokens("\n".join(turns)) + min(estimate_tokens(summary), self.summary_tokens)
+            if used <= self.token_budget:
+                break
+            turns.pop(0)
+
+        parts = []
+        if summary:
+            budget = self.token_budget - estimate_tokens("\n".join(turns))
+            parts.append("Заметки о прошлых беседах: " + clip_to_tokens(summary, min(budget, self.summary_tokens)))
+        if turns:
+            parts.append("Последние вопросы в диалоге:\n" + "\n".join(turns))
+        return "\n".join(parts)
+
+    def pending_turns(self, profile):
+        """Реплики, вышедшие из окна последних вопросов, но еще не вошедшие в резюме"""
+        history = profile.get('conversation_history', [])
+        window_start = max(len(history) - self.recent_turns, 0)
+        summarized = min(profile.get('summary_upto', 0), window_start)
+        return history[summarized:window_start], window_start
+
+    def needs_refresh(self, profile):
+        pending, _ = self.pending_turns(profile)
+        return len(pending) >= self.refresh_every
+
+    def summarize(self, summary, turns):
+        """Обновляет резюме с учетом новых реплик (блокирующий вызов, выполняется вне обработчика)"""
+        new_turns = "\n".join(
+            f"Вопрос: {compact(item.get('question'))}\nОтвет: {clip_to_tokens(compact(self.answer_of(item)), self.answer_tokens * 2)}"
+            for item in turns
+        )
+        try:
+            response = get_openai_client().chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT.format(max_words=self.summary_tokens // 3)},
+                    {"role": "user", "content": f"Текущие заметки: {summary or 'нет'}\n\nНовые вопросы:\n{new_turns}"}
+                ],
+                max_tokens=self.summary_tokens,
+                temperature=0.2
+            )
+            updated = compact(response.choices[0].message.content)
+        except Exception as e:
+            logger.warning(f"Не удалось обновить резюме диалога: {e}")
+            # Без модели дописываем вопросы к сокращенным старым заметкам
+            questions = "; ".join(compact(item.get('question')) for item in turns)
+            updated = f"{clip_to_tokens(summary, self.summary_tokens // 2)} Спрашивал(а): {questions}".strip()
+        return clip_to_tokens(updated, self.summary_tokens)
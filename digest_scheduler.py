@@ -0,0 +1,143 @@
+"""
+Proactive digests sent when a child moves into the next age group.
+
+Children who entered a new age group in the last few days are found with one
+range query on the AgeIndex of precomputed transition days (keyed by
+(user_id, child_id)). Those children are grouped into cohorts by (age_group, topic). The digest is generated once per
+cohort and the same text is sent to every member. Sends go through the
+application's TelegramRateLimiter, which spaces them out.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from telegram.error import Forbidden
+
+from age_tracking import child_age_months
+from children import find_child, top_child_topics
+from inline_search import TOPIC_TITLES
+
+logger = logging.getLogger(__name__)
+
+AGE_GROUP_TITLES = {
+    "0-3_months": "0-3 месяца",
+    "3-6_months": "3-6 месяцев",
+    "6-12_months": "6-12 месяцев",
+    "3-12_months": "3-12 месяцев",
+    "1-3_years": "1-3 года",
+}
+# Topic of the digest for users who have not asked anything yet
+DEFAULT_TOPICS = {
+    "0-3_months": "crying_and_comfort",
+    "3-6_months": "sleep_issues",
+    "6-12_months": "sleep_issues",
+    "3-12_months": "sleep_issues",
+    "1-3_years": "discipline_and_boundaries",
+}
+DIGEST_QUESTION = "Мой ребенок только что перешел в возраст {age}. Что важно знать о теме «{topic}» в этом возрасте?"
+DIGEST_HEADER = "🌱 Ваш ребенок подрос: новый возраст {age}\n\n"
+DIGEST_FOOTER = "\n\nОтключить такие сообщения: /digest"
+
+
+class DigestScheduler:
+    def __init__(self, users, store, generate, age_index, send, top_topic=None, batch_size=100, lookback_days=7):
+        """
+        users/store: the profile dict and its UserStore (for mark_dirty)
+        generate: async (question, child_age_months) -> answer text, None when it could not be generated
+        age_index: AgeIndex of the children's age group transitions, keyed by (user_id, child_id)
+        send: async (user_id, text), rate limited by the caller's Bot
+        top_topic: user_id -> the user's most asked topic or None
+        lookback_days: transitions this recent still get a digest, so failed sends and downtime are retried
+        """
+        self.users = users
+        self.store = store
+        self.generate = generate
+        self.age_index = age_index
+        self.send = send
+        self.top_topic = top_topic or (lambda user_id: None)
+        self.batch_size = batch_size
+        self.lookback_days = lookback_days
+        self.last_run = {}
+
+    def find_cohorts(self, today=None):
+        """{(age_group, topic): [((user_id, child_id), age_months)]} of children who entered a new age group."""
+        today = today or date.today()
+        cohorts = defaultdict(list)
+        for day, (user_id, child_id), group in self.age_index.crossed(today - timedelta(days=self.lookback_days), today):
+            profile = self.users.get(user_id)
+            child = find_child(profile, child_id) if profile else None
+            if child is None or not profile.get('digests_enabled', True) or child.get('digest_age_group') == group:
+                continue
+            if day <= (child.get('age_set_date') or '')[:10]:
+                # The age was set after this transition: the advice already matches it
+                continue
+            child_topics = top_child_topics(child, 1)
+            topic = (child_topics[0][0] if child_topics else self.top_topic(user_id)) or DEFAULT_TOPICS.get(group, "parenting_philosophy")
+            cohorts[(group, topic)].append(((user_id, child_id), child_age_months(child, today)))
+        return cohorts
+
+    async def generate_digest(self, group, topic, age):
+        age_title = AGE_GROUP_TITLES.get(group, group)
+        question = DIGEST_QUESTION.format(age=age_title, topic=TOPIC_TITLES.get(topic, topic.replace('_', ' ')))
+        answer = await self.generate(question, age)
+        if answer is None:
+            return None
+        return DIGEST_HEADER.format(age=age_title) + answer + DIGEST_FOOTER
+
+    async def _deliver(self, key, group, text):
+        user_id, child_id = key
+        profile = self.users[user_id]
+        child = find_child(profile, child_id)
+        if len(profile.get('children', ())) > 1:
+            text = f"👶 {child['name']}\n" + text
+        try:
+            await self.send(user_id, text)
+        except Forbidden:
+            # The user blocked the bot
+            profile['digests_enabled'] = False
+            self.store.mark_dirty(user_id)
+            return False
+        except Exception as e:
+            logger.error(f"Error sending digest to {user_id}: {e}")
+            return False
+        child['digest_age_group'] = group
+        self.store.mark_dirty(user_id)
+        return True
+
+    async def run_once(self, today=None):
+        """Generate and send one digest per cohort. Failed generations and sends are retried on the next run."""
+        cohorts = self.find_cohorts(today)
+        sent = failed = 0
+        for (group, topic), members in cohorts.items():
+            try:
+                # The youngest member has just crossed the boundary
+                text = await self.generate_digest(group, topic, min(age for _, age in members))
+            except Exception as e:
+                logger.error(f"Error generating digest for {group}/{topic}: {e}")
+                text = None
+            if text is None:
+                # Nobody is marked, so the cohort is retried on the next run
+                logger.warning(f"No digest generated for {group}/{topic}, {len(members)} children wait for the next run")
+                failed += len(members)
+                continue
+            for start in range(0, len(members), self.batch_size):
+                batch = members[start:start + self.batch_size]
+                results = await asyncio.gather(*(self._deliver(key, group, text) for key, _ in batch))
+                sent += sum(results)
+                failed += len(results) - sum(results)
+        self.last_run = {'cohorts': len(cohorts), 'sent': sent, 'failed': failed,
+                         'finished_at': datetime.now().isoformat()}
+        if cohorts:
+            logger.info(f"Sent {sent} digests to {len(cohorts)} cohorts ({failed} failed)")
+        return self.last_run
+
+    async def run(self, interval):
+        """Check for age group changes every `interval` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error running digests: {e}")
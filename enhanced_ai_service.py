@@ -2,131 +2,74 @@
 Улучшенный AI сервис для генерации профессиональных советов по воспитанию
 """
 
-from config import OPENAI_API_KEY
-from book_rag_system import initialize_book_rag
+from age_tracking import child_age_months as current_age_months, format_age
+from config import (BOOK_EMBEDDINGS_PATH, FALLBACK_ANSWERS_PER_TOPIC, MEMORY_TOKEN_BUDGET, RETRIEVAL_BATCH_WINDOW_MS,
+                    RETRIEVAL_BATCH_THREADS, RETRIEVAL_MAX_BATCH)
+from conversation_memory import clip_to_tokens
+from fallback_engine import FallbackEngine
+from generation_profiles import PROFILES, apply_length_policy, keyword_confidence, profile_stats, select_profile
+from openai_client import get_openai_client
 import json
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-class EnhancedParentAIService:
-    def __init__(self, book_path: str = None):
-        """Инициализация улучшенного AI сервиса с RAG системой"""
-        self.book_path = book_path
-        self.rag_system = None
-        self.fallback_responses = self._load_fallback_responses()
-        
-        # Инициализируем RAG систему если путь к книге указан
-        if book_path:
-            try:
-                self.rag_system = initialize_book_rag(book_path, "book_embeddings.json")
-                logger.info("RAG система успешно инициализирована")
-            except Exception as e:
-                logger.error(f"Ошибка инициализации RAG системы: {e}")
-                self.rag_system = None
-    
-    def _load_fallback_responses(self):
-        """Загружает fallback ответы для случаев, когда RAG система недоступна"""
-        return {
-            "crying_and_comfort": {
-                "0-3_months": "Согласно принципам Петрановской, плач ребенка в этом возрасте - это способ общения, а не манипуляция. Немедленно подойдите к ребенку, возьмите на руки и проверьте физические потребности. Говорите ласково: 'Я здесь, мама рядом, все будет хорошо'.",
-                "3-12_months": "Ребенок начинает понимать причинно-следственные связи. Подойдите спокойно, возьмите на руки и объясните: 'Мама здесь, все хорошо'. Для детей старше 6 месяцев: 'Я вижу, что тебе грустно'.",
-                "1-3_years": "Ребенок может выражать эмоции словами. Присядьте на уровень ребенка, спросите: 'Расскажи, что случилось?' Обнимите и скажите: 'Я понимаю, что тебе грустно'."
-            },
-            "sleep_issues": {
-                "0-3_months": "Сон - это навык, который нужно развивать. Создайте ритуал: купание → кормление → колыбельная. Укладывайте в одно и то же время, создайте спокойную атмосферу. Не переживайте, если ребенок засыпает на руках.",
-                "3-12_months": "Ребенок начинает понимать последовательность действий. Сохраняйте ритуал: купание → книга → колыбельная. Укладывайте в кроватку, но оставайтесь рядом. Если просыпается - утешьте, но не вынимайте из кроватки.",
-                "1-3_years": "Ребенок может сопротивляться сну из-за страха разлуки. Объясните: 'Сон нужен, чтобы расти и быть сильным'. Создайте ритуал: ужин → игра → книга → сон. Оставайтесь рядом, пока ребенок не заснет."
-            },
-            "discipline_and_boundaries": {
-                "1-3_years": "Границы нужны, но они должны быть с любовью. Объясните правило: 'Нельзя бить маму, это больно'. Предложите альтернативу: 'Вместо этого можешь...' Если не слушается - остановите действие: 'Стоп, так нельзя'. Обнимите и объясните: 'Я люблю тебя, но это правило'."
-            },
-            "kindergarten_adaptation": {
-                "2-3_years": "Адаптация к садику - это проверка привязанности. Начните подготовку заранее: рассказывайте о садике, играйте в 'садик' дома. Создайте ритуал прощания: объятия + поцелуй + 'Мама вернется'. Первые дни оставайтесь рядом, постепенно увеличивайте время."
-            }
-        }
-    
-    def determine_age_group(self, child_age_months):
-        """Определяет возрастную группу на основе возраста в месяцах"""
-        if child_age_months is None:
-            return "1-3_years"
-        elif child_age_months <= 3:
-            return "0-3_months"
-        elif child_age_months <= 12:
-            return "3-12_months"
-        else:
-            return "1-3_years"
-    
-    def extract_topic_from_question(self, question):
-        """Извлекает основную тему из вопроса пользователя"""
-        question_lower = question.lower()
-        
-        # Расширенный список ключевых слов для тем Петрановской
-        topic_keywords = {
-            "crying_and_comfort": ["плач", "плачет", "кричит", "cry", "crying", "fuss", "fussy", "upset", "scream", "screaming", "успокоить", "утешить"],
-            "sleep_issues": ["сон", "спит", "sleep", "спать", "засыпать", "просыпается", "уложить", "бессонница", "ночные пробуждения"],
-            "discipline_and_boundaries": ["воспитание", "наказание", "границы", "discipline", "punishment", "boundaries", "истерика", "tantrum", "не слушается", "капризы"],
-            "development_milestones": ["развитие", "развивается", "development", "milestone", "навыки", "skills", "говорит", "ходит", "ползает", "сидит"],
-            "reading_interest": ["чтение", "читать", "книги", "reading", "books", "литература", "интерес к чтению", "любовь к книгам"],
-            "kindergarten_adaptation": ["садик", "сад", "детский сад", "kindergarten", "адаптация", "не хочет в садик", "детский сад", "адаптация к садику"],
-            "parenting_philosophy": ["воспитание", "родительство", "parenting", "привязанность", "attachment", "философия воспитания"],
-            "attachment_theory": ["привязанность", "attachment", "любовь", "love", "близость", "closeness", "эмоциональная связь"],
-            "feeding_nutrition": ["кормление", "еда", "питание", "feeding", "nutrition", "прикорм", "грудное вскармливание", "плохо ест"],
-            "safety_behavior": ["безопасность", "safety", "поведение", "behavior", "травмы", "опасность", "ребенок в безопасности"]
-        }
-        
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in question_lower for keyword in keywords):
-                return topic
-        
-        return "parenting_philosophy"  # По умолчанию
-    
-    def generate_response(self, question, child_age_months=None, user_context=""):
-        """Генерирует улучшенный AI ответ на основе контента книги"""
-        try:
-            # Определяем возрастную группу
-            age_group = self.determine_age_group(child_age_months)
-            topic = self.extract_topic_from_question(question)
-            
-            # Логируем запрос
-            logger.info(f"Generating response for topic: {topic}, age_group: {age_group}")
-            
-            if self.rag_system:
-                # Используем RAG систему для поиска релевантного контента из книги
-                book_context = self.rag_system.get_context_for_question(question, max_chunks=3)
-                
-                if "не найдена релевантная информация" in book_context:
-                    # Используем fallback ответ
-                    return self._create_enhanced_fallback_response(question, age_group, topic)
-                
-                # Создаем контекст для AI с найденными фрагментами из книги
-                context = self._create_enhanced_rag_context(question, age_group, book_context, user_context, topic)
-                return self._call_openai_with_retry(context, question)
-            else:
-                # Fallback если RAG система не инициализирована
-                return self._create_enhanced_fallback_response(question, age_group, topic)
-                
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return self._create_error_response(question, age_group)
-    
-    def _create_enhanced_rag_context(self, question, age_group, book_context, user_context, topic):
-        """Создает улучшенный контекст для AI на основе контента книги"""
-        context = f"""
-Вы - Petranovskaya AI, AI-бот, который отвечает на вопросы, связанные с развитием, воспитанием, здоровьем детей, а также на вопросах о родительстве. Ваш единственный источник информации - книга Людмилы Петрановской "Тайная опора".
+# Расширенный список ключевых слов для тем Петрановской
+TOPIC_KEYWORDS = {
+    "crying_and_comfort": ["плач", "плачет", "кричит", "cry", "crying", "fuss", "fussy", "upset", "scream", "screaming", "успокоить", "утешить"],
+    "sleep_issues": ["сон", "спит", "sleep", "спать", "засыпать", "просыпается", "уложить", "бессонница", "ночные пробуждения"],
+    "discipline_and_boundaries": ["воспитание", "наказание", "границы", "discipline", "punishment", "boundaries", "истерика", "tantrum", "не слушается", "капризы"],
+    "development_milestones": ["развитие", "развивается", "development", "milestone", "навыки", "skills", "говорит", "ходит", "ползает", "сидит"],
+    "reading_interest": ["чтение", "читать", "книги", "reading", "books", "литература", "интерес к чтению", "любовь к книгам"],
+    "kindergarten_adaptation": ["садик", "сад", "детский сад", "kindergarten", "адаптация", "не хочет в садик", "детский сад", "адаптация к садику"],
+    "parenting_philosophy": ["воспитание", "родительство", "parenting", "привязанность", "attachment", "философия воспитания"],
+    "attachment_theory": ["привязанность", "attachment", "любовь", "love", "близость", "closeness", "эмоциональная связь"],
+    "feeding_nutrition": ["кормление", "еда", "питание", "feeding", "nutrition", "прикорм", "грудное вскармливание", "плохо ест"],
+    "safety_behavior": ["безопасность", "safety", "поведение", "behavior", "травмы", "опасность", "ребенок в безопасности"]
+}
+
+# Формат ответа для профиля генерации (см. generation_profiles.py)
+ANSWER_FORMATS = {
+    "brief": """Дайте КОРОТКИЙ ответ на фактический вопрос в следующем формате:
+
+1. ОТВЕТ (2-3 предложения):
+   - Прямой ответ на вопрос с учетом возраста ребенка
+   - Почему это так с точки зрения развития ребенка
+
+2. ЧТО ДЕЛАТЬ (2-3 пункта):
+   - Конкретные советы, которые можно применить сегодня
+
+3. КОГДА ОБРАТИТЬСЯ К СПЕЦИАЛИСТУ (одно предложение, если уместно)
 
-ВОЗРАСТНАЯ ГРУППА: {age_group}
-ТЕМА: {topic}
-КОНТЕКСТ ПОЛЬЗОВАТЕЛЯ: {user_context}
+ОБЯЗАТЕЛЬНО:
+- Не более 80-150 слов в ответе
+- Учет возраста ребенка
+""",
+    "standard": """Дайте ответ на вопрос в следующем формате:
 
-РЕЛЕВАНТНЫЕ ФРАГМЕНТЫ ИЗ КНИГИ "ТАЙНАЯ ОПОРА":
-{book_context}
+1. ПОНИМАНИЕ ПРОБЛЕМЫ (1-2 предложения):
+   - Покажите, что вы понимаете ситуацию родителя
+   - Объясните, почему это происходит с точки зрения развития ребенка
 
-СТРУКТУРА ОТВЕТА:
-Отвечайте на том языке, на котором к вам обратились.
-Тон ответов всегда дружелюбный и эмпатичный.
+2. КРАТКИЙ ОТВЕТ (1-2 предложения):
+   - Суть решения проблемы
 
-Давайте РАЗВЕРНУТЫЙ, ПОДРОБНЫЙ ответ на вопрос в следующем формате:
+3. РЕШЕНИЕ (3-5 пунктов):
+   - Конкретные действия: ЧТО делать и КАК делать
+   - Конкретные фразы для разговора с ребенком
+
+4. ЧТО НЕ ДЕЛАТЬ (1-2 пункта)
+
+5. ПОДДЕРЖКА (одна фраза)
+
+ОБЯЗАТЕЛЬНО:
+- 200-300 слов в ответе
+- Учет возраста ребенка
+- Эмпатия и понимание сложности ситуации
+""",
+    "detailed": """Давайте РАЗВЕРНУТЫЙ, ПОДРОБНЫЙ ответ на вопрос в следующем формате:
 
 1. ПОНИМАНИЕ ПРОБЛЕМЫ (2-3 предложения):
    - Покажите, что вы понимаете ситуацию родителя
@@ -178,116 +121,227 @@ class EnhancedParentAIService:
 - Практические советы, которые можно применить СЕГОДНЯ
 - Учет возраста ребенка
 - Эмпатия и понимание сложности ситуации
-- ОСНОВЫВАЙТЕСЬ ТОЛЬКО НА НАЙДЕННЫХ ФРАГМЕНТАХ ИЗ КНИГИ
-- Используйте принципы теории привязанности
-- Давайте надежду и поддержку родителям
-
-ВОПРОС ПОЛЬЗОВАТЕЛЯ: {question}
 """
-        return context
-    
-    def _create_enhanced_fallback_response(self, question, age_group, topic):
-        """Создает улучшенный fallback ответ когда RAG система недоступна"""
-        fallback_text = self.fallback_responses.get(topic, {}).get(age_group, "")
-        
-        if not fallback_text:
-            fallback_text = f"""Согласно принципам из книги Людмилы Петрановской "Тайная опора":
-
-**Понимание проблемы:** Я понимаю, что вы столкнулись с ситуацией, которая требует внимания и заботы. Это нормально - воспитание детей - это сложный процесс, требующий терпения и понимания.
-
-**Краткий ответ:** Основной принцип - это любовь, принятие и понимание потребностей ребенка. Ребенок - это личность, а не проект для воспитания.
-
-**Что делать:**
-1. Оставайтесь спокойными и уверенными
-2. Покажите ребенку, что вы его понимаете
-3. Объясните ситуацию простыми словами
-4. Предложите решение вместе
-5. Обнимите и поддержите
-
-**Что НЕ делать:**
-- Не наказывайте отказом в любви
-- Не игнорируйте эмоции ребенка
-- Не сравнивайте с другими детьми
+}
+
+def determine_age_group(child_age_months):
+    """Определяет возрастную группу на основе возраста в месяцах"""
+    if child_age_months is None:
+        return "1-3_years"
+    elif child_age_months <= 3:
+        return "0-3_months"
+    elif child_age_months <= 12:
+        return "3-12_months"
+    else:
+        return "1-3_years"
+
+
+# Ответы для случаев, когда RAG система недоступна
+FALLBACK_RESPONSES = {
+    "crying_and_comfort": {
+        "0-3_months": "Согласно принципам Петрановской, плач ребенка в этом возрасте - это способ общения, а не манипуляция. Немедленно подойдите к ребенку, возьмите на руки и проверьте физические потребности. Говорите ласково: 'Я здесь, мама рядом, все будет хорошо'.",
+        "3-12_months": "Ребенок начинает понимать причинно-следственные связи. Подойдите спокойно, возьмите на руки и объясните: 'Мама здесь, все хорошо'. Для детей старше 6 месяцев: 'Я вижу, что тебе грустно'.",
+        "1-3_years": "Ребенок может выражать эмоции словами. Присядьте на уровень ребенка, спросите: 'Расскажи, что случилось?' Обнимите и скажите: 'Я понимаю, что тебе грустно'."
+    },
+    "sleep_issues": {
+        "0-3_months": "Сон - это навык, который нужно развивать. Создайте ритуал: купание → кормление → колыбельная. Укладывайте в одно и то же время, создайте спокойную атмосферу. Не переживайте, если ребенок засыпает на руках.",
+        "3-12_months": "Ребенок начинает понимать последовательность действий. Сохраняйте ритуал: купание → книга → колыбельная. Укладывайте в кроватку, но оставайтесь рядом. Если просыпается - утешьте, но не вынимайте из кроватки.",
+        "1-3_years": "Ребенок может сопротивляться сну из-за страха разлуки. Объясните: 'Сон нужен, чтобы расти и быть сильным'. Создайте ритуал: ужин → игра → книга → сон. Оставайтесь рядом, пока ребенок не заснет."
+    },
+    "discipline_and_boundaries": {
+        "1-3_years": "Границы нужны, но они должны быть с любовью. Объясните правило: 'Нельзя бить маму, это больно'. Предложите альтернативу: 'Вместо этого можешь...' Если не слушается - остановите действие: 'Стоп, так нельзя'. Обнимите и объясните: 'Я люблю тебя, но это правило'."
+    },
+    "kindergarten_adaptation": {
+        "2-3_years": "Адаптация к садику - это проверка привязанности. Начните подготовку заранее: рассказывайте о садике, играйте в 'садик' дома. Создайте ритуал прощания: объятия + поцелуй + 'Мама вернется'. Первые дни оставайтесь рядом, постепенно увеличивайте время."
+    }
+}
 
-**Источники:** Книга "Тайная опора" Людмилы Петрановской
 
-**Поддержка:** Помните, что вы - хороший родитель, и ваша любовь - это самое важное для ребенка.
-
-Чем еще могу помочь?"""
+class EnhancedParentAIService:
+    def __init__(self, book_path: str = None):
+        """Инициализация улучшенного AI сервиса (RAG система загружается лениво)"""
+        self.book_path = book_path
+        self._rag_system = None
+        self._rag_loaded = not book_path
+        self._rag_lock = threading.Lock()
+        self.fallback_responses = self._load_fallback_responses()
+        # Шаблоны запасных ответов и недавние ответы LLM на случай сбоя
+        self.fallback = FallbackEngine(self.fallback_responses, TOPIC_KEYWORDS, answers_per_topic=FALLBACK_ANSWERS_PER_TOPIC)
+    
+    @property
+    def rag_system(self):
+        """RAG система, загружается при первом обращении или в warm_up()"""
+        if not self._rag_loaded:
+            with self._rag_lock:
+                if not self._rag_loaded:
+                    self._rag_system = self._initialize_rag()
+                    self._rag_loaded = True
+        return self._rag_system
+    
+    def _initialize_rag(self):
+        """Инициализирует RAG систему для книги"""
+        try:
+            from book_rag_system import initialize_book_rag
+            rag_system = initialize_book_rag(self.book_path, BOOK_EMBEDDINGS_PATH)
+            logger.info("RAG система успешно инициализирована")
+            if RETRIEVAL_BATCH_WINDOW_MS > 0:
+                # Одновременные вопросы ищутся одним батчем
+                from retrieval_batcher import RetrievalBatcher
+                return RetrievalBatcher(rag_system, RETRIEVAL_BATCH_WINDOW_MS, RETRIEVAL_MAX_BATCH, RETRIEVAL_BATCH_THREADS)
+            return rag_system
+        except Exception as e:
+            logger.error(f"Ошибка инициализации RAG системы: {e}")
+            return None
+    
+    def warm_up(self):
+        """Заранее загружает тяжелые части: клиент OpenAI и индекс RAG"""
+        get_openai_client()
+        return {'rag_index': self.rag_system is not None}
+    
+    def close(self, wait=True):
+        """Останавливает процессы пула поиска, если RAG система загружена"""
+        if self._rag_system is not None:
+            self._rag_system.close(wait)
+    
+    def _load_fallback_responses(self):
+        """Fallback ответы для случаев, когда RAG система недоступна (одна таблица на процесс)"""
+        return FALLBACK_RESPONSES
+    
+    def determine_age_group(self, child_age_months):
+        """Определяет возрастную группу на основе возраста в месяцах"""
+        return determine_age_group(child_age_months)
+    
+    def extract_topic_from_question(self, question):
+        """Извлекает основную тему из вопроса пользователя"""
+        return self.classify_question(question)[0]
+    
+    def classify_question(self, question):
+        """Возвращает (тема, уверенность): первая совпавшая тема и доля ее ключевых слов среди всех совпадений"""
+        question_lower = question.lower()
+        for topic, keywords in TOPIC_KEYWORDS.items():
+            if any(keyword in question_lower for keyword in keywords):
+                return topic, keyword_confidence(question_lower, TOPIC_KEYWORDS, topic)
         
-        return f"""Извините, но я не могу найти релевантную информацию в книге "Тайная опора" для ответа на ваш вопрос.
+        return "parenting_philosophy", 0.0  # По умолчанию
+    
+    def generate_response(self, question, child_age_months=None, user_context="", personal=None, fallback=True):
+        """
+        Генерирует улучшенный AI ответ на основе контента книги.
+        personal - в user_context есть память диалога или имя ребенка; None - любой непустой контекст считается личным
+        fallback - False: при сбое LLM или RAG вернуть None вместо шаблонного ответа (для рассылок)
+        """
+        try:
+            # Определяем возрастную группу
+            age_group = self.determine_age_group(child_age_months)
+            topic, confidence = self.classify_question(question)
+            profile = select_profile(question, topic, confidence)
+            
+            # Логируем запрос
+            logger.info(f"Generating response for topic: {topic}, age_group: {age_group}, profile: {profile.name}")
+            
+            if self.rag_system:
+                # Используем RAG систему для поиска релевантного контента из книги
+                book_context = self.rag_system.get_context_for_question(question, max_chunks=3)
+                
+                if "не найдена релевантная информация" in book_context:
+                    if not fallback:
+                        return None
+                    # Используем fallback ответ
+                    return self._create_enhanced_fallback_response(question, age_group, topic)
+                
+                # Создаем контекст для AI с найденными фрагментами из книги
+                context = self._create_enhanced_rag_context(question, age_group, book_context, user_context, topic, profile.answer_format)
+                answer = self._call_openai_with_retry(context, question, profile=profile)
+                if answer is None:
+                    if not fallback:
+                        return None
+                    return self.fallback.respond(question, topic, age_group, 'error')
+                if not (bool(user_context) if personal is None else personal):
+                    # Ответы с личным контекстом могут упоминать семью пользователя, их другим не отдаем
+                    self.fallback.remember(question, topic, age_group, answer)
+                return answer
+            elif not fallback:
+                return None
+            else:
+                # Fallback если RAG система не инициализирована
+                return self.fallback.respond(question, topic, age_group, 'no_rag')
+                
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            if not fallback:
+                return None
+            return self._create_error_response(question, age_group)
+    
+    def _create_enhanced_rag_context(self, question, age_group, book_context, user_context, topic, answer_format="detailed"):
+        """Создает улучшенный контекст для AI на основе контента книги"""
+        # Память диалога не должна вытеснять фрагменты книги
+        user_context = clip_to_tokens(user_context, MEMORY_TOKEN_BUDGET)
+        context = f"""
+Вы - Petranovskaya AI, AI-бот, который отвечает на вопросы, связанные с развитием, воспитанием, здоровьем детей, а также на вопросах о родительстве. Ваш единственный источник информации - книга Людмилы Петрановской "Тайная опора".
 
-Вопрос: {question}
-Возрастная группа: {age_group}
+ВОЗРАСТНАЯ ГРУППА: {age_group}
+ТЕМА: {topic}
+КОНТЕКСТ ПОЛЬЗОВАТЕЛЯ: {user_context}
 
-{fallback_text}
+РЕЛЕВАНТНЫЕ ФРАГМЕНТЫ ИЗ КНИГИ "ТАЙНАЯ ОПОРА":
+{book_context}
 
-Возможные причины:
-- Вопрос не связан с темами воспитания детей
-- В книге нет информации по этой конкретной теме
-- RAG система не инициализирована
+СТРУКТУРА ОТВЕТА:
+Отвечайте на том языке, на котором к вам обратились.
+Тон ответов всегда дружелюбный и эмпатичный.
 
-Попробуйте переформулировать вопрос или обратитесь к другим темам:
-• Плач и утешение детей
-• Проблемы со сном
-• Дисциплина и установление границ
-• Развитие ребенка по возрастам
-• Формирование привязанности
+{ANSWER_FORMATS[answer_format]}- ОСНОВЫВАЙТЕСЬ ТОЛЬКО НА НАЙДЕННЫХ ФРАГМЕНТАХ ИЗ КНИГИ
+- Используйте принципы теории привязанности
+- Давайте надежду и поддержку родителям
 
-Чем еще могу помочь?"""
+ВОПРОС ПОЛЬЗОВАТЕЛЯ: {question}
+"""
+        return context
+    
+    def _create_enhanced_fallback_response(self, question, age_group, topic):
+        """Ответ по шаблону темы и возраста, когда в книге не нашлось фрагментов"""
+        return self.fallback.respond(question, topic, age_group, 'not_found')
     
     def _create_error_response(self, question, age_group):
-        """Создает ответ при ошибке"""
-        return f"""Извините, произошла техническая ошибка при генерации ответа.
-
-Вопрос: {question}
-Возрастная группа: {age_group}
-
-Пожалуйста, попробуйте:
-1. Переформулировать вопрос
-2. Обратиться к другим темам
-3. Попробовать позже
-
-Я специализируюсь на вопросах развития, воспитания, здоровья детей и родительства на основе книги Людмилы Петрановской "Тайная опора".
-
-Чем еще могу помочь?"""
+        """Ответ при ошибке генерации: похожий недавний ответ или шаблон по теме вопроса"""
+        return self.fallback.respond(question, self.extract_topic_from_question(question), age_group, 'error')
     
-    def _call_openai_with_retry(self, context, question, max_retries=3):
-        """Вызывает OpenAI API с повторными попытками"""
+    def _call_openai_with_retry(self, context, question, max_retries=3, profile=None):
+        """Вызывает OpenAI API с повторными попытками и параметрами профиля генерации; None, если все попытки неудачны"""
+        profile = profile or PROFILES["detailed"]
         for attempt in range(max_retries):
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=OPENAI_API_KEY)
-                
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
+                started = time.perf_counter()
+                response = get_openai_client().chat.completions.create(
                     messages=[
                         {"role": "system", "content": context},
                         {"role": "user", "content": question}
                     ],
-                    max_tokens=1000,
-                    temperature=0.7
+                    **profile.request_options()
                 )
                 
-                return response.choices[0].message.content.strip()
+                choice = response.choices[0]
+                profile_stats.record(profile, (time.perf_counter() - started) * 1000,
+                                     getattr(response, 'usage', None), choice.finish_reason)
+                return apply_length_policy(choice.message.content, choice.finish_reason)
                 
             except Exception as e:
                 logger.warning(f"OpenAI API call attempt {attempt + 1} failed: {e}")
-                if attempt == max_retries - 1:
-                    return self._create_error_response(question, "unknown")
                 continue
         
-        return self._create_error_response(question, "unknown")
+        return None
     
-    def get_user_insights(self, user_id, user_data):
-        """Получает инсайты о пользователе на основе его данных"""
+    def get_user_insights(self, user_id, user_data, top_topics=None):
+        """Получает инсайты о пользователе на основе его данных (top_topics - [(тема, число)] из аналитики)"""
         if user_id not in user_data:
             return "Нет данных о пользователе"
         
         user_info = user_data[user_id]
         total_questions = user_info.get('total_questions', 0)
-        favorite_topics = user_info.get('favorite_topics', [])
-        child_age = user_info.get('child_age_months')
+        favorite_topics = [topic for topic, _ in top_topics] if top_topics else user_info.get('favorite_topics', [])
+        # Возраст активного ребенка; в старых профилях возраст хранится в самом профиле
+        child = next((item for item in user_info.get('children', []) if item['id'] == user_info.get('active_child')), user_info)
+        child_age = current_age_months(child)
         
         insights = []
         
@@ -305,15 +359,7 @@ class EnhancedParentAIService:
             topic_display = [topic_names.get(topic, topic) for topic in favorite_topics[:3]]
             insights.append(f"Ваши любимые темы: {', '.join(topic_display)}")
         
-        if child_age:
-            age_groups = {
-                1: "0-3 месяца",
-                4: "3-6 месяцев", 
-                8: "6-12 месяцев",
-                15: "1-2 года",
-                30: "2-3 года"
-            }
-            age_group = age_groups.get(child_age, "неизвестно")
-            insights.append(f"Возраст ребенка: {age_group}")
+        if child_age is not None:
+            insights.append(f"Возраст ребенка: {format_age(child_age)}")
         
         return "; ".join(insights) if insights else "Нет данных для анализа"
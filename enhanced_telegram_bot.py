@@ -2,14 +2,35 @@
 Улучшенный Telegram Bot для ParentAI с дополнительными функциями
 """
 
+import asyncio
 import logging
-import json
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from config import TELEGRAM_BOT_TOKEN, BOT_NAME
-from ai_service import ParentAIService
+from telegram.ext import (Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler,
+                          ChosenInlineResultHandler, filters, ContextTypes)
+from age_tracking import AgeIndex, birth_month_from_age, child_age_months, format_age, migrate_profile, parse_birth_month
+from analytics_store import AnalyticsStore
+from children import (MAX_CHILDREN, ChildContextCache, active_child, add_child, migrate_profile as migrate_children,
+                      new_child, record_topic, switch_child)
+from config import (TELEGRAM_BOT_TOKEN, TELEGRAM_API_BASE_URL, BOT_NAME, BOOK_PATH, USER_DB_PATH, USER_DATA_PATH,
+                    ANALYTICS_DB_PATH, ADMIN_USER_IDS, INLINE_CACHE_TIME,
+                    GENERATION_WORKERS, CONCURRENT_UPDATES, TELEGRAM_POOL_SIZE,
+                    MEMORY_RECENT_TURNS, MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_TOKENS,
+                    STT_BACKEND, STT_MODEL, STT_WORKERS, STT_CPU_THREADS, STT_MAX_SECONDS)
+from conversation_memory import ConversationMemory
+from digest_scheduler import DigestScheduler
+from enhanced_ai_service import EnhancedParentAIService, determine_age_group
+from inline_search import ASK_RESULT_ID, InlineIndex
+from message_renderer import PARSE_MODE, bold, escape_html, italic, render_markdown, truncate
+from readiness import readiness
+from speech_to_text import create_speech_to_text
+from telegram_sender import MESSAGE_LIMIT, TelegramRateLimiter, edit_or_reply, reply, send_text
+from lifecycle import lifecycle
+from user_store import UserStore
 
 # Configure logging
 logging.basicConfig(
@@ -18,80 +39,37 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize AI service with RAG system
-BOOK_PATH = "Петрановская_Тайная опора.pdf"
-ai_service = ParentAIService(book_path=BOOK_PATH)
+# AI service with RAG system, created on first use so importing the bot stays cheap
+_ai_service = None
+_ai_service_lock = threading.Lock()
 
-# User data storage with enhanced features
-user_data = {}
+def get_ai_service():
+    """Return the shared AI service, creating it on first use."""
+    global _ai_service
+    if _ai_service is None:
+        with _ai_service_lock:
+            if _ai_service is None:
+                _ai_service = EnhancedParentAIService(book_path=BOOK_PATH)
+    return _ai_service
 
-class EnhancedParentAIBot:
-    def __init__(self):
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-        self.setup_handlers()
-        self.load_user_data()
-    
-    def load_user_data(self):
-        """Load user data from file if exists"""
-        try:
-            if os.path.exists('user_data.json'):
-                with open('user_data.json', 'r', encoding='utf-8') as f:
-                    global user_data
-                    user_data = json.load(f)
-                logger.info(f"Loaded user data for {len(user_data)} users")
-        except Exception as e:
-            logger.error(f"Error loading user data: {e}")
-    
-    def save_user_data(self):
-        """Save user data to file"""
-        try:
-            with open('user_data.json', 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, ensure_ascii=False, indent=2)
-            logger.info("User data saved successfully")
-        except Exception as e:
-            logger.error(f"Error saving user data: {e}")
-    
-    def setup_handlers(self):
-        """Set up all bot handlers."""
-        # Command handlers
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("age", self.age_command))
-        self.application.add_handler(CommandHandler("topics", self.topics_command))
-        self.application.add_handler(CommandHandler("history", self.history_command))
-        self.application.add_handler(CommandHandler("stats", self.stats_command))
-        self.application.add_handler(CommandHandler("profile", self.profile_command))
-        
-        # Message handlers
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
-        
-        # Callback query handlers
-        self.application.add_handler(CallbackQueryHandler(self.handle_callback))
-    
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /start command."""
-        user_id = update.effective_user.id
-        user_name = update.effective_user.first_name or "Пользователь"
-        
-        # Initialize user data if not exists
-        if user_id not in user_data:
-            user_data[user_id] = {
-                'name': user_name,
-                'child_age_months': None,
-                'context': '',
-                'conversation_history': [],
-                'total_questions': 0,
-                'favorite_topics': [],
-                'registration_date': datetime.now().isoformat(),
-                'last_activity': datetime.now().isoformat()
-            }
-            self.save_user_data()
-        
-        # Update last activity
-        user_data[user_id]['last_activity'] = datetime.now().isoformat()
-        
-        welcome_message = f"""
-👋 Добро пожаловать в {BOT_NAME}, {user_name}!
+# User data storage with enhanced features; changed profiles are marked dirty and written in batches
+user_store = UserStore(USER_DB_PATH, legacy_json_path=USER_DATA_PATH)
+user_data = user_store.users
+
+# Topic counters and daily usage rollups, updated on every message
+analytics = AnalyticsStore(ANALYTICS_DB_PATH)
+
+# Attached to every answer instead of a separate follow-up message
+QUICK_ACTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Почему ребенок плачет?", callback_data="quick_crying")],
+    [InlineKeyboardButton("Проблемы со сном", callback_data="quick_sleep")],
+    [InlineKeyboardButton("Занятия по возрасту", callback_data="quick_activities")],
+    [InlineKeyboardButton("История диалогов", callback_data="show_history")]
+])
+
+# Static screens, rendered to HTML once
+WELCOME_TEXT = render_markdown(f"""
+👋 Добро пожаловать в {BOT_NAME}, {{user_name}}!
 
 Я ваш помощник по воспитанию детей, основанный исключительно на книге Людмилы Петрановской "Тайная опора".
 
@@ -110,30 +88,20 @@ class EnhancedParentAIBot:
 4. Используйте /history чтобы посмотреть историю диалогов
 
 Что бы вы хотели узнать о вашем малыше? 🤱
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("Указать возраст ребенка", callback_data="set_age")],
-            [InlineKeyboardButton("Основные темы", callback_data="show_topics")],
-            [InlineKeyboardButton("История диалогов", callback_data="show_history")],
-            [InlineKeyboardButton("Мой профиль", callback_data="show_profile")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(welcome_message, reply_markup=reply_markup)
-    
-    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /help command."""
-        help_text = """
+        """)
+
+HELP_TEXT = render_markdown("""
 📚 **Как использовать ParentAI:**
 
 **Основные команды:**
 /start - Начать работу с ботом
-/age - Указать возраст ребенка для персонализированных советов
+/age - Указать возраст ребенка (или /age ММ.ГГГГ - месяц рождения)
 /topics - Посмотреть основные темы, с которыми я могу помочь
 /history - Посмотреть историю ваших диалогов
 /stats - Посмотреть статистику использования
 /profile - Посмотреть ваш профиль
+/child - Дети в профиле: /child add Имя ММ.ГГГГ, /child Имя - переключиться
+/digest - Включить или отключить советы при переходе в новый возраст
 /help - Показать эту справку
 
 **Частые вопросы, с которыми я могу помочь:**
@@ -154,28 +122,9 @@ class EnhancedParentAIBot:
 • Используйте /history чтобы вернуться к предыдущим советам
 
 Просто напишите свой вопрос, и я дам профессиональный, основанный на принципах Петрановской совет. 💕
-        """
-        await update.message.reply_text(help_text, parse_mode='Markdown')
-    
-    async def age_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /age command to set child's age."""
-        keyboard = [
-            [InlineKeyboardButton("0-3 месяца", callback_data="age_1")],
-            [InlineKeyboardButton("3-6 месяцев", callback_data="age_4")],
-            [InlineKeyboardButton("6-12 месяцев", callback_data="age_8")],
-            [InlineKeyboardButton("1-2 года", callback_data="age_15")],
-            [InlineKeyboardButton("2-3 года", callback_data="age_30")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            "Пожалуйста, выберите возрастную группу вашего ребенка для персонализированных советов:",
-            reply_markup=reply_markup
-        )
-    
-    async def topics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /topics command."""
-        topics_text = """
+        """)
+
+TOPICS_TEXT = render_markdown("""
 🎯 **Основные темы, с которыми я могу помочь:**
 
 **Плач и утешение:**
@@ -209,35 +158,276 @@ class EnhancedParentAIBot:
 • Развитие социальных навыков
 
 Просто спросите меня о любой из этих тем! 💬
-        """
-        await update.message.reply_text(topics_text, parse_mode='Markdown')
+        """)
+
+class EnhancedParentAIBot:
+    def __init__(self):
+        self.application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .base_url(TELEGRAM_API_BASE_URL)
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .rate_limiter(TelegramRateLimiter())
+            .build()
+        )
+        # Blocking AI calls run here so the event loop keeps serving other users
+        self.generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+        self.user_store = user_store
+        self.analytics = analytics
+        # Knowledge-base search for inline queries, answered without the LLM
+        self.inline_index = InlineIndex()
+        # Voice messages are transcribed in separate processes; None when no local model is installed
+        self.speech = create_speech_to_text(STT_BACKEND, STT_MODEL, STT_WORKERS, STT_CPU_THREADS)
+        # Days on which each child enters the next age group, for the digest scheduler
+        self.age_index = AgeIndex(determine_age_group)
+        # Age group and prompt prefix of each user's active child, rebuilt only when the child changes
+        self.child_contexts = ChildContextCache(determine_age_group)
+        # Tips sent when a child moves into the next age group, generated once per cohort.
+        # No fallback template: a cohort whose digest failed is retried on the next run
+        self.digest_scheduler = DigestScheduler(
+            user_data, user_store, lambda question, age: self.generate_response(question, age, fallback=False),
+            self.age_index,
+            send=lambda user_id, text: send_text(self.application.bot, user_id, text),
+            top_topic=self.top_topic
+        )
+        self.memory = ConversationMemory(MEMORY_RECENT_TURNS, MEMORY_TOKEN_BUDGET, MEMORY_SUMMARY_TOKENS,
+                                         answers=user_store.answers)
+        self._memory_refreshing = set()
+        self._background_tasks = set()
+        self.setup_handlers()
+        self.load_user_data()
+    
+    def load_user_data(self):
+        """Load user data from the store (migrating user_data.json on first run)"""
+        try:
+            self.user_store.load()
+            # Older profiles: a fixed age becomes a birth month, the single child moves into 'children',
+            # answer texts in histories move into the answer store
+            for user_id, profile in user_data.items():
+                if migrate_profile(profile) | migrate_children(profile) | user_store.answers.intern_history(profile):
+                    user_store.mark_dirty(user_id)
+            self.age_index.build({
+                (user_id, child['id']): child for user_id, profile in user_data.items() for child in profile['children']
+            })
+        except Exception as e:
+            logger.error(f"Error loading user data: {e}")
+        try:
+            self.analytics.load()
+        except Exception as e:
+            logger.error(f"Error loading analytics: {e}")
+    
+    def save_user_data(self):
+        """Write modified user profiles to the store"""
+        written = self.user_store.flush()
+        if written:
+            logger.info(f"Saved {written} user profiles")
+        self.analytics.flush()
+    
+    async def save_user_data_async(self):
+        """save_user_data() from the event loop: snapshots are taken on the thread that mutates profiles"""
+        written = await self.user_store.flush_async()
+        if written:
+            logger.info(f"Saved {written} user profiles")
+        await self.analytics.flush_async()
+    
+    def shutdown_workers(self, wait_for_generations=True):
+        """Stop the generation, speech and retrieval pools (blocking)"""
+        self.generation_executor.shutdown(wait=wait_for_generations, cancel_futures=not wait_for_generations)
+        if self.speech is not None:
+            self.speech.shutdown(wait=wait_for_generations)
+        if _ai_service is not None:
+            _ai_service.close(wait=wait_for_generations)
+    
+    def flush_state(self, wait_for_generations=True):
+        """Persist state before shutdown, once the event loop has stopped"""
+        self.shutdown_workers(wait_for_generations)
+        self.save_user_data()
+    
+    async def flush_state_async(self, wait_for_generations=True):
+        """Persist state before shutdown while the event loop still runs handlers"""
+        await self.save_user_data_async()
+        await asyncio.get_running_loop().run_in_executor(None, self.shutdown_workers, wait_for_generations)
+        # Answers finished while the pools shut down
+        await self.save_user_data_async()
+    
+    async def generate_response(self, question, child_age=None, user_context="", personal=None, fallback=True):
+        """Generate an AI answer in the generation pool without blocking the event loop; None on failure without fallback."""
+        loop = asyncio.get_running_loop()
+        async with lifecycle.track():
+            return await loop.run_in_executor(
+                self.generation_executor, get_ai_service().generate_response, question, child_age, user_context, personal, fallback
+            )
+    
+    def set_birth_month(self, user_id, birth_month, child=None):
+        """Store a child's birth month (the active child by default); the age and age group advance from it."""
+        child = child or active_child(user_data[user_id])
+        child['birth_month'] = birth_month
+        child['child_age_months'] = child_age_months(child)
+        child['age_set_date'] = datetime.now().isoformat()
+        # The digest scheduler counts transitions from the newly set age
+        child.pop('digest_age_group', None)
+        self.age_index.update((user_id, child['id']), birth_month)
+        user_store.mark_dirty(user_id)
+    
+    def active_age(self, user_id):
+        """Age in months of the user's active child, from the per-child context cache."""
+        profile = user_data.get(user_id)
+        if profile is None:
+            return None
+        return self.child_contexts.get(user_id, profile, active_child(profile)).age_months
+    
+    def top_topic(self, user_id):
+        """The topic the user asks about most, or None."""
+        top = analytics.top_topics(user_id, 1)
+        return top[0][0] if top else None
+    
+    def schedule_memory_refresh(self, user_id, child):
+        """Update the child's conversation summary in the background, off the reply path."""
+        key = (user_id, child['id'])
+        if key in self._memory_refreshing or not self.memory.needs_refresh(child):
+            return
+        self._memory_refreshing.add(key)
+        task = asyncio.create_task(self.refresh_memory(user_id, child))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def refresh_memory(self, user_id, child):
+        """Fold turns that left the recent window into the child's rolling summary."""
+        history = child['conversation_history']
+        turns, summarized_upto = self.memory.pending_turns(child)
+        try:
+            loop = asyncio.get_running_loop()
+            summary = await loop.run_in_executor(
+                self.generation_executor, self.memory.summarize, child.get('context', ''), turns
+            )
+            # Skip the result if the history was cleared meanwhile
+            if child['conversation_history'] is history:
+                child['context'] = summary
+                child['summary_upto'] = summarized_upto
+                user_store.mark_dirty(user_id)
+        except Exception as e:
+            logger.error(f"Error refreshing conversation summary: {e}")
+        finally:
+            self._memory_refreshing.discard((user_id, child['id']))
+    
+    def setup_handlers(self):
+        """Set up all bot handlers."""
+        # Command handlers
+        self.application.add_handler(CommandHandler("start", self.start_command))
+        self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("age", self.age_command))
+        self.application.add_handler(CommandHandler("topics", self.topics_command))
+        self.application.add_handler(CommandHandler("history", self.history_command))
+        self.application.add_handler(CommandHandler("stats", self.stats_command))
+        self.application.add_handler(CommandHandler("profile", self.profile_command))
+        self.application.add_handler(CommandHandler("report", self.report_command))
+        self.application.add_handler(CommandHandler("digest", self.digest_command))
+        self.application.add_handler(CommandHandler("child", self.child_command))
+        
+        # Message handlers
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, self.handle_voice))
+        
+        # Callback query handlers
+        self.application.add_handler(CallbackQueryHandler(self.handle_callback))
+        
+        # Inline mode: @bot <question> in any chat
+        self.application.add_handler(InlineQueryHandler(self.inline_query))
+        self.application.add_handler(ChosenInlineResultHandler(self.chosen_inline_result))
+    
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /start command."""
+        user_id = update.effective_user.id
+        user_name = update.effective_user.first_name or "Пользователь"
+        
+        # Initialize user data if not exists
+        if user_id not in user_data:
+            user_data[user_id] = {
+                'name': user_name,
+                'children': [new_child(1)],
+                'active_child': 1,
+                'total_questions': 0,
+                'registration_date': datetime.now().isoformat(),
+                'last_activity': datetime.now().isoformat()
+            }
+        
+        # Update last activity
+        user_data[user_id]['last_activity'] = datetime.now().isoformat()
+        user_store.mark_dirty(user_id)
+        
+        welcome_message = WELCOME_TEXT.format(user_name=escape_html(user_name))
+        
+        keyboard = [
+            [InlineKeyboardButton("Указать возраст ребенка", callback_data="set_age")],
+            [InlineKeyboardButton("Основные темы", callback_data="show_topics")],
+            [InlineKeyboardButton("История диалогов", callback_data="show_history")],
+            [InlineKeyboardButton("Мой профиль", callback_data="show_profile")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await update.message.reply_text(welcome_message, reply_markup=reply_markup, parse_mode=PARSE_MODE)
+    
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /help command."""
+        await update.message.reply_text(HELP_TEXT, parse_mode=PARSE_MODE)
+    
+    async def age_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /age command to set child's age: /age MM.YYYY sets the birth month, otherwise pick an age group."""
+        if context.args:
+            user_id = update.effective_user.id
+            birth_month = parse_birth_month(context.args[0])
+            if user_id not in user_data:
+                await update.message.reply_text("Сначала используйте /start")
+            elif birth_month is None:
+                await update.message.reply_text("Укажите месяц рождения в формате ММ.ГГГГ, например: /age 03.2025")
+            else:
+                self.set_birth_month(user_id, birth_month)
+                await update.message.reply_text(
+                    f"✅ Возраст ребенка: {format_age(self.active_age(user_id))} "
+                    "Он будет обновляться автоматически."
+                )
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton("0-3 месяца", callback_data="age_1")],
+            [InlineKeyboardButton("3-6 месяцев", callback_data="age_4")],
+            [InlineKeyboardButton("6-12 месяцев", callback_data="age_8")],
+            [InlineKeyboardButton("1-2 года", callback_data="age_15")],
+            [InlineKeyboardButton("2-3 года", callback_data="age_30")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await update.message.reply_text(
+            "Пожалуйста, выберите возрастную группу вашего ребенка для персонализированных советов "
+            "или укажите месяц рождения: /age ММ.ГГГГ",
+            reply_markup=reply_markup
+        )
+    
+    async def topics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /topics command."""
+        await update.message.reply_text(TOPICS_TEXT, parse_mode=PARSE_MODE)
     
     async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /history command."""
         user_id = update.effective_user.id
         
-        if user_id not in user_data or not user_data[user_id]['conversation_history']:
+        if user_id not in user_data or not active_child(user_data[user_id])['conversation_history']:
             await update.message.reply_text("У вас пока нет истории диалогов. Начните задавать вопросы!")
             return
         
-        history = user_data[user_id]['conversation_history']
+        history = active_child(user_data[user_id])['conversation_history']
         
-        if len(history) <= 5:
-            # Show all history if 5 or fewer items
-            history_text = "📚 **Ваша история диалогов:**\n\n"
-            for i, item in enumerate(history, 1):
-                history_text += f"**{i}.** {item['question'][:50]}...\n"
-                history_text += f"   *{item['answer'][:100]}...*\n\n"
-        else:
-            # Show last 5 items
-            history_text = "📚 **Последние 5 диалогов:**\n\n"
-            for i, item in enumerate(history[-5:], 1):
-                history_text += f"**{i}.** {item['question'][:50]}...\n"
-                history_text += f"   *{item['answer'][:100]}...*\n\n"
+        # Show all history if 5 or fewer items, otherwise the last 5
+        title = "Ваша история диалогов:" if len(history) <= 5 else "Последние 5 диалогов:"
+        history_text = f"📚 {bold(title)}\n\n"
+        for i, item in enumerate(history[-5:], 1):
+            history_text += f"{bold(f'{i}.')} {escape_html(truncate(item['question'], 50))}\n"
+            history_text += f"   {italic(truncate(user_store.answers.text(item), 100))}\n\n"
         
         history_text += f"Всего диалогов: {len(history)}"
         
-        await update.message.reply_text(history_text, parse_mode='Markdown')
+        await reply(update.message, history_text, parse_mode=PARSE_MODE)
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /stats command."""
@@ -251,38 +441,34 @@ class EnhancedParentAIBot:
         total_questions = user_info.get('total_questions', 0)
         registration_date = user_info.get('registration_date', 'Неизвестно')
         last_activity = user_info.get('last_activity', 'Неизвестно')
-        child_age = user_info.get('child_age_months')
+        age_text = format_age(self.active_age(user_id))
         
-        age_text = "Не указан"
-        if child_age:
-            age_groups = {
-                1: "0-3 месяца",
-                4: "3-6 месяцев", 
-                8: "6-12 месяцев",
-                15: "1-2 года",
-                30: "2-3 года"
-            }
-            age_text = age_groups.get(child_age, "Неизвестно")
+        top_topics = analytics.top_topics(user_id)
+        if top_topics:
+            topics_text = ', '.join(f"{topic} ({count})" for topic, count in top_topics)
+        else:
+            # Profiles from before the analytics store only have the topic list
+            topics_text = ', '.join(user_info.get('favorite_topics') or ['Пока нет данных'])
         
         stats_text = f"""
-📊 **Ваша статистика:**
+📊 <b>Ваша статистика:</b>
 
-👤 **Профиль:**
-• Имя: {user_info.get('name', 'Не указано')}
+👤 <b>Профиль:</b>
+• Имя: {escape_html(user_info.get('name', 'Не указано'))}
 • Возраст ребенка: {age_text}
 • Дата регистрации: {registration_date[:10] if registration_date != 'Неизвестно' else 'Неизвестно'}
 
-📈 **Активность:**
+📈 <b>Активность:</b>
 • Всего вопросов: {total_questions}
 • Последняя активность: {last_activity[:16] if last_activity != 'Неизвестно' else 'Неизвестно'}
 
-🎯 **Популярные темы:**
-{', '.join(user_info.get('favorite_topics', ['Пока нет данных']))}
+🎯 <b>Популярные темы:</b>
+{escape_html(topics_text)}
 
-💡 **Совет:** Используйте /age чтобы указать возраст ребенка для более точных советов!
+💡 <b>Совет:</b> Используйте /age чтобы указать возраст ребенка для более точных советов!
         """
         
-        await update.message.reply_text(stats_text, parse_mode='Markdown')
+        await update.message.reply_text(stats_text, parse_mode=PARSE_MODE)
     
     async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /profile command."""
@@ -296,43 +482,164 @@ class EnhancedParentAIBot:
         
         keyboard = [
             [InlineKeyboardButton("Изменить возраст ребенка", callback_data="set_age")],
+            *self.child_buttons(user_info),
             [InlineKeyboardButton("Очистить историю", callback_data="clear_history")],
             [InlineKeyboardButton("Назад", callback_data="back_to_main")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         profile_text = f"""
-👤 **Ваш профиль:**
+👤 <b>Ваш профиль:</b>
 
-**Основная информация:**
-• Имя: {user_info.get('name', 'Не указано')}
-• Возраст ребенка: {user_info.get('child_age_months', 'Не указан')} месяцев
+<b>Основная информация:</b>
+• Имя: {escape_html(user_info.get('name', 'Не указано'))}
+• Дети: {escape_html(self.children_text(user_info))}
 • Дата регистрации: {user_info.get('registration_date', 'Неизвестно')[:10]}
 
-**Статистика:**
+<b>Статистика:</b>
 • Всего вопросов: {user_info.get('total_questions', 0)}
 • Последняя активность: {user_info.get('last_activity', 'Неизвестно')[:16]}
 
-**Настройки:**
+<b>Настройки:</b>
 Используйте кнопки ниже для изменения настроек.
         """
         
-        await update.message.reply_text(profile_text, reply_markup=reply_markup, parse_mode='Markdown')
+        await update.message.reply_text(profile_text, reply_markup=reply_markup, parse_mode=PARSE_MODE)
+    
+    async def report_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /report command: fleet-wide usage for the last 7 days (admins only)."""
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            await update.message.reply_text("Эта команда доступна только администраторам.")
+            return
+        
+        report = analytics.report(days=7)
+        lines = [f"📈 {bold('Отчет за 7 дней')}", "", f"Вопросов: {report['questions']}",
+                 f"Пользователей с вопросами: {report['users_with_questions']}", "", bold("По дням:")]
+        lines += [f"• {item['day']}: {item['questions']} вопросов, {item['active_users']} пользователей"
+                  for item in report['days']]
+        lines += ["", bold("Темы:")]
+        lines += [f"• {escape_html(topic)}: {count}" for topic, count in report['topics'][:10]] or ["• Пока нет данных"]
+        lines += ["", bold("Возраст детей:")]
+        lines += [f"• {escape_html(bucket)}: {count}" for bucket, count in report['age_buckets']] or ["• Пока нет данных"]
+        
+        await reply(update.message, "\n".join(lines), parse_mode=PARSE_MODE)
+    
+    async def digest_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /digest command: turn age-group digests on or off."""
+        user_id = update.effective_user.id
+        if user_id not in user_data:
+            await update.message.reply_text("Сначала используйте /start")
+            return
+        
+        enabled = not user_data[user_id].get('digests_enabled', True)
+        user_data[user_id]['digests_enabled'] = enabled
+        user_store.mark_dirty(user_id)
+        if enabled:
+            await update.message.reply_text("✅ Я пришлю советы, когда ребенок перейдет в новую возрастную группу.")
+        else:
+            await update.message.reply_text("🔕 Советы по возрасту отключены. Включить снова: /digest")
+    
+    def children_text(self, profile):
+        """'Маша, 1 г. 3 мес. (активный); Петя, 2 мес.'"""
+        active = active_child(profile)
+        return "; ".join(
+            f"{child['name']}, {format_age(child_age_months(child))}" + (" (активный)" if child is active and len(profile['children']) > 1 else "")
+            for child in profile['children']
+        )
+    
+    def child_buttons(self, profile):
+        """One button per child to make it active; none for single-child profiles."""
+        if len(profile['children']) < 2:
+            return []
+        active = active_child(profile)
+        return [[InlineKeyboardButton(("✅ " if child is active else "") + child['name'], callback_data=f"child_{child['id']}")]
+                for child in profile['children']]
+    
+    async def child_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /child: list children, /child add <name> [MM.YYYY] adds one, /child <name or number> switches."""
+        user_id = update.effective_user.id
+        if user_id not in user_data:
+            await update.message.reply_text("Сначала используйте /start")
+            return
+        profile = user_data[user_id]
+        args = context.args or []
+        
+        if args and args[0].lower() in ('add', 'добавить'):
+            birth_month = parse_birth_month(args[-1]) if len(args) > 2 else None
+            name = " ".join(args[1:-1] if birth_month else args[1:]).strip()[:32]
+            if not name:
+                await update.message.reply_text("Укажите имя: /child add Маша 03.2025")
+                return
+            child = add_child(profile, name)
+            if child is None:
+                await update.message.reply_text(f"В профиле может быть не больше {MAX_CHILDREN} детей.")
+                return
+            if birth_month:
+                self.set_birth_month(user_id, birth_month, child)
+            user_store.mark_dirty(user_id)
+            await update.message.reply_text(
+                f"✅ Добавлен ребенок: {child['name']}. Вопросы теперь о нем." +
+                ("" if birth_month else " Укажите возраст: /age ММ.ГГГГ")
+            )
+        elif args:
+            child = switch_child(profile, " ".join(args))
+            if child is None:
+                await update.message.reply_text("Не нашел такого ребенка. Список детей: /child")
+                return
+            user_store.mark_dirty(user_id)
+            await update.message.reply_text(f"✅ Теперь вопросы о ребенке: {child['name']}")
+        else:
+            buttons = self.child_buttons(profile)
+            await update.message.reply_text(
+                f"👶 Дети: {self.children_text(profile)}\n\nДобавить: /child add Имя ММ.ГГГГ",
+                reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
+            )
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular text messages."""
+        await self.answer_question(update, context, update.message.text)
+    
+    async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle voice notes and audio files: transcribe locally, then answer like a text message."""
+        audio = update.message.voice or update.message.audio
+        if self.speech is None:
+            await update.message.reply_text("🎙 Голосовые сообщения пока не поддерживаются. Пожалуйста, напишите вопрос текстом.")
+            return
+        if (audio.duration or 0) > STT_MAX_SECONDS:
+            await update.message.reply_text(f"🎙 Сообщение слишком длинное. Пожалуйста, уложитесь в {STT_MAX_SECONDS} секунд или напишите текстом.")
+            return
+        
+        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
+        handle, path = tempfile.mkstemp(suffix='.ogg', prefix='voice_')
+        os.close(handle)
+        try:
+            voice_file = await audio.get_file()
+            await voice_file.download_to_drive(path)
+            question = await self.speech.transcribe(path)
+        except Exception as e:
+            logger.error(f"Error transcribing voice message: {e}")
+            question = ""
+        finally:
+            os.remove(path)
+        
+        if question is None:
+            await update.message.reply_text("🎙 Сейчас много голосовых сообщений. Попробуйте через минуту или напишите текстом.")
+        elif not question:
+            await update.message.reply_text("🎙 Не удалось разобрать сообщение. Попробуйте еще раз или напишите текстом.")
+        else:
+            await self.answer_question(update, context, question, prefix=f"🎙 «{question}»\n\n")
+    
+    async def answer_question(self, update: Update, context: ContextTypes.DEFAULT_TYPE, message_text, prefix=""):
+        """Answer a question from a text or transcribed voice message and record it in the user's history."""
         user_id = update.effective_user.id
-        message_text = update.message.text
         
         # Initialize user data if not exists
         if user_id not in user_data:
             user_data[user_id] = {
                 'name': update.effective_user.first_name or "Пользователь",
-                'child_age_months': None,
-                'context': '',
-                'conversation_history': [],
+                'children': [new_child(1)],
+                'active_child': 1,
                 'total_questions': 0,
-                'favorite_topics': [],
                 'registration_date': datetime.now().isoformat(),
                 'last_activity': datetime.now().isoformat()
             }
@@ -344,45 +651,38 @@ class EnhancedParentAIBot:
         # Show typing indicator
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
         
-        # Get AI response
-        child_age = user_data[user_id]['child_age_months']
-        user_context = user_data[user_id]['context']
+        # Get AI response for the active child
+        profile = user_data[user_id]
+        child = active_child(profile)
+        child_context = self.child_contexts.get(user_id, profile, child)
+        child_age = child_context.age_months
+        memory = self.memory.build_user_context(child)
+        user_context = "\n".join(part for part in (child_context.prefix, memory) if part)
         
-        response = ai_service.generate_response(message_text, child_age, user_context)
+        # With only the age and topics in the context the answer may be reused for other users during outages
+        response = await self.generate_response(message_text, child_age, user_context, personal=bool(memory) or child_context.named)
         
         # Store conversation
         conversation_item = {
             'question': message_text,
-            'answer': response,
+            # Identical answers are stored once, see answer_store.py
+            'answer_hash': user_store.answers.put(response),
             'timestamp': datetime.now().isoformat(),
             'child_age': child_age
         }
-        user_data[user_id]['conversation_history'].append(conversation_item)
+        child['conversation_history'].append(conversation_item)
         
-        # Update favorite topics
-        topic = ai_service.extract_topic_from_question(message_text)
-        if topic not in user_data[user_id]['favorite_topics']:
-            user_data[user_id]['favorite_topics'].append(topic)
+        # Update topic counters and daily usage
+        topic = get_ai_service().extract_topic_from_question(message_text)
+        analytics.record_question(user_id, topic, child_age)
+        record_topic(child, topic)
         
-        # Save user data
-        self.save_user_data()
-        
-        # Send response
-        await update.message.reply_text(response)
+        # Saved by the write-behind flush
+        user_store.mark_dirty(user_id)
+        self.schedule_memory_refresh(user_id, child)
         
-        # Add quick action buttons for common topics
-        keyboard = [
-            [InlineKeyboardButton("Почему ребенок плачет?", callback_data="quick_crying")],
-            [InlineKeyboardButton("Проблемы со сном", callback_data="quick_sleep")],
-            [InlineKeyboardButton("Занятия по возрасту", callback_data="quick_activities")],
-            [InlineKeyboardButton("История диалогов", callback_data="show_history")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            "Нужна помощь с чем-то еще? Попробуйте эти частые темы:",
-            reply_markup=reply_markup
-        )
+        # Send response with quick action buttons for common topics
+        await reply(update.message, prefix + response, reply_markup=QUICK_ACTIONS_MARKUP)
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries from inline keyboards."""
@@ -395,7 +695,7 @@ class EnhancedParentAIBot:
         if data.startswith("age_"):
             # Handle age selection
             age_months = int(data.split("_")[1])
-            user_data[user_id]['child_age_months'] = age_months
+            self.set_birth_month(user_id, birth_month_from_age(age_months))
             
             age_groups = {
                 1: "0-3 месяца",
@@ -408,6 +708,12 @@ class EnhancedParentAIBot:
             age_group = age_groups.get(age_months, "неизвестно")
             await query.edit_message_text(f"✅ Отлично! Я установил возраст вашего ребенка как {age_group}. Теперь я могу давать более персонализированные советы!")
         
+        elif data.startswith("child_"):
+            child = switch_child(user_data[user_id], data.split("_")[1])
+            if child is not None:
+                user_store.mark_dirty(user_id)
+                await query.edit_message_text(f"✅ Теперь вопросы о ребенке: {child['name']}")
+        
         elif data == "set_age":
             await self.age_command(update, context)
         
@@ -421,38 +727,70 @@ class EnhancedParentAIBot:
             await self.profile_command(update, context)
         
         elif data == "quick_crying":
-            response = ai_service.generate_response(
+            response = await self.generate_response(
                 "Мой ребенок плачет и я не знаю что делать",
-                user_data[user_id]['child_age_months']
+                self.active_age(user_id)
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
         
         elif data == "quick_sleep":
-            response = ai_service.generate_response(
+            response = await self.generate_response(
                 "Как уложить ребенка спать?",
-                user_data[user_id]['child_age_months']
+                self.active_age(user_id)
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
         
         elif data == "quick_activities":
-            response = ai_service.generate_response(
+            response = await self.generate_response(
                 "Какие занятия подходят для возраста моего ребенка?",
-                user_data[user_id]['child_age_months']
+                self.active_age(user_id)
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
         
         elif data == "clear_history":
-            user_data[user_id]['conversation_history'] = []
-            self.save_user_data()
+            child = active_child(user_data[user_id])
+            user_store.answers.release_history(child['conversation_history'])
+            child['conversation_history'] = []
+            child['context'] = ''
+            child['summary_upto'] = 0
+            user_store.mark_dirty(user_id)
             await query.edit_message_text("✅ История диалогов очищена!")
         
         elif data == "back_to_main":
             await query.edit_message_text("Главное меню. Используйте /start для начала работы.")
     
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer inline queries from the precomputed knowledge-base index, without the LLM."""
+        query = update.inline_query
+        results = self.inline_index.inline_results(query.query, context.bot.username)
+        await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+    
+    async def chosen_inline_result(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Generate the AI answer once the user has sent the "ask" result, and put it into that message."""
+        result = update.chosen_inline_result
+        if result.result_id != ASK_RESULT_ID or not result.inline_message_id:
+            return
+        user_id = result.from_user.id
+        question = result.query.strip()
+        child_age = self.active_age(user_id)
+        try:
+            response = await self.generate_response(question, child_age)
+            analytics.record_question(user_id, get_ai_service().extract_topic_from_question(question), child_age)
+            await context.bot.edit_message_text(
+                truncate(response, MESSAGE_LIMIT), inline_message_id=result.inline_message_id
+            )
+        except Exception as e:
+            logger.error(f"Error answering chosen inline result: {e}")
+    
+    def warm_up(self):
+        """Load the OpenAI client and RAG index in the background."""
+        return readiness.warm_up_in_background('ai_service', lambda: get_ai_service().warm_up())
+    
     def run(self):
         """Start the bot."""
         logger.info(f"Starting {BOT_NAME}...")
         self.application.run_polling()
+        self.flush_state()
 
 if __name__ == "__main__":
     bot = EnhancedParentAIBot()
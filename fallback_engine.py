@@ -0,0 +1,171 @@
+"""
+Запасные ответы, когда книга, RAG система или OpenAI недоступны
+
+Шаблоны для каждой пары (тема, возрастная группа) собираются один раз при
+создании движка: готовый совет из таблицы запасных ответов и пункты базы
+знаний Петрановской для этого возраста. При ответе остается подставить только
+вопрос. Если вопрос почти так же похож на вторую тему, добавляется заранее
+собранный блок с ее советами.
+
+Удачные ответы LLM запоминаются по теме и возрастной группе. При сбое на
+похожий вопрос отдается такой ответ, а не шаблон. Ответы, сгенерированные с
+памятью диалога или именем ребенка в контексте, не запоминаются: в них могут
+быть подробности семьи. Возраст ребенка и частые темы этому не мешают.
+"""
+
+import threading
+from collections import deque, namedtuple
+
+from petranovskaya_knowledge_base import PETRANOVSKAYA_KNOWLEDGE
+from reranker import stems
+
+# Разделы базы знаний для возрастной группы, от самых точных к общим
+AGE_SECTIONS = {
+    "0-3_months": ("age_0_3_months", "age_0_2_years"),
+    "3-12_months": ("age_3_6_months", "age_6_12_months", "age_0_2_years"),
+    "1-3_years": ("age_1_3_years", "age_2_3_years", "age_0_2_years", "age_2_4_years"),
+}
+# Ключи таблицы запасных ответов, подходящие возрастной группе
+FALLBACK_AGE_KEYS = {
+    "0-3_months": ("0-3_months",),
+    "3-12_months": ("3-12_months",),
+    "1-3_years": ("1-3_years", "2-3_years"),
+}
+MISTAKES_SECTIONS = ("common_mistakes",)
+SECTION_ORDER = ("petranovskaya_approach", "key_principles", "what_to_do", "core_beliefs", "success_principles",
+                 "sleep_tips", "setting_boundaries", "tantrums", "motor_skills", "speech_development", "description")
+DEFAULT_TOPIC = "parenting_philosophy"
+DEFAULT_MISTAKES = [
+    "Не наказывайте отказом в любви",
+    "Не игнорируйте эмоции ребенка",
+    "Не сравнивайте с другими детьми",
+]
+
+INTROS = {
+    # В книге нет фрагментов по вопросу
+    'not_found': "Извините, но я не нашел в книге \"Тайная опора\" фрагментов именно об этом. Вот что советует Людмила Петрановская по этой теме.",
+    # Индекс книги не загружен
+    'no_rag': "Сейчас я не могу обратиться к тексту книги \"Тайная опора\", поэтому отвечаю по базе знаний Петрановской.",
+    # OpenAI или генерация ответа недоступны
+    'error': "Извините, сейчас я не могу подготовить подробный ответ. Вот что советует Людмила Петрановская по этой теме.",
+}
+SIMILAR_INTRO = "Сейчас я работаю в упрощенном режиме. Вот мой недавний ответ на очень похожий вопрос:\n\n"
+FOOTER = """**Поддержка:** Помните, что вы - хороший родитель, и ваша любовь - это самое важное для ребенка.
+
+Попробуйте задать вопрос чуть позже - тогда я отвечу подробнее. Чем еще могу помочь?"""
+
+Template = namedtuple('Template', 'head tail')
+
+
+def section_items(value):
+    return value if isinstance(value, list) else [str(value)]
+
+
+def knowledge_snippets(topic, age_group, knowledge=PETRANOVSKAYA_KNOWLEDGE):
+    """(советы, ошибки) из базы знаний: сначала разделы для возраста, потом общие"""
+    sections = knowledge.get(topic, {})
+    ordered = [name for name in AGE_SECTIONS.get(age_group, ()) if name in sections]
+    ordered += [name for name in SECTION_ORDER if name in sections]
+    advice = list(dict.fromkeys(item for name in ordered for item in section_items(sections[name])))
+    mistakes = [item for name in MISTAKES_SECTIONS if name in sections for item in section_items(sections[name])]
+    return advice, mistakes
+
+
+class FallbackEngine:
+    def __init__(self, fallback_table, topic_keywords, knowledge=PETRANOVSKAYA_KNOWLEDGE,
+                 answers_per_topic=32, min_similarity=0.5, max_advice=6):
+        """
+        fallback_table - {тема: {возрастная группа: готовый совет}}
+        topic_keywords - ключевые слова тем для оценки, насколько вопрос похож на каждую тему
+        answers_per_topic - сколько ответов LLM помнить на пару (тема, возраст), 0 - не запоминать
+        min_similarity - доля общих основ слов, при которой вопрос считается похожим
+        """
+        self.topic_keywords = topic_keywords
+        self.answers_per_topic = answers_per_topic
+        self.min_similarity = min_similarity
+        self.templates = {}
+        self.extras = {}
+        self.served = {'template': 0, 'similar_answer': 0}
+        self._answers = {}
+        self._lock = threading.Lock()
+
+        topics = list(dict.fromkeys([*topic_keywords, *knowledge, *fallback_table]))
+        for topic in topics:
+            for age_group in AGE_SECTIONS:
+                advice, mistakes = knowledge_snippets(topic, age_group, knowledge)
+                ready = next((fallback_table[topic][key] for key in FALLBACK_AGE_KEYS[age_group]
+                              if key in fallback_table.get(topic, {})), "")
+                body = self._body(ready, advice[:max_advice], mistakes[:3] or DEFAULT_MISTAKES)
+                for reason, intro in INTROS.items():
+                    self.templates[(reason, topic, age_group)] = Template(f"{intro}\n\nВопрос: ", f"\n\n{body}")
+                if advice:
+                    self.extras[(topic, age_group)] = "\n".join(f"- {item}" for item in advice[:2])
+
+    @staticmethod
+    def _body(ready, advice, mistakes):
+        parts = []
+        if ready:
+            parts.append(f"**Краткий ответ:** {ready}")
+        if advice:
+            parts.append("**Что делать:**\n" + "\n".join(f"{i}. {item}" for i, item in enumerate(advice, 1)))
+        parts.append("**Что НЕ делать:**\n" + "\n".join(f"- {item}" for item in mistakes))
+        parts.append("**Источники:** Книга \"Тайная опора\" Людмилы Петрановской")
+        parts.append(FOOTER)
+        return "\n\n".join(parts)
+
+    def topic_scores(self, question):
+        """[(тема, число совпавших ключевых слов)] по убыванию"""
+        question_lower = question.lower()
+        scores = [(topic, sum(keyword in question_lower for keyword in keywords))
+                  for topic, keywords in self.topic_keywords.items()]
+        return sorted((item for item in scores if item[1]), key=lambda item: -item[1])
+
+    def respond(self, question, topic, age_group, reason='error'):
+        """Похожий недавний ответ LLM или шаблон для темы и возраста с подставленным вопросом"""
+        age_group = age_group if age_group in AGE_SECTIONS else "1-3_years"
+        similar = self.similar_answer(question, topic, age_group)
+        if similar is not None:
+            with self._lock:
+                self.served['similar_answer'] += 1
+            return SIMILAR_INTRO + similar
+
+        template = self.templates.get((reason, topic, age_group)) or self.templates[(reason, DEFAULT_TOPIC, age_group)]
+        answer = template.head + question + template.tail
+        # Вопрос почти так же похож на другую тему: добавляем и ее советы
+        scores = self.topic_scores(question)
+        second = next((name for name, score in scores if name != topic and score * 2 >= scores[0][1]), None)
+        if second and (second, age_group) in self.extras:
+            answer += f"\n\n**Также по теме:**\n{self.extras[(second, age_group)]}"
+        with self._lock:
+            self.served['template'] += 1
+        return answer
+
+    def remember(self, question, topic, age_group, answer):
+        """Запоминает удачный ответ LLM для ответов во время сбоя"""
+        if not self.answers_per_topic or not answer:
+            return
+        words = frozenset(stems(question))
+        if not words:
+            return
+        with self._lock:
+            answers = self._answers.setdefault((topic, age_group), deque(maxlen=self.answers_per_topic))
+            answers.append((words, answer))
+
+    def similar_answer(self, question, topic, age_group):
+        with self._lock:
+            candidates = list(self._answers.get((topic, age_group), ()))
+        words = stems(question) if candidates else None
+        if not words:
+            return None
+        best, best_score = None, self.min_similarity
+        # Свежие ответы в конце очереди, при равной похожести берем их
+        for known, answer in reversed(candidates):
+            score = len(words & known) / len(words | known)
+            if score > best_score or (best is None and score >= best_score):
+                best, best_score = answer, score
+        return best
+
+    def stats(self):
+        with self._lock:
+            remembered = sum(len(answers) for answers in self._answers.values())
+        return {**self.served, 'templates': len(self.templates), 'remembered_answers': remembered}
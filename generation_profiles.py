@@ -0,0 +1,131 @@
+"""
+Профили генерации: модель, max_tokens и формат ответа под тип вопроса
+
+Короткий фактический вопрос ("сколько должен спать ребенок в 4 месяца")
+получает краткий ответ от быстрой модели, сложные вопросы о привязанности и
+дисциплине - подробный формат. Каждый вызов учитывается по профилю, чтобы
+сравнивать задержку и стоимость.
+"""
+
+import re
+import threading
+
+from config import GENERATION_MODEL, GENERATION_MODEL_FAST
+
+# USD за 1K токенов (prompt, completion); для неизвестных моделей стоимость не считается
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.005, 0.015),
+}
+
+QUICK_QUESTION_RE = re.compile(
+    r'^(сколько|во сколько|когда|нормально ли|можно ли|нужно ли|с какого|до какого|how many|how much|how long|when|is it normal|can i|should i)\b',
+    re.IGNORECASE
+)
+DEEP_TOPICS = {'attachment_theory', 'parenting_philosophy', 'discipline_and_boundaries', 'kindergarten_adaptation'}
+SENTENCE_END_RE = re.compile(r'[.!?…](?=\s|$)')
+
+
+class GenerationProfile:
+    def __init__(self, name, model, max_tokens, temperature, answer_format, stop=None):
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.answer_format = answer_format  # brief | standard | detailed, см. enhanced_ai_service.ANSWER_FORMATS
+        self.stop = stop
+
+    def request_options(self):
+        """Параметры для chat.completions.create"""
+        options = {
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'temperature': self.temperature
+        }
+        if self.stop:
+            options['stop'] = self.stop
+        return options
+
+
+PROFILES = {
+    # Стоп-последовательности обрывают ответ до разделов, которых нет в формате
+    'brief': GenerationProfile('brief', GENERATION_MODEL_FAST, 400, 0.3, 'brief', stop=["\n4."]),
+    'standard': GenerationProfile('standard', GENERATION_MODEL, 700, 0.7, 'standard', stop=["\n6."]),
+    'detailed': GenerationProfile('detailed', GENERATION_MODEL, 1000, 0.7, 'detailed'),
+}
+
+
+def keyword_confidence(question_lower, topic_keywords, topic):
+    """Доля совпавших ключевых слов, относящихся к выбранной теме (0, если совпадений нет)"""
+    hits = {name: sum(keyword in question_lower for keyword in keywords) for name, keywords in topic_keywords.items()}
+    total = sum(hits.values())
+    return hits.get(topic, 0) / total if total else 0.0
+
+
+def select_profile(question, topic, confidence):
+    """Выбирает профиль по длине вопроса, теме и уверенности классификатора"""
+    # Возраст ребенка и память диалога в контексте есть почти всегда, поэтому выбор зависит только от вопроса
+    words = len(question.split())
+    if QUICK_QUESTION_RE.match(question.strip()) and words <= 12:
+        return PROFILES['brief']
+    if words > 40 or (topic in DEEP_TOPICS and confidence >= 0.5):
+        return PROFILES['detailed']
+    return PROFILES['standard']
+
+
+def apply_length_policy(text, finish_reason):
+    """Ответ, обрезанный по max_tokens, заканчивается на полуслове: убираем незаконченный хвост"""
+    text = text.strip()
+    if finish_reason != 'length':
+        return text
+    ends = list(SENTENCE_END_RE.finditer(text))
+    if ends and ends[-1].end() > len(text) * 0.5:
+        return text[:ends[-1].end()]
+    return text
+
+
+class ProfileStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, profile, latency_ms, usage=None, finish_reason=None):
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        price_in, price_out = MODEL_PRICES.get(profile.model, (0.0, 0.0))
+        with self._lock:
+            stats = self._stats.setdefault(profile.name, {
+                'model': profile.model, 'calls': 0, 'latency_ms': 0.0, 'prompt_tokens': 0,
+                'completion_tokens': 0, 'truncated': 0, 'cost_usd': 0.0
+            })
+            stats['calls'] += 1
+            stats['latency_ms'] += latency_ms
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['truncated'] += finish_reason == 'length'
+            stats['cost_usd'] += (prompt_tokens * price_in + completion_tokens * price_out) / 1000
+
+    def snapshot(self):
+        """Средние значения по профилям для /health и prompt_eval"""
+        with self._lock:
+            return {
+                name: {
+                    'model': stats['model'],
+                    'calls': stats['calls'],
+                    'avg_latency_ms': round(stats['latency_ms'] / stats['calls'], 1),
+                    'avg_prompt_tokens': round(stats['prompt_tokens'] / stats['calls'], 1),
+                    'avg_completion_tokens': round(stats['completion_tokens'] / stats['calls'], 1),
+                    'truncated_rate': round(stats['truncated'] / stats['calls'], 3),
+                    'cost_usd': round(stats['cost_usd'], 6)
+                }
+                for name, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+# Общая статистика процесса
+profile_stats = ProfileStats()
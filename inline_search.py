@@ -0,0 +1,171 @@
+"""
+Поиск для inline режима: мгновенные ответы из базы знаний без обращения к LLM
+
+Индекс строится один раз при старте из разделов PETRANOVSKAYA_KNOWLEDGE и
+заранее отформатированных ответов по темам. Пока пользователь печатает,
+запрос сопоставляется по триграммам для полных слов и по префиксу для
+последнего, недописанного слова. Ответ LLM генерируется только когда
+пользователь выбирает результат "Спросить ParentAI".
+"""
+
+import bisect
+import heapq
+import re
+from collections import Counter, defaultdict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+
+from message_renderer import PARSE_MODE, bold, escape_html, italic, render_markdown, truncate
+from petranovskaya_knowledge_base import PETRANOVSKAYA_KNOWLEDGE, format_petranovskaya_response
+from retrieval_cache import LRUCache
+from telegram_sender import MESSAGE_LIMIT
+
+WORD_RE = re.compile(r'\w+')
+ASK_RESULT_ID = 'ask'
+MIN_SCORE = 0.3
+MIN_PREFIX = 2
+
+TOPIC_TITLES = {
+    "attachment_theory": "Привязанность",
+    "crying_and_comfort": "Плач и утешение",
+    "sleep_issues": "Сон",
+    "discipline_and_boundaries": "Границы и истерики",
+    "development_milestones": "Развитие",
+    "parenting_philosophy": "Принципы воспитания",
+    "reading_interest": "Любовь к чтению",
+    "kindergarten_adaptation": "Адаптация к садику",
+}
+SECTION_TITLES = {
+    "description": "Коротко о главном",
+    "key_principles": "Ключевые принципы",
+    "petranovskaya_approach": "Подход Петрановской",
+    "what_to_do": "Что делать",
+    "common_mistakes": "Частые ошибки",
+    "sleep_tips": "Советы по сну",
+    "setting_boundaries": "Как ставить границы",
+    "tantrums": "Истерики",
+    "motor_skills": "Моторика",
+    "speech_development": "Развитие речи",
+    "core_beliefs": "Основные убеждения",
+    "success_principles": "Что помогает",
+    "age_0_3_months": "0-3 месяца",
+    "age_3_6_months": "3-6 месяцев",
+    "age_6_12_months": "6-12 месяцев",
+    "age_1_3_years": "1-3 года",
+    "age_0_2_years": "0-2 года",
+    "age_2_3_years": "2-3 года",
+    "age_2_4_years": "2-4 года",
+    "age_3_4_years": "3-4 года",
+    "age_4_6_years": "4-6 лет",
+}
+SOURCE_NOTE = "По книге Людмилы Петрановской «Тайная опора»"
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def knowledge_documents(knowledge=PETRANOVSKAYA_KNOWLEDGE):
+    """(заголовок, текст для поиска, описание, сообщение в HTML) для тем и разделов базы знаний"""
+    documents = []
+    for topic, sections in knowledge.items():
+        topic_title = TOPIC_TITLES.get(topic, topic.replace('_', ' '))
+        searchable = " ".join(
+            " ".join(value) if isinstance(value, list) else str(value) for value in sections.values()
+        )
+        answer = render_markdown(format_petranovskaya_response(topic))
+        documents.append((topic_title, f"{topic_title} {searchable}", "Готовый ответ по теме", answer))
+
+        for section, value in sections.items():
+            items = value if isinstance(value, list) else [str(value)]
+            title = f"{topic_title} · {SECTION_TITLES.get(section, section.replace('_', ' '))}"
+            body = "\n".join(f"• {item}" for item in items)
+            message = f"{bold(title)}\n\n{escape_html(truncate(body, MESSAGE_LIMIT - 300))}\n\n{italic(SOURCE_NOTE)}"
+            documents.append((title, f"{title} {body}", truncate(items[0], 100), message))
+    return documents
+
+
+class InlineIndex:
+    def __init__(self, documents=None, limit=10, cache_size=2048):
+        self.limit = limit
+        self.results = []
+        self.postings = defaultdict(set)
+        self.word_docs = defaultdict(set)
+        self.words = []
+        self.cache = LRUCache(cache_size)
+        for doc_id, (title, text, description, message) in enumerate(documents or knowledge_documents()):
+            self.results.append(InlineQueryResultArticle(
+                id=f"kb{doc_id}",
+                title=title,
+                description=description,
+                input_message_content=InputTextMessageContent(message, parse_mode=PARSE_MODE)
+            ))
+            for word in set(WORD_RE.findall(normalize(text))):
+                self.word_docs[word].add(doc_id)
+                for gram in trigrams(word):
+                    self.postings[gram].add(doc_id)
+        self.words = sorted(self.word_docs)
+
+    def _prefix_docs(self, prefix):
+        docs = set()
+        position = bisect.bisect_left(self.words, prefix)
+        while position < len(self.words) and self.words[position].startswith(prefix):
+            docs |= self.word_docs[self.words[position]]
+            position += 1
+        return docs
+
+    def search(self, query):
+        """Номера документов, лучшие первыми; повторные запросы берутся из кэша"""
+        key = " ".join(WORD_RE.findall(normalize(query)))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        words = key.split()
+        if not words:
+            found = list(range(min(self.limit, len(self.results))))
+        else:
+            # Последнее слово пользователь, скорее всего, еще печатает
+            complete, partial = (words, None) if query[-1:].isspace() else (words[:-1], words[-1])
+            grams = set().union(*(trigrams(word) for word in complete)) if complete else set()
+            scores = Counter()
+            for gram in grams:
+                for doc_id in self.postings.get(gram, ()):
+                    scores[doc_id] += 1
+            weight = len(grams)
+            if partial is not None and len(partial) >= MIN_PREFIX:
+                # Совпадение префикса весит как полностью совпавшее слово
+                bonus = max(len(trigrams(partial)), 1)
+                for doc_id in self._prefix_docs(partial):
+                    scores[doc_id] += bonus
+                weight += bonus
+            best = heapq.nlargest(self.limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            found = [doc_id for doc_id, score in best if weight and score / weight >= MIN_SCORE]
+
+        self.cache.put(key, found)
+        return found
+
+    def inline_results(self, query, bot_username):
+        """Результаты для answerInlineQuery: "Спросить ParentAI" и найденные разделы базы знаний"""
+        results = []
+        question = query.strip()
+        if question:
+            # Клавиатура нужна, чтобы Telegram прислал inline_message_id в chosen_inline_result
+            button = InlineKeyboardButton("Открыть ParentAI", url=f"https://t.me/{bot_username}")
+            results.append(InlineQueryResultArticle(
+                id=ASK_RESULT_ID,
+                title=f"Спросить ParentAI: {truncate(question, 60)}",
+                description="Подробный ответ по книге появится в сообщении через несколько секунд",
+                input_message_content=InputTextMessageContent(
+                    f"❓ {bold(truncate(question, 500))}\n\n{italic('Готовлю ответ по книге «Тайная опора»…')}",
+                    parse_mode=PARSE_MODE
+                ),
+                reply_markup=InlineKeyboardMarkup([[button]])
+            ))
+        results.extend(self.results[doc_id] for doc_id in self.search(query))
+        return results
@@ -0,0 +1,96 @@
+"""
+Process lifecycle for ParentAI Bot: signal handling and graceful shutdown.
+
+On SIGTERM/SIGINT the runtime stops accepting updates, waits for in-flight
+AI generations up to a deadline and then flushes modified user profiles,
+so write-behind persistence never loses acknowledged messages. The periodic
+write-behind loop of the stores (write_behind) finishes a flush under way
+when it is cancelled.
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LifecycleManager:
+    def __init__(self):
+        self.accepting = True
+        self.in_flight = 0
+        self.stop_event = None
+        self._idle = None
+
+    def reset(self):
+        """Prepare for a new run on the current event loop."""
+        self.accepting = True
+        self.in_flight = 0
+        self.stop_event = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_stop, sig)
+            except (NotImplementedError, RuntimeError):
+                # Windows: fall back to a plain handler that hops onto the loop
+                signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(self.request_stop, signum))
+
+    def request_stop(self, sig=None):
+        if self.stop_event is not None and not self.stop_event.is_set():
+            print(f"🛑 Received {signal.Signals(sig).name if sig else 'stop'}, shutting down...")
+            self.stop_event.set()
+
+    def stop_accepting(self):
+        self.accepting = False
+
+    @asynccontextmanager
+    async def track(self):
+        """Count an in-flight generation so shutdown can wait for it."""
+        self.in_flight += 1
+        if self._idle is not None:
+            self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if self.in_flight == 0 and self._idle is not None:
+                self._idle.set()
+
+    async def drain(self, timeout):
+        """Wait until no generations are in flight. Returns how many were still running at the deadline."""
+        if self._idle is None or self.in_flight == 0:
+            return 0
+        started = time.perf_counter()
+        logger.info(f"Waiting for {self.in_flight} in-flight generations (deadline {timeout}s)")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.in_flight} generations still running after {timeout}s, giving up on them")
+            return self.in_flight
+        logger.info(f"In-flight generations drained in {time.perf_counter() - started:.1f}s")
+        return 0
+
+
+async def write_behind(flush, interval, what):
+    """Await flush() every `interval` seconds until cancelled; flush returns the number of records written."""
+    while True:
+        await asyncio.sleep(interval)
+        running = asyncio.ensure_future(flush())
+        try:
+            written = await asyncio.shield(running)
+        except asyncio.CancelledError:
+            # The write goes on in its thread; finish it so its snapshot is neither lost nor written twice
+            await running
+            raise
+        if written:
+            logger.debug(f"Write-behind flushed {written} {what}")
+
+
+# Shared lifecycle state for the running process
+lifecycle = LifecycleManager()
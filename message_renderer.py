@@ -0,0 +1,81 @@
+"""
+Safe rendering of formatted bot messages.
+
+Telegram rejects a whole message when its markup does not parse, and user names,
+topic ids like crying_and_comfort or LLM answers easily break legacy Markdown.
+Screens are therefore sent as HTML: dynamic text is escaped with a precompiled
+translation table and truncated on grapheme boundaries before escaping, so a
+cut never lands inside an entity. Static screens are rendered once at import.
+"""
+
+import re
+import unicodedata
+
+PARSE_MODE = 'HTML'
+
+HTML_TABLE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+BOLD_RE = re.compile(r'\*\*(.+?)\*\*')
+ITALIC_RE = re.compile(r'\*(?!\s)(.+?)(?<!\s)\*')
+
+ZWJ = '‍'
+
+
+def escape_html(text):
+    return str(text).translate(HTML_TABLE)
+
+
+def bold(text):
+    return f"<b>{escape_html(text)}</b>"
+
+
+def italic(text):
+    return f"<i>{escape_html(text)}</i>"
+
+
+def _extends_previous(char):
+    """True for code points that belong to the grapheme before them (accents, emoji modifiers, ZWJ)."""
+    code = ord(char)
+    return (
+        unicodedata.combining(char)
+        or char == ZWJ
+        or 0xFE00 <= code <= 0xFE0F  # variation selectors
+        or 0x1F3FB <= code <= 0x1F3FF  # skin tones
+        or 0xE0020 <= code <= 0xE007F  # emoji tag sequences
+    )
+
+
+def _is_regional_indicator(char):
+    return 0x1F1E6 <= ord(char) <= 0x1F1FF
+
+
+def grapheme_cut(text, limit):
+    """Largest cut position <= limit that does not split a grapheme cluster."""
+    if len(text) <= limit:
+        return len(text)
+    cut = limit
+    while cut > 0 and (_extends_previous(text[cut]) or text[cut - 1] == ZWJ):
+        cut -= 1
+    if cut > 0 and _is_regional_indicator(text[cut]):
+        # Flags are pairs of regional indicators: do not keep half of one
+        start = cut
+        while start > 0 and _is_regional_indicator(text[start - 1]):
+            start -= 1
+        if (cut - start) % 2:
+            cut -= 1
+    return cut
+
+
+def truncate(text, limit, ellipsis='…'):
+    """Shorten raw text to at most limit characters (ellipsis included) without splitting graphemes."""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return text[:grapheme_cut(text, limit - len(ellipsis))].rstrip() + ellipsis
+
+
+def render_markdown(text):
+    """Render the bot's **bold** / *italic* screen markup as escaped HTML."""
+    html = escape_html(text)
+    html = BOLD_RE.sub(r'<b>\1</b>', html)
+    return ITALIC_RE.sub(r'<i>\1</i>', html)
@@ -0,0 +1,20 @@
+"""
+Shared OpenAI client, created lazily on first use.
+"""
+
+import threading
+from config import OPENAI_API_KEY, OPENAI_BASE_URL
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    """Return the process-wide OpenAI client, importing openai only when first needed."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    return _client
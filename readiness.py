@@ -0,0 +1,80 @@
+"""
+Readiness tracking so health checks can answer while heavy services warm up.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+
+class ReadinessState:
+    def __init__(self):
+        self.started_at = time.time()
+        self.components = {}
+        self._lock = threading.Lock()
+
+    def register(self, name):
+        """Register a component that must warm up before the bot is fully ready."""
+        with self._lock:
+            self.components.setdefault(name, {'status': PENDING})
+
+    def mark(self, name, status, **details):
+        with self._lock:
+            self.components[name] = {'status': status, **details}
+
+    @property
+    def status(self):
+        with self._lock:
+            statuses = [component['status'] for component in self.components.values()]
+        if not statuses:
+            return "starting"
+        if all(status == READY for status in statuses):
+            return READY
+        if any(status in (PENDING, WARMING) for status in statuses):
+            return WARMING
+        return "degraded"
+
+    @property
+    def is_ready(self):
+        return self.status == READY
+
+    def snapshot(self):
+        """JSON-serializable view for /health and /ready endpoints."""
+        with self._lock:
+            components = {name: dict(info) for name, info in self.components.items()}
+        return {
+            'status': self.status,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'components': components
+        }
+
+    def warm_up_in_background(self, name, func):
+        """Run func in a daemon thread and record how long it took (a returned dict is kept as details)."""
+        self.register(name)
+
+        def run():
+            self.mark(name, WARMING)
+            started = time.perf_counter()
+            try:
+                result = func()
+            except Exception as e:
+                logger.error(f"Warm-up of {name} failed: {e}")
+                self.mark(name, FAILED, error=str(e))
+                return
+            details = result if isinstance(result, dict) else {}
+            self.mark(name, READY, seconds=round(time.perf_counter() - started, 3), **details)
+            logger.info(f"{name} is ready")
+
+        thread = threading.Thread(target=run, name=f"warmup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+
+readiness = ReadinessState()
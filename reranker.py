@@ -0,0 +1,158 @@
+"""
+Переранжирование найденных фрагментов книги
+
+Поиск по эмбеддингам берет кандидатов с запасом, реранкер пересчитывает их
+по совпадению слов с вопросом (или локальным cross-encoder) и оставляет только
+лучшие фрагменты. Если реранкер не укладывается в бюджет времени, используется
+исходный порядок.
+"""
+
+import abc
+import logging
+import math
+import re
+import time
+
+from retrieval_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+RERANKER_KINDS = ('none', 'lexical', 'cross-encoder')
+WORD_RE = re.compile(r'\w+')
+STOPWORDS = {
+    'как', 'что', 'это', 'если', 'для', 'она', 'он', 'они', 'мой', 'моя', 'мои', 'меня', 'его', 'ему', 'ее', 'её',
+    'все', 'так', 'уже', 'или', 'когда', 'почему', 'очень', 'можно', 'нужно', 'ребенок', 'ребенка', 'ребенку',
+    'the', 'and', 'for', 'with', 'what', 'how', 'why', 'when', 'does', 'my', 'child', 'baby'
+}
+
+
+def stems(text, prefix=5):
+    """Грубая основа слова: первые буквы, чтобы "плачет" и "плач" совпадали"""
+    return {word[:prefix] for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+            if len(word) > 2 and word not in STOPWORDS}
+
+
+class Reranker(abc.ABC):
+    def __init__(self, budget_ms=15, keep_ratio=0.6, dense_weight=0.5):
+        """
+        budget_ms - жесткий бюджет на один вопрос, при превышении остается порядок поиска
+        keep_ratio - фрагменты со score ниже keep_ratio * лучший отбрасываются
+        dense_weight - вес косинусной близости в итоговом score
+        """
+        self.budget_ms = budget_ms
+        self.keep_ratio = keep_ratio
+        self.dense_weight = dense_weight
+        self.avg_ms = 0.0
+        self.reranked = 0
+        self.skipped = 0
+        self.dropped_chunks = 0
+
+    @abc.abstractmethod
+    def score(self, question, indices, chunks, deadline):
+        """Оценки релевантности фрагментов вопросу; None, если не успели до deadline"""
+
+    def rerank(self, question, hits, chunks, keep):
+        """hits - [(score, chunk_index)] от поиска; возвращает не более keep лучших"""
+        if len(hits) <= 1:
+            return list(hits[:keep])
+        if self.avg_ms > self.budget_ms:
+            # Последние вызовы были слишком медленными: пропускаем, но даем шанс позже
+            self.avg_ms *= 0.8
+            self.skipped += 1
+            return list(hits[:keep])
+
+        started = time.perf_counter()
+        scores = self.score(question, [index for _, index in hits], chunks, started + self.budget_ms / 1000)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.avg_ms = 0.8 * self.avg_ms + 0.2 * elapsed_ms if self.reranked + self.skipped else elapsed_ms
+        if scores is None or elapsed_ms > self.budget_ms:
+            self.skipped += 1
+            return list(hits[:keep])
+
+        combined = [
+            self.dense_weight * dense + (1 - self.dense_weight) * other
+            for dense, other in zip(min_max([score for score, _ in hits]), min_max(scores))
+        ]
+        order = sorted(range(len(hits)), key=lambda i: combined[i], reverse=True)[:keep]
+        best = combined[order[0]]
+        selected = [hits[i] for i in order if combined[i] >= self.keep_ratio * best]
+        self.reranked += 1
+        self.dropped_chunks += keep - len(selected)
+        return selected
+
+    def stats(self):
+        return {
+            'reranked': self.reranked,
+            'skipped_over_budget': self.skipped,
+            'dropped_chunks': self.dropped_chunks,
+            'avg_ms': round(self.avg_ms, 3)
+        }
+
+
+class LexicalReranker(Reranker):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._chunk_stems = LRUCache(4096)
+
+    def chunk_stems(self, index, chunks):
+        found = self._chunk_stems.get(index)
+        if found is None:
+            found = stems(chunks[index])
+            self._chunk_stems.put(index, found)
+        return found
+
+    def score(self, question, indices, chunks, deadline):
+        """Доля слов вопроса в фрагменте с IDF по кандидатам: общие для всех слова почти не весят"""
+        query = stems(question)
+        if not query:
+            return [0.0] * len(indices)
+
+        documents = []
+        for index in indices:
+            if time.perf_counter() > deadline:
+                return None
+            documents.append(self.chunk_stems(index, chunks))
+
+        weights = {term: math.log(1 + len(documents) / (1 + sum(term in doc for doc in documents))) for term in query}
+        total = sum(weights.values()) or 1.0
+        return [sum(weights[term] for term in query if term in doc) / total for doc in documents]
+
+
+class CrossEncoderReranker(Reranker):
+    def __init__(self, model_name, *args, batch_size=4, **kwargs):
+        """batch_size - кандидатов на один вызов модели; между вызовами проверяется deadline"""
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise RuntimeError("Для cross-encoder установите пакет sentence-transformers или используйте RERANKER=lexical")
+        self.model = CrossEncoder(model_name, device='cpu')
+
+    def score(self, question, indices, chunks, deadline):
+        """Оценки модели небольшими пачками, чтобы бросить работу, как только вышел бюджет"""
+        scores = []
+        for start in range(0, len(indices), self.batch_size):
+            if time.perf_counter() > deadline:
+                return None
+            pairs = [(question, chunks[index]) for index in indices[start:start + self.batch_size]]
+            scores.extend(float(score) for score in self.model.predict(pairs, batch_size=self.batch_size))
+        return scores
+
+
+def min_max(values):
+    low, high = min(values), max(values)
+    if high - low < 1e-9:
+        return [1.0] * len(values)
+    return [(value - low) / (high - low) for value in values]
+
+
+def create_reranker(kind, model_name=None, budget_ms=15):
+    """Создает реранкер по имени из конфигурации; None - без переранжирования"""
+    if kind not in RERANKER_KINDS:
+        raise ValueError(f"Неизвестный реранкер: {kind}")
+    if kind == 'lexical':
+        return LexicalReranker(budget_ms)
+    if kind == 'cross-encoder':
+        return CrossEncoderReranker(model_name, budget_ms)
+    return None
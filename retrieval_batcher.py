@@ -0,0 +1,99 @@
+"""
+Микро-батчинг поиска по книге для одновременных вопросов
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalBatcher:
+    def __init__(self, rag_system, window_ms=5, max_batch=32, threads=4):
+        """
+        Собирает вопросы из потоков генерации в течение window_ms и ищет их одним
+        запросом эмбеддингов и одним умножением матриц в BookRAGSystem.submit_many.
+        Собранный батч уходит в один из threads потоков, и пока он ждет эмбеддинги
+        или пул процессов, собирается и отправляется следующий
+        """
+        self.rag_system = rag_system
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.queries = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="retrieval-batch")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def search(self, question, max_chunks=3):
+        """Блокирующий поиск: ставит вопрос в очередь и ждет результат своего батча"""
+        future = Future()
+        self._queue.put((question, max_chunks, future))
+        return future.result()
+
+    def get_context_for_question(self, question, max_chunks=3):
+        """Тот же интерфейс, что у BookRAGSystem"""
+        return self.rag_system.format_context(self.search(question, max_chunks))
+
+    def _collect(self):
+        """Берет первый запрос и добирает остальные, пока не истечет окно"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._executor.submit(self._search, batch)
+            except Exception as e:
+                self._fail(batch, e)
+
+    def _search(self, batch):
+        max_chunks = max(item[1] for item in batch)
+        try:
+            searched = self.rag_system.submit_many([item[0] for item in batch], max_chunks)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        searched.add_done_callback(lambda searched: self._finish(batch, searched))
+
+    def _finish(self, batch, searched):
+        """Раздает результаты батча ждущим потокам; выполняется в потоке, завершившем поиск"""
+        try:
+            results = searched.result()
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.queries += len(batch)
+        for (_, k, future), found in zip(batch, results):
+            future.set_result(found[:k])
+
+    def _fail(self, batch, error):
+        logger.error(f"Ошибка пакетного поиска по книге: {error}")
+        for _, _, future in batch:
+            future.set_exception(error)
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self.rag_system.close(wait)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'queries': self.queries,
+            'avg_batch_size': round(self.queries / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,143 @@
+"""
+Кэш результатов поиска по книге и общее хранилище текстов фрагментов
+
+RetrievalCache запоминает найденные фрагменты по нормализованному тексту вопроса
+(тогда не нужен даже запрос эмбеддинга) и по "корзине" эмбеддинга, куда попадают
+почти одинаковые формулировки. Собранный контекст кэшируется по набору фрагментов.
+ChunkTextStore держит тексты всех фрагментов в одном mmap-буфере и отдает их по смещениям.
+"""
+
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(question):
+    """Приводит вопрос к виду, в котором совпадают формулировки, отличающиеся регистром и знаками"""
+    text = PUNCTUATION_RE.sub(' ', question.lower().replace('ё', 'е'))
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        """Потокобезопасный LRU кэш: к поиску обращаются потоки генерации"""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+class RetrievalCache:
+    def __init__(self, maxsize=1024, context_maxsize=256, bucket_bits=64, seed=0):
+        """
+        maxsize - сколько результатов поиска хранить (по тексту и по корзине эмбеддинга)
+        context_maxsize - сколько собранных контекстов хранить
+        bucket_bits - число случайных гиперплоскостей SimHash: больше - корзины уже
+        """
+        self.queries = LRUCache(maxsize)
+        self.buckets = LRUCache(maxsize)
+        self.contexts = LRUCache(context_maxsize)
+        self.bucket_bits = bucket_bits
+        self.seed = seed
+        self._planes = None
+
+    def bucket_key(self, query_vector, k):
+        """SimHash эмбеддинга: знаки проекций на случайные гиперплоскости"""
+        if self._planes is None or self._planes.shape[1] != len(query_vector):
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal((self.bucket_bits, len(query_vector))).astype(np.float32)
+        bits = np.packbits(self._planes @ np.asarray(query_vector, dtype=np.float32) > 0)
+        return bits.tobytes(), k
+
+    def stats(self):
+        return {'queries': self.queries.stats(), 'buckets': self.buckets.stats(), 'contexts': self.contexts.stats()}
+
+
+class ChunkTextStore:
+    def __init__(self, path):
+        """Тексты фрагментов в одном UTF-8 файле, отображенном в память; смещения в соседнем .npy"""
+        self.path = path
+        self.offsets = np.load(path + '.offsets.npy')
+        self._file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    @classmethod
+    def build(cls, texts, path):
+        """Записывает тексты подряд и сохраняет смещения начала каждого фрагмента"""
+        offsets = [0]
+        with open(path, 'wb') as f:
+            for text in texts:
+                data = text.encode('utf-8')
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(path + '.offsets.npy', np.asarray(offsets, dtype=np.int64))
+        return cls(path)
+
+    @classmethod
+    def open_or_build(cls, texts, path, source_path):
+        """Открывает сохраненное хранилище, если оно не старше кэша эмбеддингов и совпадает по размеру"""
+        if (os.path.exists(path) and os.path.exists(path + '.offsets.npy')
+                and os.path.getmtime(path) >= os.path.getmtime(source_path)):
+            store = cls(path)
+            if len(store) == len(texts):
+                return store
+            store.close()
+        return cls.build(texts, path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self._buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+
+def chunk_store_path(embeddings_path):
+    """book_embeddings.json -> book_embeddings.chunks.bin"""
+    return os.path.splitext(embeddings_path)[0] + '.chunks.bin'
@@ -26,6 +26,6 @@ pip install -r requirements.txt
 
 REM Run the bot
 echo Starting bot...
-python main.py
+python bot_runtime.py
 
 pause
@@ -0,0 +1,157 @@
+"""
+Распознавание голосовых сообщений локальной моделью на CPU
+
+Модель faster-whisper загружается в отдельных процессах (ProcessPoolExecutor),
+поэтому распознавание не блокирует event loop и не конкурирует за GIL с
+потоками генерации. Одновременно распознается не больше workers сообщений,
+остальные ждут в очереди ограниченной длины. Время ожидания и время
+распознавания считаются отдельно от генерации ответа (stt_stats в /health).
+"""
+
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+STT_BACKENDS = ('auto', 'faster-whisper', 'none')
+LANGUAGE = 'ru'
+
+# Модель внутри процесса распознавания
+_model = None
+
+
+def _init_worker(model_name, cpu_threads):
+    """Загружает модель один раз при старте процесса"""
+    global _model
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(model_name, device='cpu', compute_type='int8', cpu_threads=cpu_threads)
+
+
+def _transcribe_file(path):
+    """Выполняется в процессе распознавания: (текст, длительность аудио в секундах)"""
+    segments, info = _model.transcribe(path, language=LANGUAGE, beam_size=1, vad_filter=True)
+    text = " ".join(segment.text.strip() for segment in segments)
+    return text.strip(), info.duration
+
+
+def is_available():
+    return importlib.util.find_spec('faster_whisper') is not None
+
+
+class TranscriptionStats:
+    def __init__(self, window=200):
+        self.transcribed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.transcribe_seconds = 0.0
+        self.queue_wait_ms = deque(maxlen=window)
+        self.transcribe_ms = deque(maxlen=window)
+
+    def record(self, wait_ms, transcribe_ms, audio_seconds):
+        self.transcribed += 1
+        self.audio_seconds += audio_seconds
+        self.transcribe_seconds += transcribe_ms / 1000
+        self.queue_wait_ms.append(wait_ms)
+        self.transcribe_ms.append(transcribe_ms)
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return {'p50': 0.0, 'p95': 0.0}
+        ordered = sorted(values)
+        return {'p50': round(ordered[len(ordered) // 2], 1),
+                'p95': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 1)}
+
+    def snapshot(self):
+        return {
+            'transcribed': self.transcribed,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'audio_seconds': round(self.audio_seconds, 1),
+            'queue_wait_ms': self._percentiles(self.queue_wait_ms),
+            'transcribe_ms': self._percentiles(self.transcribe_ms),
+            # Сколько секунд распознавания уходит на секунду аудио
+            'real_time_factor': round(self.transcribe_seconds / self.audio_seconds, 3) if self.audio_seconds else None
+        }
+
+
+stt_stats = TranscriptionStats()
+
+
+class SpeechToText:
+    def __init__(self, model_name='small', workers=2, cpu_threads=2, max_pending=16,
+                 executor=None, transcribe_fn=_transcribe_file, stats=stt_stats):
+        """
+        workers - процессы распознавания и предел одновременных распознаваний
+        max_pending - сколько сообщений может ждать в очереди, лишние сразу отклоняются
+        executor/transcribe_fn - для тестов; по умолчанию пул процессов с faster-whisper
+        """
+        self.model_name = model_name
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.max_pending = max_pending
+        self.transcribe_fn = transcribe_fn
+        self.stats = stats
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(workers)
+        self._pending = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # spawn: дочерний процесс не наследует потоки и event loop бота
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.cpu_threads)
+            )
+        return self._executor
+
+    async def transcribe(self, path):
+        """Текст голосового сообщения; None, если очередь переполнена"""
+        if self._pending >= self.workers + self.max_pending:
+            self.stats.rejected += 1
+            return None
+        self._pending += 1
+        queued_at = time.perf_counter()
+        try:
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    text, audio_seconds = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self.transcribe_fn, path
+                    )
+                except Exception:
+                    self.stats.failed += 1
+                    raise
+                finished = time.perf_counter()
+        finally:
+            self._pending -= 1
+        self.stats.record((started - queued_at) * 1000, (finished - started) * 1000, audio_seconds)
+        return text
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+def create_speech_to_text(backend, model_name='small', workers=2, cpu_threads=2):
+    """Создает распознавание по имени из конфигурации; None - голосовые не поддерживаются"""
+    if backend not in STT_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд распознавания речи: {backend}")
+    if backend == 'none':
+        return None
+    if not is_available():
+        if backend == 'auto':
+            logger.info("faster-whisper не установлен, голосовые сообщения отключены")
+            return None
+        raise RuntimeError("Для голосовых сообщений установите пакет faster-whisper или используйте STT_BACKEND=none")
+    return SpeechToText(model_name, workers, cpu_threads)
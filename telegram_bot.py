@@ -3,10 +3,14 @@ Telegram Bot for ParentAI - AI-powered parenting assistant
 """
 
 import logging
+import threading
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from config import TELEGRAM_BOT_TOKEN, BOT_NAME
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_BASE_URL, BOT_NAME, CONCURRENT_UPDATES, TELEGRAM_POOL_SIZE
 from ai_service import ParentAIService
+from message_renderer import PARSE_MODE, render_markdown
+from readiness import readiness
+from telegram_sender import TelegramRateLimiter, edit_or_reply, reply
 import json
 
 # Configure logging
@@ -16,15 +20,114 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize AI service
-ai_service = ParentAIService()
+# AI service, created on first use so importing the bot stays cheap
+_ai_service = None
+_ai_service_lock = threading.Lock()
+
+def get_ai_service():
+    """Return the shared AI service, creating it on first use."""
+    global _ai_service
+    if _ai_service is None:
+        with _ai_service_lock:
+            if _ai_service is None:
+                _ai_service = ParentAIService()
+    return _ai_service
 
 # User data storage (in production, use a database)
 user_data = {}
 
+# Attached to every answer instead of a separate follow-up message
+QUICK_ACTIONS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Why is my baby crying?", callback_data="quick_crying")],
+    [InlineKeyboardButton("Medical checkups", callback_data="quick_medical")],
+    [InlineKeyboardButton("Age activities", callback_data="quick_activities")]
+])
+
+# Static screens, rendered to HTML once
+HELP_TEXT = render_markdown("""
+📚 **How to use ParentAI:**
+
+**Commands:**
+/start - Start the bot and see welcome message
+/age - Set your child's age for personalized advice
+/topics - See common topics I can help with
+/help - Show this help message
+
+**Common Questions I Can Help With:**
+• Why is my baby crying and what should I do?
+• When should I take my child for medical checkups?
+• What activities are appropriate for my child's age?
+• Sleep issues and routines
+• Feeding and nutrition advice
+• Developmental milestones
+• Safety concerns
+
+**Tips:**
+• Be specific about your child's age for better advice
+• Ask follow-up questions if you need clarification
+• I'm here 24/7 for your parenting questions!
+
+Just type your question and I'll provide professional, evidence-based advice. 💕
+        """)
+
+TOPICS_TEXT = render_markdown("""
+🎯 **Common Topics I Can Help With:**
+
+**Crying & Comfort:**
+• Why is my baby crying?
+• How to soothe a fussy baby
+• Sleep issues and routines
+
+**Medical & Health:**
+• When to see the doctor
+• Vaccination schedules
+• Common health concerns
+
+**Development & Activities:**
+• Age-appropriate activities
+• Developmental milestones
+• Learning and play ideas
+
+**Feeding & Nutrition:**
+• Breastfeeding support
+• Introducing solids
+• Picky eating solutions
+
+**Safety & Behavior:**
+• Childproofing your home
+• Managing tantrums
+• Positive discipline
+
+Just ask me about any of these topics! 💬
+        """)
+
+QUICK_HELP_TEXT = render_markdown("""
+🚀 **Quick Help:**
+
+**Most Common Questions:**
+• "My baby won't stop crying, what should I do?"
+• "How often should I take my child to the doctor?"
+• "What activities can I do with my 1-year-old?"
+
+**Just type your question naturally!** I understand questions like:
+• "Baby crying help"
+• "When doctor visit"
+• "Activities for 6 months old"
+
+I'm here to help! 💕
+            """)
+
 class ParentAIBot:
     def __init__(self):
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+        self.application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .base_url(TELEGRAM_API_BASE_URL)
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            .rate_limiter(TelegramRateLimiter())
+            .build()
+        )
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -76,32 +179,7 @@ class ParentAIBot:
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command."""
-        help_text = """
-📚 **How to use ParentAI:**
-
-**Commands:**
-/start - Start the bot and see welcome message
-/age - Set your child's age for personalized advice
-/topics - See common topics I can help with
-/help - Show this help message
-
-**Common Questions I Can Help With:**
-• Why is my baby crying and what should I do?
-• When should I take my child for medical checkups?
-• What activities are appropriate for my child's age?
-• Sleep issues and routines
-• Feeding and nutrition advice
-• Developmental milestones
-• Safety concerns
-
-**Tips:**
-• Be specific about your child's age for better advice
-• Ask follow-up questions if you need clarification
-• I'm here 24/7 for your parenting questions!
-
-Just type your question and I'll provide professional, evidence-based advice. 💕
-        """
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await update.message.reply_text(HELP_TEXT, parse_mode=PARSE_MODE)
     
     async def age_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /age command to set child's age."""
@@ -121,37 +199,7 @@ Just type your question and I'll provide professional, evidence-based advice. 
     
     async def topics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /topics command."""
-        topics_text = """
-🎯 **Common Topics I Can Help With:**
-
-**Crying & Comfort:**
-• Why is my baby crying?
-• How to soothe a fussy baby
-• Sleep issues and routines
-
-**Medical & Health:**
-• When to see the doctor
-• Vaccination schedules
-• Common health concerns
-
-**Development & Activities:**
-• Age-appropriate activities
-• Developmental milestones
-• Learning and play ideas
-
-**Feeding & Nutrition:**
-• Breastfeeding support
-• Introducing solids
-• Picky eating solutions
-
-**Safety & Behavior:**
-• Childproofing your home
-• Managing tantrums
-• Positive discipline
-
-Just ask me about any of these topics! 💬
-        """
-        await update.message.reply_text(topics_text, parse_mode='Markdown')
+        await update.message.reply_text(TOPICS_TEXT, parse_mode=PARSE_MODE)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular text messages."""
@@ -173,7 +221,7 @@ Just ask me about any of these topics! 💬
         child_age = user_data[user_id]['child_age_months']
         user_context = user_data[user_id]['context']
         
-        response = ai_service.generate_response(message_text, child_age, user_context)
+        response = get_ai_service().generate_response(message_text, child_age, user_context)
         
         # Store conversation
         user_data[user_id]['conversation_history'].append({
@@ -181,21 +229,8 @@ Just ask me about any of these topics! 💬
             'answer': response
         })
         
-        # Send response
-        await update.message.reply_text(response)
-        
-        # Add quick action buttons for common topics
-        keyboard = [
-            [InlineKeyboardButton("Why is my baby crying?", callback_data="quick_crying")],
-            [InlineKeyboardButton("Medical checkups", callback_data="quick_medical")],
-            [InlineKeyboardButton("Age activities", callback_data="quick_activities")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            "Need help with something else? Try these common topics:",
-            reply_markup=reply_markup
-        )
+        # Send response with quick action buttons for common topics
+        await reply(update.message, response, reply_markup=QUICK_ACTIONS_MARKUP)
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle callback queries from inline keyboards."""
@@ -228,43 +263,32 @@ Just ask me about any of these topics! 💬
             await self.topics_command(update, context)
         
         elif data == "quick_help":
-            help_text = """
-🚀 **Quick Help:**
-
-**Most Common Questions:**
-• "My baby won't stop crying, what should I do?"
-• "How often should I take my child to the doctor?"
-• "What activities can I do with my 1-year-old?"
-
-**Just type your question naturally!** I understand questions like:
-• "Baby crying help"
-• "When doctor visit"
-• "Activities for 6 months old"
-
-I'm here to help! 💕
-            """
-            await query.edit_message_text(help_text)
+            await query.edit_message_text(QUICK_HELP_TEXT, parse_mode=PARSE_MODE)
         
         elif data == "quick_crying":
-            response = ai_service.generate_response(
+            response = get_ai_service().generate_response(
                 "My baby is crying and I don't know what to do",
                 user_data[user_id]['child_age_months']
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
         
         elif data == "quick_medical":
-            response = ai_service.generate_response(
+            response = get_ai_service().generate_response(
                 "When should I take my child for medical checkups?",
                 user_data[user_id]['child_age_months']
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
         
         elif data == "quick_activities":
-            response = ai_service.generate_response(
+            response = get_ai_service().generate_response(
                 "What activities are appropriate for my child's age?",
                 user_data[user_id]['child_age_months']
             )
-            await query.edit_message_text(response)
+            await edit_or_reply(query, response)
+    
+    def warm_up(self):
+        """Create the AI service and OpenAI client in the background."""
+        return readiness.warm_up_in_background('ai_service', lambda: get_ai_service().warm_up())
     
     def run(self):
         """Start the bot."""
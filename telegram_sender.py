@@ -0,0 +1,164 @@
+"""
+Outbound Telegram messages: rate limiting, retry-after handling and long replies.
+
+TelegramRateLimiter is installed on the Application, so every Bot API call from
+every handler goes through the same token buckets: one global (Telegram allows
+about 30 messages per second) and one per chat (about one message per second in
+private chats, 20 per minute in groups). A 429 pauses all sends for retry_after
+seconds and the request is sent again.
+
+reply(), edit_or_reply() and send_text() split answers longer than Telegram's 4096
+characters and attach the keyboard to the last part.
+"""
+
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE,
+                    TELEGRAM_MAX_RETRIES)
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+# Endpoints that deliver something to a chat; polling, callback answers and setup calls are never delayed
+LIMITED_PREFIXES = ('send', 'edit', 'copy', 'forward')
+# Chat actions ("typing") count against the global limit but must not use up a chat's burst
+CHAT_EXEMPT_ENDPOINTS = {'sendChatAction'}
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations: the caller sleeps for the returned delay."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, going into debt if none is left; returns seconds to wait before sending."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST,
+                 group_per_minute=TELEGRAM_GROUP_RATE, max_retries=TELEGRAM_MAX_RETRIES, max_chats=10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.chat_buckets = {}
+        self.paused_until = 0.0
+        self.delayed = 0
+        self.retried = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self.chat_buckets.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.max_chats:
+                # Full buckets carry no state, dropping them keeps memory bounded
+                self.chat_buckets = {key: value for key, value in self.chat_buckets.items() if not value.is_idle()}
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_per_minute / 60, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _wait(self, delay):
+        if delay > 0:
+            self.delayed += 1
+            await asyncio.sleep(delay)
+
+    async def _throttle(self, endpoint, data):
+        chat_id = data.get('chat_id')
+        if chat_id is not None and endpoint not in CHAT_EXEMPT_ENDPOINTS:
+            await self._wait(self._chat_bucket(chat_id).reserve())
+        await self._wait(self.global_bucket.reserve())
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        limited = endpoint.startswith(LIMITED_PREFIXES)
+        for attempt in range(self.max_retries + 1):
+            await self._wait(self.paused_until - time.monotonic())
+            if limited:
+                await self._throttle(endpoint, data)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after
+                # Flood control applies to the whole bot, so every send waits, not just this one
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                self.retried += 1
+                logger.warning(f"Telegram asked to retry {endpoint} after {retry_after}s (attempt {attempt + 1})")
+
+    def stats(self):
+        return {'delayed': self.delayed, 'retried': self.retried, 'chats': len(self.chat_buckets)}
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Split text into parts of at most limit characters, preferring paragraph, line and word boundaries."""
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ('\n\n', '\n', ' '):
+            cut = text.rfind(separator, limit // 2, limit)
+            if cut != -1:
+                break
+        if cut == -1:
+            cut = limit
+        parts.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+async def reply(message, text, reply_markup=None, **kwargs):
+    """Reply to a message; long text is sent in parts and the keyboard goes on the last one."""
+    parts = split_message(text)
+    sent = None
+    for i, part in enumerate(parts):
+        sent = await message.reply_text(part, reply_markup=reply_markup if i == len(parts) - 1 else None, **kwargs)
+    return sent
+
+
+async def send_text(bot, chat_id, text, reply_markup=None, **kwargs):
+    """Send text to a chat without a message to reply to (scheduled messages), split like reply()."""
+    parts = split_message(text)
+    sent = None
+    for i, part in enumerate(parts):
+        sent = await bot.send_message(chat_id, part, reply_markup=reply_markup if i == len(parts) - 1 else None, **kwargs)
+    return sent
+
+
+async def edit_or_reply(query, text, reply_markup=None, **kwargs):
+    """Edit the callback's message with the first part of text and send the rest as replies."""
+    parts = split_message(text)
+    await query.edit_message_text(parts[0], reply_markup=reply_markup if len(parts) == 1 else None, **kwargs)
+    for i, part in enumerate(parts[1:], 2):
+        await query.message.reply_text(part, reply_markup=reply_markup if i == len(parts) else None, **kwargs)
@@ -0,0 +1,55 @@
+"""
+Тестирование памяти диалога
+"""
+
+from conversation_memory import ConversationMemory, clip_to_tokens, estimate_tokens
+
+def make_profile(turns, summary=''):
+    return {
+        'context': summary,
+        'conversation_history': [
+            {'question': f"Вопрос номер {i} про сон ребенка", 'answer': "Подробный ответ про сон. " * 80}
+            for i in range(turns)
+        ]
+    }
+
+def test_context_fits_budget():
+    """Проверяет, что резюме и последние реплики укладываются в бюджет токенов"""
+    print("🧠 Тестирование бюджета памяти...")
+    memory = ConversationMemory(recent_turns=3, token_budget=150, summary_tokens=60)
+    profile = make_profile(10, summary="Дочь 2 года, часто плачет перед сном. " * 20)
+
+    context = memory.build_user_context(profile)
+    assert estimate_tokens(context) <= 150 + 20  # заголовки не входят в бюджет
+    assert "Заметки о прошлых беседах" in context
+    assert "Вопрос номер 9" in context
+    assert "Вопрос номер 6" not in context
+    print("✅ Контекст укладывается в бюджет")
+
+def test_refresh_only_for_turns_outside_window():
+    """Проверяет, что резюме обновляется только для вышедших из окна реплик"""
+    print("🔄 Тестирование обновления резюме...")
+    memory = ConversationMemory(recent_turns=3, refresh_every=2)
+    assert not memory.needs_refresh(make_profile(4))
+
+    profile = make_profile(5)
+    assert memory.needs_refresh(profile)
+    turns, upto = memory.pending_turns(profile)
+    assert [t['question'] for t in turns] == ["Вопрос номер 0 про сон ребенка", "Вопрос номер 1 про сон ребенка"]
+
+    profile['summary_upto'] = upto
+    assert not memory.needs_refresh(profile)
+    print("✅ Резюме обновляется инкрементально")
+
+def test_clip_to_tokens():
+    """Проверяет обрезку текста по бюджету токенов"""
+    text = "слово " * 500
+    clipped = clip_to_tokens(text, 50)
+    assert estimate_tokens(clipped) <= 50
+    assert clipped.endswith("…")
+    assert clip_to_tokens("коротко", 50) == "коротко"
+
+if __name__ == "__main__":
+    test_context_fits_budget()
+    test_refresh_only_for_turns_outside_window()
+    test_clip_to_tokens()
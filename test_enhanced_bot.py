@@ -2,7 +2,70 @@
 Тестирование улучшенного бота
 """
 
-from enhanced_ai_service import EnhancedParentAIService
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from age_tracking import AgeIndex, birth_month_from_age, child_age_months, migrate_profile, parse_birth_month
+from children import ChildContextCache, active_child, add_child, migrate_profile as migrate_children, new_child, record_topic, switch_child
+from digest_scheduler import DigestScheduler
+from enhanced_ai_service import EnhancedParentAIService, determine_age_group
+from fallback_engine import SIMILAR_INTRO
+from generation_profiles import apply_length_policy, select_profile
+from speech_to_text import SpeechToText, TranscriptionStats
+
+class BookContext:
+    def get_context_for_question(self, question, max_chunks=3):
+        return "[Фрагмент 1]\nРитуал перед сном"
+
+def service_with_answers(answer):
+    """Сервис с подставленным фрагментом книги; вызовы OpenAI записываются в service.calls"""
+    ai_service = EnhancedParentAIService()
+    ai_service._rag_system, ai_service._rag_loaded = BookContext(), True
+    ai_service.calls = []
+
+    def call_openai(context, question, profile=None):
+        ai_service.calls.append((context, profile))
+        return answer
+    ai_service._call_openai_with_retry = call_openai
+    return ai_service
+
+def ask_bot(ai_service, user_id, questions, children=None):
+    """Задает вопросы через EnhancedParentAIBot.answer_question, как при обычном сообщении"""
+    import enhanced_telegram_bot
+    from conversation_memory import ConversationMemory
+
+    bot = enhanced_telegram_bot.EnhancedParentAIBot.__new__(enhanced_telegram_bot.EnhancedParentAIBot)
+    bot.generation_executor = ThreadPoolExecutor(max_workers=1)
+    bot.child_contexts = ChildContextCache(determine_age_group)
+    bot.memory = ConversationMemory(answers=enhanced_telegram_bot.user_store.answers)
+    bot.schedule_memory_refresh = lambda user_id, child: None
+    enhanced_telegram_bot.user_data[user_id] = {
+        'name': 'Анна', 'children': children or [new_child(1)], 'active_child': 1, 'total_questions': 0
+    }
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    async def send_chat_action(**kwargs):
+        pass
+
+    replies = []
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id, first_name='Анна'),
+                             effective_chat=SimpleNamespace(id=user_id), message=SimpleNamespace(reply_text=reply_text))
+    context = SimpleNamespace(bot=SimpleNamespace(send_chat_action=send_chat_action))
+    enhanced_telegram_bot._ai_service = ai_service
+    try:
+        for question in questions:
+            asyncio.run(bot.answer_question(update, context, question))
+    finally:
+        enhanced_telegram_bot._ai_service = None
+        bot.generation_executor.shutdown()
+        del enhanced_telegram_bot.user_data[user_id]
+    return replies
 
 def test_enhanced_ai_service():
     """Тестирует улучшенный AI сервис"""
@@ -78,6 +141,238 @@ def test_topic_extraction():
         topic = ai_service.extract_topic_from_question(question)
         print(f"Вопрос: '{question}' -> Тема: {topic}")
 
+def test_generation_profile_selection():
+    """Проверяет выбор профиля генерации и обрезку ответа по длине"""
+    print("\n📏 Тестирование профилей генерации...")
+    
+    ai_service = EnhancedParentAIService()
+    
+    expected = {
+        "Сколько должен спать ребенок в 4 месяца?": "brief",
+        "Как уложить ребенка спать?": "standard",
+        "Ребенок не слушается, как наказывать?": "detailed"
+    }
+    for question, profile_name in expected.items():
+        topic, confidence = ai_service.classify_question(question)
+        assert select_profile(question, topic, confidence).name == profile_name, question
+
+    # Через бота: в контексте возраст ребенка, со второго вопроса и память диалога
+    ai_service = service_with_answers("Около 15 часов в сутки.")
+    child = new_child(1, birth_month=birth_month_from_age(4))
+    ask_bot(ai_service, 900001, ["Сколько должен спать ребенок в 4 месяца?", "Сколько должен спать ребенок днем?"], [child])
+    assert "Возраст ребенка: 4 мес" in ai_service.calls[0][0]
+    assert "Сколько должен спать ребенок в 4 месяца?" in ai_service.calls[1][0]
+    assert [profile.name for _, profile in ai_service.calls] == ["brief", "brief"]
+    
+    assert apply_length_policy("Первое. Второе предложение. Незаконч", "length") == "Первое. Второе предложение."
+    assert apply_length_policy("Полный ответ. ", "stop") == "Полный ответ."
+    print("✅ Профили генерации работают")
+
+def test_age_index_finds_transitions_by_range():
+    """Проверяет, что возраст растет от месяца рождения, а переходы между группами ищутся по диапазону дат"""
+    print("🎂 Тестирование возраста по месяцу рождения...")
+    today = date(2026, 10, 19)
+    assert parse_birth_month("03.2025", today) == "2025-03" == parse_birth_month("2025-3", today)
+    assert parse_birth_month("13.2025", today) is None and parse_birth_month("11.2026", today) is None
+    assert child_age_months({'birth_month': "2025-03"}, today) == 19
+    assert child_age_months({'child_age_months': 8}, today) == 8
+
+    profile = {'child_age_months': 8, 'age_set_date': '2026-01-15T10:00:00'}
+    assert migrate_profile(profile) and profile['birth_month'] == "2025-05"
+
+    index = AgeIndex(determine_age_group)
+    assert index.transitions == [(4, "3-12_months"), (13, "1-3_years")]
+    index.build({1: {'birth_month': "2025-09"}, 2: {'birth_month': "2025-06"}, 3: {}})
+    assert index.crossed(date(2026, 6, 30), date(2026, 7, 1)) == [("2026-07-01", 2, "1-3_years")]
+    assert index.crossed(date(2025, 12, 31), date(2026, 1, 1)) == [("2026-01-01", 1, "3-12_months")]
+    index.update(1, "2025-06")
+    assert sorted(key for _, key, _ in index.crossed(date(2026, 6, 30), date(2026, 7, 1))) == [1, 2]
+    assert index.crossed(date(2025, 12, 31), date(2026, 1, 1)) == []
+    print("✅ Возраст по месяцу рождения работает")
+
+def test_digest_generated_once_per_cohort():
+    """Проверяет, что дайджест генерируется один раз на когорту и приходит только при смене возраста"""
+    print("🌱 Тестирование дайджестов по возрасту...")
+    users = {
+        user_id: {'birth_month': "2025-12", 'age_set_date': '2026-01-10T12:00:00'}
+        for user_id in range(5)
+    }
+    users[5] = {'child_age_months': None, 'registration_date': '2026-01-10T12:00:00'}
+    users[6] = {'birth_month': "2025-12", 'age_set_date': '2026-01-10T12:00:00', 'digests_enabled': False}
+    users[7] = {'birth_month': "2025-12", 'age_set_date': '2026-04-02T12:00:00'}
+    for profile in users.values():
+        migrate_children(profile)
+    add_child(users[0], "Петя", "2024-01")
+    dirty, generated, sent = set(), [], []
+
+    class Store:
+        def mark_dirty(self, user_id):
+            dirty.add(user_id)
+
+    async def generate(question, age):
+        generated.append((question, age))
+        return "Совет"
+
+    async def send(user_id, text):
+        sent.append((user_id, text.split("\n")[0]))
+
+    index = AgeIndex(determine_age_group).build({
+        (user_id, child['id']): child for user_id, profile in users.items() for child in profile['children']
+    })
+    scheduler = DigestScheduler(users, Store(), generate, index, send,
+                                top_topic=lambda user_id: "crying_and_comfort" if user_id < 2 else None, batch_size=2)
+    assert asyncio.run(scheduler.run_once(today=date(2026, 1, 20)))['cohorts'] == 0
+
+    result = asyncio.run(scheduler.run_once(today=date(2026, 4, 3)))
+    assert result == {**result, 'cohorts': 2, 'sent': 5, 'failed': 0}
+    assert len(generated) == 2 and all(age == 4 for _, age in generated)
+    assert sorted(user_id for user_id, _ in sent) == [0, 1, 2, 3, 4]
+    assert sent[0] == (0, "👶 Ребенок") and users[0]['children'][0]['digest_age_group'] == "3-12_months"
+    assert asyncio.run(scheduler.run_once(today=date(2026, 4, 5)))['sent'] == 0
+    print("✅ Дайджесты работают")
+
+def test_failed_digest_is_not_sent():
+    """Проверяет, что при сбое OpenAI шаблон не рассылается и когорта ждет следующего запуска"""
+    print("🌱 Тестирование дайджеста при сбое OpenAI...")
+    users = {user_id: {'birth_month': "2025-12", 'age_set_date': '2026-01-10T12:00:00'} for user_id in range(3)}
+    for profile in users.values():
+        migrate_children(profile)
+    dirty, sent = set(), []
+    ai_service = service_with_answers(None)
+
+    class Store:
+        def mark_dirty(self, user_id):
+            dirty.add(user_id)
+
+    async def generate(question, age):
+        return ai_service.generate_response(question, age, fallback=False)
+
+    async def send(user_id, text):
+        sent.append(user_id)
+
+    index = AgeIndex(determine_age_group).build({
+        (user_id, child['id']): child for user_id, profile in users.items() for child in profile['children']
+    })
+    scheduler = DigestScheduler(users, Store(), generate, index, send)
+    result = asyncio.run(scheduler.run_once(today=date(2026, 4, 3)))
+    assert result == {**result, 'cohorts': 1, 'sent': 0, 'failed': 3}
+    assert len(ai_service.calls) == 1 and not sent and not dirty
+    assert all('digest_age_group' not in profile['children'][0] for profile in users.values())
+
+    ai_service._call_openai_with_retry = lambda context, question, profile=None: "Совет"
+    assert asyncio.run(scheduler.run_once(today=date(2026, 4, 4)))['sent'] == 3
+    assert sorted(sent) == [0, 1, 2]
+    print("✅ Дайджест при сбое не рассылается")
+
+def test_child_profiles_and_context_cache():
+    """Проверяет несколько детей в профиле и кэш возрастной группы и префикса промпта"""
+    print("👶 Тестирование нескольких детей...")
+    profile = {'child_age_months': 8, 'age_set_date': '2026-01-15T10:00:00', 'context': 'Заметки',
+               'conversation_history': [{'question': 'Плачет', 'answer': 'Ответ'}]}
+    migrate_profile(profile)
+    assert migrate_children(profile) and active_child(profile)['context'] == 'Заметки'
+    assert 'conversation_history' not in profile and profile['active_child'] == 1
+
+    toddler = add_child(profile, "Маша", "2024-05")
+    assert active_child(profile) is toddler and toddler['conversation_history'] == []
+    assert switch_child(profile, "1")['id'] == 1 and switch_child(profile, "маша") is toddler
+    assert switch_child(profile, "Вася") is None and active_child(profile) is toddler
+
+    cache = ChildContextCache(determine_age_group)
+    today = date(2026, 10, 19)
+    context = cache.get(7, profile, toddler, today)
+    assert context.age_group == "1-3_years" and "Маша" in context.prefix and "Сон" not in context.prefix
+    assert cache.get(7, profile, toddler, today) is context and cache.hits == 1
+    record_topic(toddler, "sleep_issues")
+    with_topics = cache.get(7, profile, toddler, today)
+    assert with_topics is not context and "Сон" in with_topics.prefix
+    record_topic(toddler, "sleep_issues")
+    assert cache.get(7, profile, toddler, today) is with_topics and cache.hits == 2
+    toddler['context'] = "Новые заметки"
+    assert cache.get(7, profile, toddler, today) is not with_topics
+    assert cache.get(7, profile, toddler, date(2026, 11, 1)).age_months == 30
+
+    toddler['birth_month'] = birth_month_from_age(17)
+    insights = EnhancedParentAIService().get_user_insights(7, {7: profile})
+    assert "Возраст ребенка: 1 г. 5 мес." in insights
+    print("✅ Несколько детей работают")
+
+def test_speech_to_text_bounds_concurrency():
+    """Проверяет, что распознаваний одновременно не больше workers, а лишние сообщения отклоняются"""
+    print("🎙 Тестирование очереди распознавания речи...")
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def fake_transcribe(path):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return f"текст {path}", 3.0
+
+    stats = TranscriptionStats()
+    speech = SpeechToText(workers=2, max_pending=3, executor=ThreadPoolExecutor(4),
+                          transcribe_fn=fake_transcribe, stats=stats)
+
+    async def burst():
+        return await asyncio.gather(*(speech.transcribe(f"{i}.ogg") for i in range(7)))
+
+    texts = asyncio.run(burst())
+    assert texts[:5] == [f"текст {i}.ogg" for i in range(5)] and texts[5:] == [None, None]
+    assert peak[0] == 2
+    snapshot = stats.snapshot()
+    assert snapshot['transcribed'] == 5 and snapshot['rejected'] == 2
+    assert snapshot['queue_wait_ms']['p95'] > 0
+    speech.shutdown()
+    print("✅ Очередь распознавания работает")
+
+def test_fallback_engine_templates_and_similar_answers():
+    """Проверяет, что при сбое OpenAI отдается похожий прошлый ответ, а иначе шаблон темы и возраста"""
+    print("🛟 Тестирование запасных ответов...")
+
+    ai_service = service_with_answers("Ответ о вечернем ритуале")
+    assert ai_service.generate_response("Как уложить ребенка спать вечером?", 8) == "Ответ о вечернем ритуале"
+    ai_service.generate_response("Как уложить спать, если мы в гостях?", 8, user_context="Сына зовут Петя")
+    assert ai_service.fallback.stats()['remembered_answers'] == 1
+
+    ai_service._call_openai_with_retry = lambda context, question, profile=None: None
+    similar = ai_service.generate_response("Как вечером уложить ребенка спать", 8)
+    assert similar == SIMILAR_INTRO + "Ответ о вечернем ритуале"
+
+    template = ai_service.generate_response("Малыш плачет, как утешить?", 8)
+    assert "Вопрос: Малыш плачет, как утешить?" in template
+    assert "Ребенок начинает понимать причинно-следственные связи" in template
+    assert "плач ребенка в этом возрасте - это способ общения" in ai_service.generate_response("Малыш плачет, как утешить?", 1)
+    assert "**Также по теме:**" in ai_service.generate_response("Малыш плачет, как его уложить?", 8)
+
+    ai_service._rag_system = None
+    kindergarten = ai_service.generate_response("Как пережить адаптацию к садику и слезы по утрам?", 30)
+    assert "Адаптация к садику - это проверка привязанности" in kindergarten
+    assert ai_service.fallback.stats()['similar_answer'] == 1
+
+    # Через бота: ответ с возрастом ребенка в контексте запоминается, с памятью диалога или именем - нет
+    ai_service = service_with_answers("Ответ о вечернем ритуале")
+    ask_bot(ai_service, 900002, ["Как уложить ребенка спать вечером?", "Как уложить спать в гостях?"],
+            [new_child(1, birth_month=birth_month_from_age(8))])
+    assert "Возраст ребенка: 8 мес" in ai_service.calls[0][0]
+    assert ai_service.fallback.stats()['remembered_answers'] == 1
+    ask_bot(ai_service, 900003, ["Как уложить дочку спать днем?"],
+            [new_child(1, 'Маша', birth_month_from_age(8)), new_child(2, 'Петя', birth_month_from_age(30))])
+    assert ai_service.fallback.stats()['remembered_answers'] == 1
+    ai_service._call_openai_with_retry = lambda context, question, profile=None: None
+    reply = ask_bot(ai_service, 900004, ["Как вечером уложить ребенка спать"],
+                  [new_child(1, birth_month=birth_month_from_age(9))])[0]
+    assert reply == SIMILAR_INTRO + "Ответ о вечернем ритуале"
+    print("✅ Запасные ответы работают")
+
 if __name__ == "__main__":
     test_enhanced_ai_service()
     test_topic_extraction()
+    test_generation_profile_selection()
+    test_age_index_finds_transitions_by_range()
+    test_digest_generated_once_per_cohort()
+    test_failed_digest_is_not_sent()
+    test_child_profiles_and_context_cache()
+    test_speech_to_text_bounds_concurrency()
+    test_fallback_engine_templates_and_similar_answers()
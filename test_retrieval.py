@@ -0,0 +1,244 @@
+"""
+Тестирование поиска по книге: кэш, реранкер и ANN индекс
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ann_index import IVFIndex
+import book_rag_system
+from book_rag_system import BookRAGSystem, finalize_rag_system
+from inline_search import ASK_RESULT_ID, InlineIndex
+from reranker import CrossEncoderReranker, LexicalReranker, Reranker
+from retrieval_batcher import RetrievalBatcher
+from retrieval_cache import RetrievalCache, normalize_query
+from worker_pool import WorkerPool, WorkerStats, process_memory
+
+CHUNKS = [
+    "Ребенок плачет ночью: нужно утешить его и взять на руки",
+    "Режим сна и вечерние ритуалы помогают малышу засыпать",
+    "Истерики в два года связаны с незрелостью нервной системы",
+    "Адаптация к детскому саду занимает несколько недель",
+]
+
+class FakeEmbeddingsRAG(BookRAGSystem):
+    """RAG система с детерминированными эмбеддингами вместо OpenAI"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.embedded = []
+
+    def embed_texts(self, texts):
+        self.embedded.extend(texts)
+        return [[1.0, 0.1 * len(text), 0.0, 0.2] for text in texts]
+
+def test_query_cache_skips_embedding():
+    """Проверяет, что повторный вопрос в другой форме не запрашивает эмбеддинг"""
+    print("🗂️ Тестирование кэша поиска...")
+    rag = FakeEmbeddingsRAG(CHUNKS, np.eye(4), min_score=-1.0, cache=RetrievalCache(16))
+    first = rag.get_context_for_question("Почему ребёнок плачет?")
+    second = rag.get_context_for_question("почему ребенок плачет")
+    assert first is second
+    assert rag.embedded == ["Почему ребёнок плачет?"]
+    assert normalize_query("  Что   делать?!") == "что делать"
+    print("✅ Кэш работает")
+
+def test_lexical_reranker_prefers_matching_chunk():
+    """Проверяет, что реранкер поднимает фрагмент со словами вопроса и отбрасывает слабые"""
+    print("🔀 Тестирование реранкера...")
+    reranker = LexicalReranker(budget_ms=1000)
+    hits = [(0.9, 1), (0.88, 2), (0.87, 0), (0.5, 3)]
+    result = reranker.rerank("Почему малыш плачет ночью?", hits, CHUNKS, keep=3)
+    assert result[0][1] == 0
+    assert len(result) <= 3
+    assert (0.5, 3) not in result
+    print("✅ Реранкер работает")
+
+def test_reranker_skips_when_over_budget():
+    """Проверяет, что медленный реранкер пропускается и остается порядок поиска"""
+    class SlowReranker(LexicalReranker):
+        def score(self, question, indices, chunks, deadline):
+            time.sleep(0.01)
+            return super().score(question, indices, chunks, deadline)
+
+    reranker = SlowReranker(budget_ms=1)
+    hits = [(0.9, 1), (0.88, 2), (0.87, 0)]
+    assert reranker.rerank("плачет ночью", hits, CHUNKS, keep=2) == hits[:2]
+    assert reranker.rerank("плачет ночью", hits, CHUNKS, keep=2) == hits[:2]
+    assert reranker.skipped == 2
+
+def test_cross_encoder_stops_at_deadline():
+    """Проверяет, что cross-encoder бросает оценку после дедлайна, а не досчитывает всех кандидатов"""
+    class SlowModel:
+        calls = 0
+
+        def predict(self, pairs, batch_size=32):
+            self.calls += 1
+            time.sleep(0.005)
+            return [0.5] * len(pairs)
+
+    # Без sentence-transformers: модель подставляется вместо загрузки
+    reranker = CrossEncoderReranker.__new__(CrossEncoderReranker)
+    Reranker.__init__(reranker, budget_ms=8)
+    reranker.batch_size, reranker.model = 2, SlowModel()
+    hits = [(0.9 - i / 100, i % len(CHUNKS)) for i in range(20)]
+    assert reranker.rerank("плачет ночью", hits, CHUNKS, keep=3) == hits[:3]
+    assert reranker.skipped == 1 and reranker.model.calls < 5
+
+    reranker.budget_ms = 1000
+    assert reranker.score("плачет", [0, 1, 2], CHUNKS, time.perf_counter() + 1) == [0.5, 0.5, 0.5]
+
+def test_ivf_index_matches_exact_search():
+    """Проверяет, что IVF при просмотре всех кластеров совпадает с точным поиском"""
+    print("📇 Тестирование IVF индекса...")
+    rng = np.random.default_rng(0)
+    rag = BookRAGSystem([""] * 500, rng.standard_normal((500, 16)), min_score=-1.0)
+    queries = rng.standard_normal((5, 16))
+    exact = rag.top_k(queries, 3)
+
+    index = IVFIndex(n_lists=10, n_probe=10).build(rag.matrix)
+    rag.index = index
+    assert [[i for _, i in hits] for hits in rag.top_k(queries, 3)] == [[i for _, i in hits] for hits in exact]
+    index.n_probe = 0
+    assert index.probes() == 8 and IVFIndex(n_lists=200).build(rag.matrix).probes() == 20
+    print("✅ IVF индекс работает")
+
+def test_inline_search_matches_prefix_without_llm():
+    """Проверяет inline поиск: недописанное слово находится по префиксу, "Спросить" идет первым"""
+    print("🔎 Тестирование inline поиска...")
+    index = InlineIndex()
+    results = index.inline_results("истер", "parentai_bot")
+    assert results[0].id == ASK_RESULT_ID
+    assert "Границы и истерики · Истерики" in [result.title for result in results]
+
+    titles = [result.title for result in index.inline_results("адаптация к сад", "parentai_bot")[1:3]]
+    assert all(title.startswith("Адаптация к садику") for title in titles)
+    assert index.search("адаптация к сад") is index.search("Адаптация  к сад")
+    assert index.inline_results("", "parentai_bot")[0].id != ASK_RESULT_ID
+    assert [result.id for result in index.inline_results("qwzx", "parentai_bot")] == [ASK_RESULT_ID]
+    print("✅ Inline поиск работает")
+
+def test_rank_in_worker_process_matches_local():
+    """Проверяет, что поиск в процессе пула по mmap-файлам дает тот же результат, что и в процессе бота"""
+    print("🧮 Тестирование поиска в пуле процессов...")
+    rng = np.random.default_rng(1)
+    embeddings = rng.standard_normal((len(CHUNKS), 8))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "embeddings.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': []}, f)
+        rag = finalize_rag_system(CHUNKS, embeddings, path, index_kind='exact', workers=1)
+        try:
+            assert isinstance(rag.matrix, np.memmap) and rag.workers is not None
+            queries = rng.standard_normal((2, 8))
+            questions = ["Почему малыш плачет ночью?", "Как пережить адаптацию к саду?"]
+            assert rag.rank(questions, queries, 2) == rag.rank_local(questions, queries, 2)
+            assert rag.workers.stats.stages['retrieval'].calls == 1
+            memory = rag.workers.stats.snapshot()['memory']
+            assert len(memory) == 1
+            if process_memory():
+                assert all(item['pss_mb'] > 0 for item in memory.values())
+        finally:
+            rag.close()
+            rag.chunks.close()
+            del rag
+    print("✅ Поиск в пуле процессов работает")
+
+def test_worker_pool_limits_each_stage():
+    """Проверяет, что стадия не занимает больше своего лимита и ожидание в очереди учитывается"""
+    running, peak, lock = {}, {}, threading.Lock()
+
+    def work(stage):
+        with lock:
+            running[stage] = running.get(stage, 0) + 1
+            peak[stage] = max(peak.get(stage, 0), running[stage])
+        time.sleep(0.02)
+        with lock:
+            running[stage] -= 1
+        return stage
+
+    pool = WorkerPool(4, {'rerank': 1}, executor=ThreadPoolExecutor(8), stats=WorkerStats())
+    with ThreadPoolExecutor(8) as callers:
+        futures = [callers.submit(pool.call, stage, work, stage) for stage in ['rerank'] * 4 + ['search'] * 4]
+        assert [future.result() for future in futures] == ['rerank'] * 4 + ['search'] * 4
+    assert peak == {'rerank': 1, 'search': 4}
+    snapshot = pool.stats.snapshot()
+    assert snapshot['stages']['rerank']['calls'] == 4 and snapshot['stages']['search']['limit'] == 4
+    assert snapshot['stages']['rerank']['queue_wait_ms']['p95'] >= 20
+    pool.shutdown()
+
+def test_batcher_keeps_several_batches_in_pool():
+    """Проверяет, что батчер не ждет ранжирования: следующий батч попадает в пул, пока считается первый"""
+    print("📦 Тестирование батчей в пуле процессов...")
+    running, peak, lock = [0], [0], threading.Lock()
+
+    class SlowRankRAG(FakeEmbeddingsRAG):
+        def rank_local(self, questions, vectors, k):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.2)
+            with lock:
+                running[0] -= 1
+            return super().rank_local(questions, vectors, k)
+
+    rag = FakeEmbeddingsRAG(CHUNKS, np.eye(4), min_score=-1.0)
+    rag.workers = WorkerPool(2, executor=ThreadPoolExecutor(2), stats=WorkerStats())
+    # Пул из потоков: rank_in_worker берет RAG систему процесса пула из модуля
+    book_rag_system._worker_rag = SlowRankRAG(CHUNKS, np.eye(4), min_score=-1.0)
+    batcher = RetrievalBatcher(rag, window_ms=5)
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(2) as callers:
+            first = callers.submit(batcher.search, "Почему малыш плачет?")
+            time.sleep(0.05)
+            second = callers.submit(batcher.search, "Как уложить спать?")
+            assert first.result() and second.result()
+    finally:
+        book_rag_system._worker_rag = None
+        rag.close()
+    assert peak[0] == 2 and time.monotonic() - started < 0.4
+    assert batcher.stats()['batches'] == 2 and rag.workers is None
+    print("✅ Батчи ранжируются в пуле одновременно")
+
+def test_batcher_embeds_batches_concurrently():
+    """Проверяет, что медленный запрос эмбеддингов одного батча не задерживает следующие"""
+    print("📦 Тестирование одновременных батчей...")
+
+    class SlowEmbeddingsRAG(FakeEmbeddingsRAG):
+        def embed_texts(self, texts):
+            time.sleep(0.2)
+            return super().embed_texts(texts)
+
+    batcher = RetrievalBatcher(SlowEmbeddingsRAG(CHUNKS, np.eye(4), min_score=-1.0), window_ms=5, threads=4)
+    waited = []
+
+    def ask(question):
+        started = time.monotonic()
+        batcher.search(question)
+        waited.append(time.monotonic() - started)
+
+    with ThreadPoolExecutor(4) as callers:
+        for question in ["Плачет ночью", "Режим сна", "Истерики", "Детский сад"]:
+            callers.submit(ask, question)
+            time.sleep(0.05)
+    batcher.close()
+    assert batcher.stats()['batches'] == 4 and max(waited) < 0.35
+    print("✅ Батчи не ждут друг друга")
+
+if __name__ == "__main__":
+    test_query_cache_skips_embedding()
+    test_lexical_reranker_prefers_matching_chunk()
+    test_reranker_skips_when_over_budget()
+    test_cross_encoder_stops_at_deadline()
+    test_ivf_index_matches_exact_search()
+    test_inline_search_matches_prefix_without_llm()
+    test_rank_in_worker_process_matches_local()
+    test_worker_pool_limits_each_stage()
+    test_batcher_keeps_several_batches_in_pool()
+    test_batcher_embeds_batches_concurrently()
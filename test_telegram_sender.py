@@ -0,0 +1,77 @@
+"""
+Test outbound message splitting, rendering and the Telegram rate limiter.
+"""
+
+import asyncio
+
+from telegram.error import RetryAfter
+
+from message_renderer import escape_html, render_markdown, truncate
+from telegram_sender import TelegramRateLimiter, split_message
+
+def test_split_message_respects_limit():
+    """Test that long answers are split on paragraph boundaries and nothing is lost."""
+    print("✂️ Testing message splitting...")
+    paragraphs = [f"Абзац {i}: " + "слово " * 60 for i in range(40)]
+    text = "\n\n".join(paragraphs)
+
+    parts = split_message(text, limit=1000)
+    assert len(parts) > 1
+    assert all(len(part) <= 1000 for part in parts)
+    assert all(part.startswith("Абзац") for part in parts)
+    assert " ".join(" ".join(parts).split()) == " ".join(text.split())
+    assert split_message("Короткий ответ") == ["Короткий ответ"]
+    assert split_message("x" * 2500, limit=1000) == ["x" * 1000, "x" * 1000, "x" * 500]
+    print("✅ Splitting works")
+
+def test_renderer_escapes_and_truncates_safely():
+    """Test that user text is escaped and truncation never splits an entity or a grapheme."""
+    print("🖋️ Testing message rendering...")
+    assert render_markdown("**Плач & сон:** crying_and_comfort <3") == "<b>Плач &amp; сон:</b> crying_and_comfort &lt;3"
+    assert escape_html(truncate("a & b & c", 4)) == "a &amp;…"
+    assert truncate("Мама 👩‍👧 и папа", 7) == "Мама…"
+    assert truncate("e\u0301e\u0301e\u0301", 4) == "e\u0301…"
+    assert truncate("Флаг 🇷🇺🇷🇺", 8) == "Флаг 🇷🇺…"
+    assert truncate("Флаг 🇷🇺🇷🇺", 7) == "Флаг…"
+    assert truncate("Короткий", 50) == "Короткий"
+    print("✅ Rendering works")
+
+def test_rate_limiter_retries_after_429():
+    """Test that a RetryAfter is waited out and the request is sent again."""
+    print("⏳ Testing retry-after handling...")
+    limiter = TelegramRateLimiter(max_retries=2)
+    attempts = []
+
+    async def send_message(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise RetryAfter(0)
+        return {'ok': True}
+
+    result = asyncio.run(limiter.process_request(send_message, (), {'text': 'hi'}, 'sendMessage', {'chat_id': 1}, None))
+    assert result == {'ok': True}
+    assert len(attempts) == 2
+    assert limiter.retried == 1
+    print("✅ Retry-after handling works")
+
+def test_rate_limiter_spaces_out_one_chat():
+    """Test that a chat's burst is used first and further messages wait for the chat's rate."""
+    limiter = TelegramRateLimiter(global_rate=1000, chat_rate=50, chat_burst=2)
+
+    async def send_message():
+        return True
+
+    async def burst():
+        for _ in range(3):
+            await limiter.process_request(send_message, (), {}, 'sendMessage', {'chat_id': 7}, None)
+        await limiter.process_request(send_message, (), {}, 'answerCallbackQuery', {}, None)
+
+    asyncio.run(burst())
+    assert limiter.delayed == 1
+    assert list(limiter.chat_buckets) == [7]
+
+if __name__ == "__main__":
+    test_split_message_respects_limit()
+    test_renderer_escapes_and_truncates_safely()
+    test_rate_limiter_retries_after_429()
+    test_rate_limiter_spaces_out_one_chat()
@@ -0,0 +1,309 @@
+"""
+Test user state persistence and graceful shutdown helpers.
+"""
+
+import asyncio
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import admin_cli
+from analytics_store import AnalyticsStore
+from conversation_memory import ConversationMemory
+from lifecycle import LifecycleManager
+from user_store import UserStore
+
+def sample_profile(name):
+    return {
+        'name': name,
+        'child_age_months': 8,
+        'context': '',
+        'conversation_history': [{'question': 'Почему ребенок плачет?', 'answer': 'Ответ', 'timestamp': '2026-01-01T10:00:00', 'child_age': 8}],
+        'total_questions': 1,
+        'favorite_topics': ['crying_and_comfort'],
+        'registration_date': '2026-01-01T10:00:00',
+        'last_activity': '2026-01-01T10:00:00'
+    }
+
+def test_flush_writes_only_dirty_profiles():
+    """Test that flush persists exactly the profiles marked dirty."""
+    print("💾 Testing write-behind flush...")
+    db_path = os.path.join(tempfile.mkdtemp(), 'user_data.db')
+
+    store = UserStore(db_path, legacy_json_path=None)
+    store.users[1] = sample_profile('Анна')
+    store.users[2] = sample_profile('Иван')
+    store.mark_dirty(1)
+    assert store.flush() == 1
+    assert store.flush() == 0
+
+    store.users[1]['total_questions'] = 2
+    store.mark_dirty(1)
+    store.mark_dirty(2)
+    assert store.flush() == 2
+    store.close()
+
+    reloaded = UserStore(db_path, legacy_json_path=None)
+    reloaded.load()
+    assert reloaded.users[1]['total_questions'] == 2
+    assert reloaded.users[2]['name'] == 'Иван'
+    print("✅ Only dirty profiles were written")
+
+def test_legacy_json_migration():
+    """Test that user_data.json from old installs is imported with integer ids."""
+    print("📦 Testing user_data.json migration...")
+    workdir = tempfile.mkdtemp()
+    legacy_path = os.path.join(workdir, 'user_data.json')
+    with open(legacy_path, 'w', encoding='utf-8') as f:
+        json.dump({'123': sample_profile('Мария')}, f, ensure_ascii=False)
+
+    store = UserStore(os.path.join(workdir, 'user_data.db'), legacy_json_path=legacy_path)
+    store.load()
+    assert store.users[123]['name'] == 'Мария'
+    assert not store.dirty
+
+    # Migration only happens once, later edits to the JSON file are ignored
+    with open(legacy_path, 'w', encoding='utf-8') as f:
+        json.dump({}, f)
+    store.load()
+    assert 123 in store.users
+    print("✅ Legacy data migrated")
+
+def test_identical_answers_stored_once():
+    """Test that answers are stored once per text, resolved after reload and deleted with their last reference."""
+    print("🗜️ Testing answer deduplication...")
+    db_path = os.path.join(tempfile.mkdtemp(), 'user_data.db')
+    shared = "Ребенку нужна опора: " + "будьте рядом и называйте его чувства. " * 20
+
+    store = UserStore(db_path, legacy_json_path=None)
+    store.load()
+    for user_id in (1, 2, 3):
+        profile = sample_profile(f'Родитель {user_id}')
+        profile['conversation_history'] = [{'question': 'Почему ребенок плачет?', 'answer_hash': store.answers.put(shared)}]
+        store.users[user_id] = profile
+        store.mark_dirty(user_id)
+    store.users[3]['conversation_history'].append({'question': 'Как уложить спать?', 'answer_hash': store.answers.put("Ритуал перед сном")})
+    store.flush()
+    stats = store.answers.stats()
+    assert stats['answers'] == 2 and stats['references'] == 4
+    assert stats['stored_bytes'] < len(shared.encode('utf-8'))
+    row = store.connection.execute("SELECT profile FROM users WHERE user_id = 1").fetchone()
+    assert shared not in row[0]
+    store.close()
+
+    reloaded = UserStore(db_path, legacy_json_path=None)
+    reloaded.load()
+    history = reloaded.users[3]['conversation_history']
+    assert [reloaded.answers.text(item) for item in history] == [shared, "Ритуал перед сном"]
+    memory = ConversationMemory(recent_turns=2, answers=reloaded.answers)
+    assert "Ритуал перед сном" in memory.build_user_context(reloaded.users[3])
+
+    # Clearing a history releases its answers; the last reference deletes the text
+    reloaded.answers.release_history(history)
+    reloaded.users[3]['conversation_history'] = []
+    reloaded.mark_dirty(3)
+    reloaded.flush()
+    stats = reloaded.answers.stats()
+    assert stats['answers'] == 1 and stats['references'] == 2
+
+    # Histories saved before the store carry the text itself
+    legacy = sample_profile('Мария')
+    assert reloaded.answers.intern_history(legacy)
+    assert 'answer' not in legacy['conversation_history'][0]
+    assert reloaded.answers.text(legacy['conversation_history'][0]) == 'Ответ'
+    assert not reloaded.answers.intern_history(legacy)
+    print("✅ Answers are stored once and reference counted")
+
+def test_admin_cli_on_a_live_store():
+    """Test migrate, export, prune and compact next to a bot process writing to the same store."""
+    print("🛠️ Testing admin CLI...")
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'user_data.db')
+    legacy_path = os.path.join(workdir, 'user_data.json')
+    legacy = {str(user_id): sample_profile(f'Родитель {user_id}') for user_id in range(1, 8)}
+    for user_id in (1, 2):
+        legacy[str(user_id)]['last_activity'] = '2020-01-01T10:00:00'
+    with open(legacy_path, 'w', encoding='utf-8') as f:
+        json.dump(legacy, f, ensure_ascii=False)
+
+    bot = UserStore(db_path, legacy_json_path=None)
+    bot.load()
+    bot.users[7] = sample_profile('Уже в базе')
+    bot.users[7]['conversation_history'] = []
+    bot.mark_dirty(7)
+    bot.flush()
+
+    connection = admin_cli.open_store(db_path)
+    assert admin_cli.migrate(connection, legacy_path, workers=1, chunk_size=3) == (6, 1)
+    assert bot.answers.stats()['answers'] == 1
+    assert connection.execute("SELECT refcount FROM answers").fetchone()[0] == 6
+
+    output = io.StringIO()
+    assert admin_cli.export(connection, output, batch_size=2, with_answers=True) == 7
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [line['user_id'] for line in lines] == list(range(1, 8))
+    assert lines[0]['profile']['children'][0]['conversation_history'][0]['answer'] == 'Ответ'
+    assert lines[6]['profile']['name'] == 'Уже в базе'
+
+    # The bot references the same answer while the CLI prunes; both changes are kept
+    bot.users[7]['conversation_history'].append({'question': 'Почему?', 'answer_hash': bot.answers.put('Ответ')})
+    bot.mark_dirty(7)
+    assert admin_cli.prune(connection, '2021-01-01', dry_run=True) == 2
+    assert admin_cli.prune(connection, '2021-01-01', batch_size=1) == 2
+    bot.flush()
+    # Pruned users keep their references until the bot restarts
+    assert connection.execute("SELECT refcount FROM answers").fetchone()[0] == 7
+    assert admin_cli.recount_answers(connection) == (0, 0)
+
+    # A lost update is repaired
+    connection.execute("UPDATE answers SET refcount = 42")
+    assert admin_cli.recount_answers(connection) == (1, 0)
+    assert connection.execute("SELECT refcount FROM answers").fetchone()[0] == 7
+    assert admin_cli.prune(connection, '2100-01-01') == 5
+    assert admin_cli.recount_answers(connection) == (0, 0)
+    bot.close()
+
+    # After a restart nobody references the text any more
+    restarted = UserStore(db_path, legacy_json_path=None)
+    assert restarted.load() == {}
+    assert connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0] == 0
+    connection.close()
+    restarted.close()
+    print("✅ Admin CLI works next to the bot")
+
+def test_pruned_user_saved_again_keeps_answers():
+    """Test that a user pruned while the bot runs and saved again keeps answers another user releases."""
+    print("🪦 Testing prune on a live store...")
+    db_path = os.path.join(tempfile.mkdtemp(), 'user_data.db')
+    bot = UserStore(db_path, legacy_json_path=None)
+    bot.load()
+    for user_id, last_activity in ((1, '2020-01-01T10:00:00'), (2, '2026-01-01T10:00:00')):
+        bot.users[user_id] = sample_profile(f'Родитель {user_id}')
+        bot.users[user_id]['last_activity'] = last_activity
+        bot.answers.intern_history(bot.users[user_id])
+        bot.mark_dirty(user_id)
+    bot.flush()
+
+    connection = admin_cli.open_store(db_path)
+    assert admin_cli.prune(connection, '2021-01-01') == 1
+
+    # The pruned user writes again before the bot restarts, then the other user clears the history
+    bot.users[1]['conversation_history'].append({'question': 'А днем?', 'answer_hash': bot.answers.put('Днем тоже')})
+    bot.users[1]['last_activity'] = '2026-02-01T10:00:00'
+    bot.mark_dirty(1)
+    bot.flush()
+    bot.answers.release_history(bot.users[2]['conversation_history'])
+    bot.users[2]['conversation_history'] = []
+    bot.mark_dirty(2)
+    bot.flush()
+    bot.close()
+
+    restarted = UserStore(db_path, legacy_json_path=None)
+    restarted.load()
+    history = restarted.users[1]['conversation_history']
+    assert [restarted.answers.text(item) for item in history] == ['Ответ', 'Днем тоже']
+    assert admin_cli.recount_answers(connection) == (0, 0)
+    connection.close()
+    restarted.close()
+    print("✅ Pruned user keeps the whole history")
+
+def test_analytics_counters_survive_restart():
+    """Test that topic counters and daily rollups are flushed and reloaded without double counting."""
+    print("📈 Testing analytics store...")
+    db_path = os.path.join(tempfile.mkdtemp(), 'analytics.db')
+    morning, evening = datetime(2026, 3, 2, 9), datetime(2026, 3, 2, 21)
+
+    store = AnalyticsStore(db_path)
+    store.record_question(1, 'sleep_issues', 4, when=morning)
+    store.record_question(1, 'sleep_issues', 4, when=morning)
+    store.record_question(2, 'crying_and_comfort', None, when=morning)
+    assert store.top_topics(1) == [('sleep_issues', 2)]
+    assert store.flush() == 6
+    store.close()
+
+    reloaded = AnalyticsStore(db_path)
+    reloaded.load(today=date(2026, 3, 2))
+    reloaded.record_question(1, 'crying_and_comfort', 4, when=evening)
+    assert reloaded.top_topics(1) == [('sleep_issues', 2), ('crying_and_comfort', 1)]
+
+    report = reloaded.report(days=2, today=date(2026, 3, 2))
+    assert report['days'][-1] == {'day': '2026-03-02', 'questions': 4, 'active_users': 2}
+    assert dict(report['topics']) == {'sleep_issues': 2, 'crying_and_comfort': 2}
+    assert dict(report['age_buckets']) == {'3-6m': 3, 'unknown': 1}
+    print("✅ Analytics store works")
+
+def test_drain_waits_for_in_flight_generations():
+    """Test that shutdown waits for tracked generations and honours the deadline."""
+    print("🛑 Testing in-flight drain...")
+
+    async def scenario():
+        manager = LifecycleManager()
+        manager.reset()
+
+        async def generation(delay):
+            async with manager.track():
+                await asyncio.sleep(delay)
+
+        task = asyncio.create_task(generation(0.05))
+        await asyncio.sleep(0)
+        assert manager.in_flight == 1
+        assert await manager.drain(timeout=1) == 0
+        assert task.done()
+
+        slow = asyncio.create_task(generation(1))
+        await asyncio.sleep(0)
+        assert await manager.drain(timeout=0.05) == 1
+        slow.cancel()
+
+    asyncio.run(scenario())
+    print("✅ Drain respects the deadline")
+
+def test_cancelled_write_behind_finishes_its_flush():
+    """Test that cancelling the write-behind loop during a failing write keeps the snapshot for the final flush."""
+    print("⏳ Testing write-behind cancellation...")
+    db_path = os.path.join(tempfile.mkdtemp(), 'user_data.db')
+    store = UserStore(db_path, legacy_json_path=None)
+    store.load()
+    write = store._write
+    writing = threading.Event()
+
+    def busy_write(snapshot, answers=()):
+        writing.set()
+        time.sleep(0.1)
+        raise sqlite3.OperationalError("database is locked")
+    store._write = busy_write
+
+    async def scenario():
+        store.users[1] = sample_profile('Анна')
+        store.answers.intern_history(store.users[1])
+        store.mark_dirty(1)
+        task = asyncio.create_task(store.run_write_behind(0.01))
+        while not writing.is_set():
+            await asyncio.sleep(0.005)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+
+    asyncio.run(scenario())
+    assert store.dirty == {1} and store.answers.deltas
+    store._write = write
+    assert store.flush() == 1
+    assert store.connection.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 1
+    assert store.connection.execute("SELECT refcount FROM answers").fetchone()[0] == 1
+    store.close()
+    print("✅ The failed flush is retried on shutdown")
+
+if __name__ == "__main__":
+    test_flush_writes_only_dirty_profiles()
+    test_legacy_json_migration()
+    test_identical_answers_stored_once()
+    test_admin_cli_on_a_live_store()
+    test_pruned_user_saved_again_keeps_answers()
+    test_analytics_counters_survive_restart()
+    test_drain_waits_for_in_flight_generations()
+    test_cancelled_write_behind_finishes_its_flush()
@@ -0,0 +1,173 @@
+"""
+User profile store with write-behind persistence.
+
+Handlers keep working with a plain dict of profiles (``store.users``) and
+call ``mark_dirty(user_id)`` after changing one. Modified profiles are
+written to SQLite in one batch by a periodic write-behind task and once
+more on shutdown, instead of rewriting user_data.json on every message.
+Answer texts of history items live in ``store.answers`` (answer_store.py)
+and are written in the same transaction.
+
+Users deleted by ``admin_cli.py prune`` leave a row in ``pruned_users`` with
+the answer hashes their history still references. Saving such a user again
+drops the tombstone; the answers of the rest are released on the next load,
+when they are no longer in memory.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from answer_store import SCHEMA as ANSWERS_SCHEMA, AnswerStore, apply_deltas
+from lifecycle import write_behind
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    profile TEXT NOT NULL,
+    last_activity TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity);
+CREATE TABLE IF NOT EXISTS pruned_users (
+    user_id INTEGER PRIMARY KEY,
+    hashes TEXT NOT NULL
+);
+"""
+
+
+def connect(db_path):
+    """Open the SQLite store in WAL mode so readers never block the bot."""
+    connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    connection.executescript(ANSWERS_SCHEMA)
+    return connection
+
+
+class UserStore:
+    def __init__(self, db_path='user_data.db', legacy_json_path='user_data.json'):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self.users = {}
+        self.dirty = set()
+        self._connection = None
+        self._write_lock = threading.Lock()
+        self.answers = AnswerStore(lambda: self.connection, self._write_lock)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = connect(self.db_path)
+        return self._connection
+
+    def load(self):
+        """Load all profiles into memory, importing legacy user_data.json on first run."""
+        self._release_pruned()
+        self.answers.load()
+        rows = self.connection.execute("SELECT user_id, profile FROM users").fetchall()
+        self.users.clear()
+        for user_id, profile in rows:
+            self.users[user_id] = json.loads(profile)
+
+        if not rows and self.legacy_json_path and os.path.exists(self.legacy_json_path):
+            with open(self.legacy_json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            for user_id, profile in legacy.items():
+                self.users[int(user_id)] = profile
+                self.dirty.add(int(user_id))
+            self.flush()
+            logger.info(f"Imported {len(legacy)} users from {self.legacy_json_path}")
+
+        logger.info(f"Loaded user data for {len(self.users)} users")
+        return self.users
+
+    def _release_pruned(self):
+        """Release the answers of pruned users; called before loading, so none of them is in memory."""
+        with self._write_lock, self.connection:
+            rows = self.connection.execute("SELECT hashes FROM pruned_users").fetchall()
+            counts = Counter(key for hashes, in rows for key in json.loads(hashes))
+            apply_deltas(self.connection, [(key, -count, None) for key, count in counts.items()])
+            self.connection.execute("DELETE FROM pruned_users")
+        if rows:
+            logger.info(f"Released answers of {len(rows)} pruned users")
+
+    def mark_dirty(self, user_id):
+        """Record that a profile changed and must be written on the next flush."""
+        self.dirty.add(user_id)
+
+    def _take_snapshot(self):
+        """Serialize dirty profiles and answers; must run on the thread that mutates profiles."""
+        dirty, self.dirty = self.dirty, set()
+        snapshot = []
+        for user_id in dirty:
+            profile = self.users.get(user_id)
+            if profile is not None:
+                snapshot.append((user_id, json.dumps(profile, ensure_ascii=False), profile.get('last_activity')))
+        return dirty, snapshot, self.answers.take_snapshot()
+
+    def _write(self, snapshot, answers=()):
+        now = time.time()
+        with self._write_lock, self.connection:
+            self.answers.write(self.connection, answers)
+            self.connection.executemany(
+                "INSERT INTO users (user_id, profile, last_activity, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, "
+                "last_activity = excluded.last_activity, updated_at = excluded.updated_at",
+                [(user_id, profile, last_activity, now) for user_id, profile, last_activity in snapshot]
+            )
+            # A pruned user saved again: their answers were never released, so the tombstone just goes
+            self.connection.executemany(
+                "DELETE FROM pruned_users WHERE user_id = ?", [(user_id,) for user_id, _, _ in snapshot]
+            )
+
+    def _pending(self):
+        return self.dirty or self.answers.deltas
+
+    def _failed(self, dirty, answers, error):
+        self.dirty |= dirty
+        self.answers.restore(answers)
+        logger.error(f"Error saving user data: {error}")
+
+    def flush(self):
+        """Write all dirty profiles in one transaction. Returns the number written."""
+        if not self._pending():
+            return 0
+        dirty, snapshot, answers = self._take_snapshot()
+        try:
+            self._write(snapshot, answers)
+        except Exception as e:
+            self._failed(dirty, answers, e)
+            return 0
+        self.answers.committed(answers)
+        return len(snapshot)
+
+    async def flush_async(self):
+        """Like flush(), but does the disk write in a worker thread."""
+        if not self._pending():
+            return 0
+        dirty, snapshot, answers = self._take_snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot, answers)
+        except Exception as e:
+            self._failed(dirty, answers, e)
+            return 0
+        self.answers.committed(answers)
+        return len(snapshot)
+
+    async def run_write_behind(self, interval):
+        """Flush dirty profiles every `interval` seconds until cancelled."""
+        await write_behind(self.flush_async, interval, "user profiles")
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
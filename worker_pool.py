@@ -0,0 +1,203 @@
+"""
+Process pool for CPU-bound stages.
+
+The bot runs the asyncio loop and the generation threads in one process, so
+CPU-heavy stages such as book search and reranking compete with them for the
+GIL and a single core. WorkerPool runs these stages in a spawn-context
+ProcessPoolExecutor. The initializer loads models and indexes once per worker.
+Large arrays are opened with mmap so that all workers share the OS page cache
+instead of holding copies.
+
+Each stage has its own concurrency limit, so one slow stage cannot occupy every
+process. Per stage, the queue wait (stage limit plus pool queue) and the run
+time are reported in /health under worker_pool. So is each worker's memory:
+PSS counts shared mmap pages once across all processes that map them, while
+private memory is the part that grows with the number of workers
+(benchmarks/memory_report.py compares it with private copies of the index).
+"""
+
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(fn, args):
+    """Runs in the worker: (started, finished, result). The monotonic clock is shared by processes on one host."""
+    started = time.monotonic()
+    result = fn(*args)
+    return started, time.monotonic(), result
+
+
+def _ready():
+    return True
+
+
+def process_memory(pid='self'):
+    """RSS, PSS, shared and private memory of a process in MB from /proc (Linux); {} elsewhere."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if rest.strip().endswith('kB'):
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError):
+        return {}
+    return {
+        'rss_mb': round(values.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(values.get('Pss', 0) / 1024, 1),
+        'shared_mb': round((values.get('Shared_Clean', 0) + values.get('Shared_Dirty', 0)) / 1024, 1),
+        'private_mb': round((values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)) / 1024, 1)
+    }
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0}
+    ordered = sorted(values)
+    return {'p50': round(ordered[len(ordered) // 2], 1),
+            'p95': round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 1)}
+
+
+class StageStats:
+    def __init__(self, limit, window=200):
+        self.limit = limit
+        self.calls = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.queue_wait_ms = deque(maxlen=window)
+        self.run_ms = deque(maxlen=window)
+
+    def record(self, wait_ms, run_ms):
+        self.calls += 1
+        self.queue_wait_ms.append(wait_ms)
+        self.run_ms.append(run_ms)
+
+    def snapshot(self):
+        return {
+            'limit': self.limit,
+            'calls': self.calls,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'queue_wait_ms': percentiles(self.queue_wait_ms),
+            'run_ms': percentiles(self.run_ms)
+        }
+
+
+class WorkerStats:
+    def __init__(self):
+        self.workers = 0
+        self.pids = []
+        self.stages = {}
+
+    def snapshot(self):
+        return {'workers': self.workers, 'stages': {name: stage.snapshot() for name, stage in self.stages.items()},
+                'memory': {pid: process_memory(pid) for pid in self.pids}}
+
+
+worker_stats = WorkerStats()
+
+
+class WorkerPool:
+    def __init__(self, workers, stage_limits=None, initializer=None, initargs=(), executor=None, stats=worker_stats):
+        """
+        workers: worker processes
+        stage_limits: {stage: calls running at once}; stages not listed (or 0) may use every worker
+        initializer/initargs: load models and indexes once per worker process
+        executor: for tests; a spawn-context process pool by default
+        """
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.stats = stats
+        self.stats.workers = workers
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        for stage, limit in (stage_limits or {}).items():
+            self._stage(stage, limit)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: workers do not inherit the bot's threads, event loop or sockets
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'),
+                        initializer=self.initializer,
+                        initargs=self.initargs
+                    )
+        return self._executor
+
+    def _stage(self, stage, limit=0):
+        with self._lock:
+            if stage not in self._semaphores:
+                limit = min(limit or self.workers, self.workers)
+                self._semaphores[stage] = threading.BoundedSemaphore(limit)
+                self.stats.stages[stage] = StageStats(limit)
+            return self._semaphores[stage], self.stats.stages[stage]
+
+    def warm(self):
+        """Start every worker now, so the first questions do not wait for models to load."""
+        started = time.monotonic()
+        for future in [self.executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        self.stats.pids = self.pids()
+        logger.info(f"Started {self.workers} worker processes in {time.monotonic() - started:.1f}s")
+
+    def submit(self, stage, fn, *args):
+        """
+        Run fn(*args) in a worker and return a Future of the result. Waits only for a free
+        slot of the stage, so one thread can keep several calls running in the workers.
+        """
+        semaphore, stats = self._stage(stage)
+        queued_at = time.monotonic()
+        semaphore.acquire()
+        with self._lock:
+            stats.in_flight += 1
+        result = Future()
+
+        def done(future, error=None):
+            semaphore.release()
+            if error is None:
+                error = future.exception() if not future.cancelled() else CancelledError()
+            with self._lock:
+                stats.in_flight -= 1
+                if error is None:
+                    started, finished, value = future.result()
+                    stats.record((started - queued_at) * 1000, (finished - started) * 1000)
+                else:
+                    stats.failed += 1
+            if error is None:
+                result.set_result(value)
+            else:
+                result.set_exception(error)
+
+        try:
+            future = self.executor.submit(_timed, fn, args)
+        except Exception as e:
+            done(None, e)
+            return result
+        future.add_done_callback(done)
+        return result
+
+    def call(self, stage, fn, *args):
+        """Run fn(*args) in a worker and wait for the result."""
+        return self.submit(stage, fn, *args).result()
+
+    def pids(self):
+        # ProcessPoolExecutor has no public list of its processes
+        return sorted(getattr(self._executor, '_processes', None) or ())
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+            self.stats.pids = []